@@ -0,0 +1,101 @@
+"""
+Concurrency benchmark for the inventory `/reserve` endpoint.
+
+Seeds a single hot product and fires many concurrent single-unit reservations
+at it, then reports how each request ended. Run it once against a service
+started with RESERVE_STRATEGY=optimistic and once with the default `atomic`
+strategy: the optimistic run shows a large share of "Concurrent update" 409s,
+while the atomic run only reserves or reports insufficient stock.
+
+Usage:
+    python benchmarks/bench_inventory_reserve.py --base-url http://127.0.0.1:82 \\
+        --requests 2000 --concurrency 100 --stock 1500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+
+def classify(response: httpx.Response) -> str:
+    if response.status_code == 200:
+        return "reserved"
+    detail = ""
+    try:
+        detail = response.json().get("detail", "")
+    except ValueError:
+        pass
+    if response.status_code == 409 and "Concurrent update" in str(detail):
+        return "conflict"
+    if response.status_code == 409:
+        return "insufficient"
+    if response.status_code == 404:
+        return "not_found"
+    return f"http_{response.status_code}"
+
+
+async def seed(client: httpx.AsyncClient, base_url: str, product_id: str, stock: int):
+    resp = await client.post(f"{base_url}/inventory/", json={"product_id": product_id, "stock": stock})
+    resp.raise_for_status()
+
+
+async def run(base_url: str, total: int, concurrency: int, stock: int, quantity: int):
+    product_id = f"bench-{uuid.uuid4().hex[:8]}"
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=30.0, limits=limits, trust_env=False) as client:
+        await seed(client, base_url, product_id, stock)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        outcomes: Counter = Counter()
+        latencies: list[float] = []
+
+        async def reserve_one():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    resp = await client.post(
+                        f"{base_url}/inventory/reserve",
+                        json={"product_id": product_id, "quantity": quantity},
+                    )
+                    outcomes[classify(resp)] += 1
+                except httpx.HTTPError as ex:
+                    outcomes[type(ex).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(reserve_one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p99_index = max(0, int(len(latencies) * 0.99) - 1)
+    print(f"product:       {product_id} (seeded stock {stock}, qty {quantity})")
+    print(f"requests:      {total} @ concurrency {concurrency}")
+    print(f"elapsed:       {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    print(f"latency p50:   {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p99:   {latencies[p99_index] * 1000:.1f} ms")
+    for outcome, count in sorted(outcomes.items()):
+        print(f"{outcome + ':':<15}{count} ({count / total:.1%})")
+
+    expected_reserved = min(total, stock // quantity)
+    if outcomes["reserved"] != expected_reserved:
+        print(f"note: {expected_reserved - outcomes['reserved']} sellable units were not reserved")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:82")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--stock", type=int, default=1500)
+    parser.add_argument("--quantity", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.requests, args.concurrency, args.stock, args.quantity))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Throughput benchmark for sharded stock counters on a single hot product.
+
+For every shard count in --shards, seeds a fresh product with plenty of stock,
+configures its shards through the admin API (0 = unsharded single row), then
+fires concurrent single-unit reservations at it and reports reservations/s.
+With row-lock serialization removed, throughput should grow with the shard
+count until the service's DB connection pool becomes the bottleneck.
+
+Admin calls need a token: pass --admin-token, or set JWT_SECRET so one is
+minted with jwt_core_lib (same as the integration tests).
+
+Usage:
+    python benchmarks/bench_inventory_shards.py --base-url http://127.0.0.1:82 \\
+        --shards 0 2 4 8 16 --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from bench_inventory_reserve import classify
+
+
+def admin_token(explicit: str | None) -> str:
+    if explicit:
+        return explicit
+    if not os.getenv("JWT_SECRET"):
+        raise SystemExit("Pass --admin-token or set JWT_SECRET to mint one")
+    from jwt_core_lib.utils import create_access_token
+    return create_access_token({"sub": "380009999999"}, role="admin")
+
+
+async def run_once(client: httpx.AsyncClient, base_url: str, headers: dict, shard_count: int,
+                   total: int, concurrency: int) -> tuple[float, Counter]:
+    product_id = f"bench-shard-{uuid.uuid4().hex[:8]}"
+    resp = await client.post(f"{base_url}/inventory/", json={"product_id": product_id, "stock": total * 2})
+    resp.raise_for_status()
+    resp = await client.put(
+        f"{base_url}/admin/{product_id}/shards", json={"shard_count": shard_count}, headers=headers
+    )
+    resp.raise_for_status()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    outcomes: Counter = Counter()
+
+    async def reserve_one():
+        async with semaphore:
+            try:
+                resp = await client.post(
+                    f"{base_url}/inventory/reserve", json={"product_id": product_id, "quantity": 1}
+                )
+                outcomes[classify(resp)] += 1
+            except httpx.HTTPError as ex:
+                outcomes[type(ex).__name__] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(reserve_one() for _ in range(total)))
+    return time.perf_counter() - started, outcomes
+
+
+async def run(base_url: str, shard_counts: list[int], total: int, concurrency: int, token: str):
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=60.0, limits=limits, trust_env=False) as client:
+        print(f"{'shards':>6} {'elapsed':>9} {'reserved/s':>11}  outcomes")
+        for shard_count in shard_counts:
+            elapsed, outcomes = await run_once(client, base_url, headers, shard_count, total, concurrency)
+            rate = outcomes["reserved"] / elapsed
+            print(f"{shard_count:>6} {elapsed:>8.2f}s {rate:>11.0f}  {dict(outcomes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:82")
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--admin-token")
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.shards, args.requests, args.concurrency, admin_token(args.admin_token)))
+
+
+if __name__ == "__main__":
+    main()
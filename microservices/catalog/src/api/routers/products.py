@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Query
-from ...schemas.product import Product, ProductSearchResponse
+from ...schemas.product import PriceLookup, PriceLookupResponse, Product, ProductSearchResponse
 from ...core.es_client import es_client
 from ...services.cache import cache_service
 
@@ -59,6 +59,30 @@ async def search_products(
     return response
 
 
+@router.post("/prices", response_model=PriceLookupResponse)
+async def lookup_prices(lookup: PriceLookup):
+    """
+    Returns the current prices of several products with a single Elasticsearch `mget`.
+
+    Used by the order service to price a whole cart in one round trip.
+
+    Arguments:
+     lookup (PriceLookup): Up to 1000 product ids (duplicates are looked up once).
+
+    Returns:
+     PriceLookupResponse: Price per found product, and the ids that do not exist.
+    """
+    product_ids = list(dict.fromkeys(lookup.product_ids))
+    result = await es_client.mget(doc_ids=product_ids)
+
+    prices = {
+        doc["_id"]: doc["_source"]["price"]
+        for doc in result.get("docs", [])
+        if doc.get("found") and "price" in doc.get("_source", {})
+    }
+    return PriceLookupResponse(prices=prices, missing=[pid for pid in product_ids if pid not in prices])
+
+
 @router.get("/{product_id}", response_model=Product)
 async def get_product(product_id: str):
     """
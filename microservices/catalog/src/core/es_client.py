@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from typing import List
 from elasticsearch import AsyncElasticsearch, ConnectionError
 from ..core.config import settings
 
@@ -65,6 +66,7 @@ class ESClient:
                         "description": {"type": "text"},
                         "price": {"type": "float"},
                         "available": {"type": "boolean"},
+                        "low_stock": {"type": "boolean"},
                     }
                 }
             }
@@ -110,6 +112,18 @@ class ESClient:
         }
         return await self.client.search(index="products", body=body)
 
+    async def mget(self, doc_ids: List[str]):
+        """
+        Fetches several documents in one round trip.
+
+        Returns:
+         dict: The raw Elasticsearch response; `docs` holds one entry per id,
+          in request order, with `found` set for existing documents.
+        """
+        if not self.client:
+            return {"docs": []}
+        return await self.client.mget(index="products", ids=doc_ids)
+
     async def get(self, doc_id: str):
         if not self.client:
             return None
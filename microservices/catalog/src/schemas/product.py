@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import Dict, List
+from pydantic import BaseModel, Field
 
 
 class ProductBase(BaseModel):
@@ -19,3 +20,12 @@ class Product(ProductBase):
 class ProductSearchResponse(BaseModel):
     hits: list[Product]
     total: int
+
+
+class PriceLookup(BaseModel):
+    product_ids: List[str] = Field(min_length=1, max_length=1000)
+
+
+class PriceLookupResponse(BaseModel):
+    prices: Dict[str, float]
+    missing: List[str]
@@ -15,10 +15,14 @@ async def inventory_update_consumer():
     a partial document update in the Elasticsearch 'products' index. This ensures
     that search results remain consistent with the actual warehouse stock.
 
+    Inventory only publishes when a product's availability flips or it
+    crosses the low-stock threshold, so each message is a real change.
+
     Expected Message Format:
     {
         "product_id": "string",
         "available": boolean,
+        "low_stock": boolean (optional),
         "stock": integer (optional)
     }
     """
@@ -43,12 +47,15 @@ async def inventory_update_consumer():
 
                 if product_id and available is not None:
                     logging.info(f"Updating product {product_id} availability to {available}")
+                    doc = {"available": available}
+                    if data.get("low_stock") is not None:
+                        doc["low_stock"] = data["low_stock"]
                     if es_client.client:
                         try:
                             await es_client.client.update(
                                 index="products",
                                 id=product_id,
-                                body={"doc": {"available": available}}
+                                body={"doc": doc}
                             )
                         except Exception as ex:
                             logging.error(f"Failed to update ES for product {product_id}: {ex}")
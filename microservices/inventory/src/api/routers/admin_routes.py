@@ -1,41 +1,121 @@
-from fastapi import APIRouter, Depends
+import base64
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from ...core.database import get_db
+from ...core.config import settings
+from ...core.database import AsyncSessionLocal, get_db
 from ...models.inventory import InventoryItem
-from ...schemas.inventory import InventoryResponse, InventoryCreate
+from ...schemas.inventory import InventoryResponse, InventoryCreate, InventoryShardConfig
+from ...services import bulk_import, movements, outbox, stock
+from ...services.ledger import ledger
+from ...services.coalescer import coalescer
+from ...services.outbox import relay
+from ...services.contention import tracker
+from ...services.stock_cache import cache
+from ...services.holds import sweeper
+from ...services.movements import compactor
 from jwt_core_lib.dependencies import get_current_admin, TokenData
 from typing import List
 
 router = APIRouter()
 
 
+def _inventory_rows():
+    """Select over inventory items reporting the effective (shard-summed) stock."""
+    return select(
+        InventoryItem.id,
+        InventoryItem.product_id,
+        stock.effective_stock().label("stock"),
+        InventoryItem.version,
+        InventoryItem.shard_count,
+    )
+
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/", response_model=List[InventoryResponse])
 async def list_inventory(
+        response: Response,
+        cursor: str | None = None,
         skip: int = 0,
-        limit: int = 100,
+        limit: int = Query(default=100, ge=1, le=1000),
         db: AsyncSession = Depends(get_db),
         admin: TokenData = Depends(get_current_admin),
 ):
     """
     Retrieves a paginated list of all inventory items from the database.
 
-    This endpoint is restricted to administrative users. It performs an
-    asynchronous select query on the InventoryItem model, supporting
-    standard pagination via skip and limit parameters.
+    This endpoint is restricted to administrative users. Pages are read with
+    keyset pagination on `id` (`WHERE id > :last ORDER BY id LIMIT :n`), so
+    every page costs the same no matter how deep it is. When more rows may
+    follow, the opaque cursor for the next page is returned in the
+    `X-Next-Cursor` response header. `skip` (OFFSET) is still accepted for
+    the first request but gets slower the deeper it goes. For sharded items
+    the reported stock is the sum of their shards.
 
     Arguments:
-     skip (int): The number of records to skip for pagination. Defaults to 0.
-     limit (int): The maximum number of records to return. Defaults to 100.
+     response (Response): The outgoing response (next-page cursor header).
+     cursor (str | None): Cursor from a previous page's X-Next-Cursor header.
+     skip (int): The number of records to skip (ignored with a cursor). Defaults to 0.
+     limit (int): The maximum number of records to return (1-1000). Defaults to 100.
      db (AsyncSession): The asynchronous database session provided by dependency injection.
      admin (TokenData): Injected dependency that validates the requester has admin privileges.
 
     Returns:
      List[InventoryResponse]: A list of inventory objects containing product IDs and stock levels.
+
+    Raises:
+     HTTPException (400): If the cursor is malformed.
     """
-    stmt = select(InventoryItem).offset(skip).limit(limit)
-    result = await db.execute(stmt)
-    return result.scalars().all()
+    stmt = _inventory_rows().order_by(InventoryItem.id).limit(limit)
+    if cursor:
+        stmt = stmt.where(InventoryItem.id > _decode_cursor(cursor))
+    elif skip:
+        stmt = stmt.offset(skip)
+
+    rows = (await db.execute(stmt)).all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].id)
+    return rows
+
+
+@router.get("/export")
+async def export_inventory(admin: TokenData = Depends(get_current_admin)):
+    """
+    Streams every inventory item as NDJSON (one JSON object per line).
+
+    Rows are read through a server-side cursor in chunks of 1000 and written
+    out as they arrive, so exporting the whole table takes constant memory.
+    The export uses its own session, which stays open while the response is
+    streaming.
+
+    Arguments:
+     admin (TokenData): Validated admin token data.
+
+    Returns:
+     StreamingResponse: `application/x-ndjson` body with id, product_id, stock,
+      version and shard_count per line.
+    """
+    async def rows():
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(
+                _inventory_rows().order_by(InventoryItem.id).execution_options(yield_per=1000)
+            )
+            async for row in result:
+                yield json.dumps(dict(row._mapping)) + "\n"
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 
 @router.post("/correction", response_model=InventoryResponse)
@@ -50,7 +130,10 @@ async def correct_inventory(
     This function implements an 'upsert' logic:
     1. It searches for an existing inventory record by product_id.
     2. If found, it updates the stock level and increments the version number
-       to assist with optimistic locking or cache invalidation.
+       to assist with optimistic locking or cache invalidation. Sharded items
+       get the new level spread evenly across their shards.
+       With the Redis ledger the level is set there and Postgres follows
+       on the next write-behind flush.
     3. If not found, it creates and persists a new InventoryItem record.
 
     Arguments:
@@ -61,17 +144,173 @@ async def correct_inventory(
     Returns:
      InventoryResponse: The updated or newly created inventory record.
     """
-    stmt = select(InventoryItem).where(InventoryItem.product_id == item_in.product_id)
+    stmt = select(InventoryItem).where(InventoryItem.product_id == item_in.product_id).with_for_update()
     result = await db.execute(stmt)
     item = result.scalar_one_or_none()
 
-    if item:
-        item.stock = item_in.stock
+    if settings.RESERVE_STRATEGY == "redis":
+        # The ledger is authoritative; Postgres follows on the next flush
+        if not item:
+            item = InventoryItem(product_id=item_in.product_id, stock=0)
+            db.add(item)
+            await db.commit()
+        await ledger.set_level(item.product_id, item_in.stock, current=item.stock)
+    elif item:
+        previous = (await stock.read_levels(db, [item.product_id]))[item.product_id]
+        await stock.set_level(db, item, item_in.stock)
         item.version += 1  # Force version bump
+        movements.record(db, {item.product_id: item_in.stock - previous}, "correction")
+        outbox.enqueue(db, {item.product_id: item_in.stock})
     else:
         item = InventoryItem(product_id=item_in.product_id, stock=item_in.stock)
         db.add(item)
+        movements.record(db, {item.product_id: item_in.stock}, "correction")
+        outbox.enqueue(db, {item.product_id: item_in.stock})
 
     await db.commit()
+    cache.invalidate([item.product_id])
     await db.refresh(item)
-    return item
+    return InventoryResponse(
+        id=item.id,
+        product_id=item.product_id,
+        stock=item_in.stock,
+        version=item.version,
+        shard_count=item.shard_count,
+    )
+
+
+@router.post("/import")
+async def import_inventory(
+        request: Request,
+        fmt: bulk_import.ImportFormat | None = Query(None, alias="format"),
+        db: AsyncSession = Depends(get_db),
+        admin: TokenData = Depends(get_current_admin),
+):
+    """
+    Bulk-loads stock levels (e.g. a full warehouse count) from a streamed file.
+
+    The request body is a CSV file with a `product_id,stock` header or NDJSON
+    with one {"product_id", "stock"} object per line. It is parsed while it
+    streams in and copied into a staging table with COPY, then applied with a
+    single upsert, so memory stays flat regardless of file size. Existing
+    products get their stock overwritten and their version bumped, missing ones
+    are created. Availability changes are published as one batch of
+    'inventory_updates' events. The import is all-or-nothing.
+
+    Arguments:
+     request (Request): The incoming request, whose body is streamed.
+     fmt (str | None): The `format` query parameter, "csv" or "ndjson"; defaults
+      from the Content-Type header.
+     db (AsyncSession): The asynchronous database session.
+     admin (TokenData): Validated admin token data.
+
+    Returns:
+     dict: Rows read, products written and availability events recorded.
+
+    Raises:
+     HTTPException (409): If the service runs with the Redis ledger.
+     HTTPException (422): If a row is malformed (nothing is imported).
+    """
+    if settings.RESERVE_STRATEGY == "redis":
+        raise HTTPException(status_code=409, detail="Bulk import is not supported with the Redis ledger (RESERVE_STRATEGY)")
+    if fmt is None:
+        fmt = "ndjson" if "json" in request.headers.get("content-type", "") else "csv"
+
+    rows = bulk_import.parse_rows(request.stream(), fmt)
+    try:
+        summary = await bulk_import.import_levels(db, rows)
+    except bulk_import.InvalidImportRow as ex:
+        await db.rollback()
+        raise HTTPException(status_code=422, detail=str(ex))
+    await db.commit()
+    cache.clear()
+    return {"status": "imported", **summary}
+
+
+@router.put("/{product_id}/shards", response_model=InventoryResponse)
+async def configure_shards(
+        product_id: str,
+        config: InventoryShardConfig,
+        db: AsyncSession = Depends(get_db),
+        admin: TokenData = Depends(get_current_admin),
+):
+    """
+    Enables, resizes or disables sharded stock counters for a hot product.
+
+    With sharding enabled, the product's stock is spread across `shard_count`
+    sub-counter rows. Reservations pick a random shard with enough stock, so
+    concurrent orders for the same product lock different rows instead of
+    serializing on one. Setting `shard_count` to 0 folds the shards back into
+    the single inventory row. The total stock is preserved either way.
+
+    Arguments:
+     product_id (str): The product to (re)configure.
+     config (InventoryShardConfig): The desired number of shards (0 disables sharding).
+     db (AsyncSession): The asynchronous database session.
+     admin (TokenData): Validated admin token data.
+
+    Returns:
+     InventoryResponse: The item with its total stock and new shard count.
+
+    Raises:
+     HTTPException (404): If the product has no inventory record.
+    """
+    try:
+        await stock.reshard(db, product_id, config.shard_count)
+    except stock.ProductNotFound:
+        raise HTTPException(status_code=404, detail="Product not found in inventory")
+    await db.commit()
+
+    result = await db.execute(_inventory_rows().where(InventoryItem.product_id == product_id))
+    return result.one()
+
+
+@router.get("/ledger/reconcile")
+async def reconcile_ledger(admin: TokenData = Depends(get_current_admin)):
+    """
+    Checks the Redis reservation ledger against Postgres.
+
+    For every product, the ledger level minus its not-yet-flushed deltas must
+    equal the Postgres level. Any drift (for example deltas lost with a Redis
+    restart without persistence) is listed and logged.
+
+    Arguments:
+     admin (TokenData): Validated admin token data.
+
+    Returns:
+     dict: Whether the ledger is consistent and the list of drifted products.
+
+    Raises:
+     HTTPException (409): If the service is not running with the Redis ledger.
+    """
+    if settings.RESERVE_STRATEGY != "redis":
+        raise HTTPException(status_code=409, detail="Redis ledger is not enabled (RESERVE_STRATEGY)")
+    drift = await ledger.reconcile()
+    return {"consistent": not drift, "drift": drift}
+
+
+@router.get("/metrics")
+async def inventory_metrics(admin: TokenData = Depends(get_current_admin)):
+    """
+    Exposes in-process counters of the reservation machinery.
+
+    Arguments:
+     admin (TokenData): Validated admin token data.
+
+    Returns:
+     dict: Group-commit statistics (batches committed, operations, average batch size),
+      outbox relay statistics (events published, superseded events dropped),
+      optimistic-locking contention (attempts, conflicts, exhausted retry
+      budgets) in total and for the most contended products, the stock
+      lookup cache (hit ratio, evictions, lookup latency), the hold sweeper
+      (expired holds, units returned) and the movement compactor (rollups,
+      balances updated).
+    """
+    return {
+        "coalescer": {"enabled": settings.RESERVE_COALESCE_ENABLED, **coalescer.stats()},
+        "outbox": relay.stats(),
+        "contention": tracker.stats(),
+        "stock_cache": cache.stats(),
+        "holds": sweeper.stats(),
+        "movements": compactor.stats(),
+    }
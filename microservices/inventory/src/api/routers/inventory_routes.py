@@ -1,32 +1,85 @@
-import json
-import redis.asyncio as redis
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, Awaitable, Callable
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError
 from ...core.database import get_db
 from ...models.inventory import InventoryItem
-from ...schemas.inventory import InventoryCreate, InventoryResponse, InventoryRelease, InventoryReserve
+from ...schemas.inventory import (
+    InventoryCreate,
+    InventoryResponse,
+    InventoryRelease,
+    InventoryReserve,
+    InventoryBatchReserve,
+    InventoryBatchRelease,
+    InventoryConfirm,
+    InventoryLookup,
+    InventoryLookupResponse,
+    StockLevel,
+)
 from ...core.config import settings
+from ...services import idempotency, movements, outbox, reservations, stock, stock_cache
+from ...services.ledger import ledger
 
 router = APIRouter()
 
 
-# Redis client for publishing updates
-async def get_redis():
+async def _idempotent(
+        scope: str,
+        key: str | None,
+        request: BaseModel,
+        response: Response,
+        operation: Callable[[], Awaitable[Any]],
+):
     """
-    Initializes an asynchronous Redis connection for event broadcasting.
+    Runs a stock operation at most once per Idempotency-Key.
+
+    Without a key the operation simply runs. With one, a repeated request is
+    answered with the stored result (marked by an `Idempotent-Replayed: true`
+    header) without touching the database. Only successful results are
+    stored. A request refused by the operation (HTTPException or
+    `stock.StockError`, raised before anything is committed) changed nothing,
+    so its key is released and the client may retry with it. On any other
+    error or a cancellation (e.g. an expired deadline) the change may already
+    be committed, so the claim is kept until IDEMPOTENCY_LOCK_SECONDS pass and
+    a retry in the meantime is rejected instead of applied twice.
 
-    This helper provides a transient Redis client used to publish stock updates
-    to other microservices (like the search or catalog service).
+    Arguments:
+     scope (str): Name of the endpoint the key belongs to.
+     key (str | None): The client-supplied Idempotency-Key header.
+     request (BaseModel): The request payload, fingerprinted to detect key reuse.
+     response (Response): The outgoing response, used to flag replays.
+     operation (Callable[[], Awaitable[Any]]): Executes the request and returns the body.
 
     Returns:
-     redis.Redis | None: An active Redis client if REDIS_URL is configured,
-      otherwise None.
+     Any: The response body, executed or replayed.
+
+    Raises:
+     HTTPException (409): If a request with the same key is still in progress.
+     HTTPException (422): If the key was already used with a different payload.
     """
-    if not settings.REDIS_URL:
-        return None
-    return redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    if not key:
+        return await operation()
+
+    request_fingerprint = idempotency.fingerprint(request.model_dump())
+    try:
+        stored = await idempotency.store.begin(scope, key, request_fingerprint)
+    except idempotency.RequestInProgress:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    except idempotency.KeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    if stored is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return stored
+
+    try:
+        result = await operation()
+    except (HTTPException, stock.StockError):
+        await idempotency.store.abandon(scope, key)
+        raise
+    await idempotency.store.complete(scope, key, request_fingerprint, result)
+    return result
 
 
 @router.post("/", response_model=InventoryResponse)
@@ -50,9 +103,13 @@ async def create_inventory_item(item: InventoryCreate, db: AsyncSession = Depend
     """
     db_item = InventoryItem(product_id=item.product_id, stock=item.stock)
     db.add(db_item)
+    movements.record(db, {item.product_id: item.stock}, "create")
+    outbox.enqueue(db, {item.product_id: item.stock})
     try:
         await db.commit()
         await db.refresh(db_item)
+        if settings.RESERVE_STRATEGY == "redis":
+            await ledger.add_product(db_item.product_id, db_item.stock)
         return db_item
     except IntegrityError as ex:
         await db.rollback()
@@ -65,120 +122,298 @@ async def create_inventory_item(item: InventoryCreate, db: AsyncSession = Depend
 
 
 @router.post("/reserve")
-async def reserve_stock(request: InventoryReserve, db: AsyncSession = Depends(get_db)):
+async def reserve_stock(
+        request: InventoryReserve,
+        response: Response,
+        db: AsyncSession = Depends(get_db),
+        idempotency_key: str | None = Header(default=None),
+):
     """
-    Safely decrements stock for an order using Optimistic Locking.
-
-    This method ensures data integrity under high concurrency:
-    1. It fetches the current stock and version of the item.
-    2. It executes an update only if the 'version' in the database matches
-       the version retrieved in step 1.
-    3. If rowcount is 0, it means another process updated the item in the
-       interim, triggering a retry requirement.
-    4. Upon success, it publishes an 'inventory_updates' event to Redis.
+    Decrements stock for an order.
+
+    With the default `atomic` strategy the availability check and the decrement
+    run as one conditional `UPDATE ... WHERE stock >= :qty RETURNING stock`, so
+    concurrent reservations of the same product serialize on the row lock
+    instead of failing. The legacy `optimistic` strategy (read, then
+    version-checked update) is selected via RESERVE_STRATEGY; with the `redis`
+    strategy the reservation is a single Lua script against the Redis ledger
+    and Postgres is updated asynchronously by the write-behind flusher. With
+    RESERVE_COALESCE_ENABLED, reservations arriving within a few milliseconds
+    are group-committed in one transaction by the coalescer.
+    Upon success, an 'inventory_updates' event is recorded in the outbox.
+    A retried request with the same Idempotency-Key is replayed, not re-applied.
+    With a `reservation_id` the stock is held until /confirm; holds that are
+    neither confirmed nor released within `hold_seconds` are returned by the
+    expiry sweeper (Postgres strategies only).
 
     Arguments:
      request (InventoryReserve): Schema containing product_id and quantity to reserve.
+     response (Response): The outgoing response (replay header).
      db (AsyncSession): Asynchronous database session.
+     idempotency_key (str | None): Optional Idempotency-Key header.
 
     Returns:
-     dict: Status message confirming the reservation.
+     dict: Status message confirming the reservation and the remaining stock.
 
     Raises:
-     HTTPException (404): If product is missing or stock is insufficient.
-     HTTPException (409): If a concurrent update (race condition) is detected.
+     HTTPException (404): If the product is missing from inventory.
+     HTTPException (409): If stock is insufficient, (optimistic strategy only)
+      every retry lost its version check, or the same Idempotency-Key is in flight.
     """
-    # Fetch current state
-    stmt = select(InventoryItem).where(InventoryItem.product_id == request.product_id)
-    result = await db.execute(stmt)
-    item = result.scalar_one_or_none()
-
-    if not item:
-        raise HTTPException(status_code=404, detail="Product not found in inventory")
-
-    if item.stock < request.quantity:
-        raise HTTPException(status_code=404, detail="Insufficient stock")
-
-    update_stmt = (
-        update(InventoryItem)
-        .where(
-            InventoryItem.id == item.id,
-            InventoryItem.version == item.version
-        )
-        .values(
-            stock=InventoryItem.stock - request.quantity,
-            version=InventoryItem.version + 1
-        )
-        .execution_options(synchronize_session=False)  # Skip session sync for performance
-    )
-
-    result = await db.execute(update_stmt)
-    await db.commit()
-
-    # Check if update actually hapenned
-    if result.rowcount == 0:
-        raise HTTPException(
-            status_code=409,
-            detail="Concurrent update detected. Please retry."
-        )
-
-    # Publish event
-    redis_client = await get_redis()
-    if redis_client:
-        remaining_stock = item.stock - request.quantity
-        event = {
-            "product_id": request.product_id,
-            "available": remaining_stock > 0,
-            "stock": remaining_stock
-        }
-        await redis_client.publish("inventory_updates", json.dumps(event))
-        await redis_client.close()
+    async def reserve():
+        try:
+            remaining_stock = await reservations.reserve(
+                db, request.product_id, request.quantity, request.reservation_id, request.hold_seconds
+            )
+        except stock.ProductNotFound:
+            raise HTTPException(status_code=404, detail="Product not found in inventory")
+        except stock.InsufficientStock:
+            raise HTTPException(status_code=409, detail="Insufficient stock")
+        except stock.ConcurrentUpdate:
+            raise HTTPException(
+                status_code=409,
+                detail="Concurrent update detected. Please retry."
+            )
+        return {"status": "reserved", "product_id": request.product_id, "stock": remaining_stock}
 
-    return {"status": "reserved", "product_id": request.product_id}
+    return await _idempotent("reserve", idempotency_key, request, response, reserve)
 
 
 @router.post("/release")
-async def release_stock(request: InventoryRelease, db: AsyncSession = Depends(get_db)):
+async def release_stock(
+        request: InventoryRelease,
+        response: Response,
+        db: AsyncSession = Depends(get_db),
+        idempotency_key: str | None = Header(default=None),
+):
     """
     Increments stock back to the inventory (Compensating Transaction).
 
     Typically called by a Saga orchestrator when a subsequent order step
-    (like payment) fails. It adds the quantity back to the stock and
-    broadcasts the updated availability to the system.
+    (like payment) fails. It adds the quantity back to the stock with a single
+    atomic UPDATE and records the updated availability in the outbox. A
+    duplicated release with the same Idempotency-Key returns stock only once.
+    With a `reservation_id`, whatever the reservation still holds of the
+    product is returned (nothing if it was confirmed or has expired).
 
     Arguments:
      request (InventoryRelease): Schema containing product_id and quantity to return.
+     response (Response): The outgoing response (replay header).
      db (AsyncSession): Asynchronous database session.
+     idempotency_key (str | None): Optional Idempotency-Key header.
 
     Returns:
-     dict: Status message confirming the release.
+     dict: Status message confirming the release and the resulting stock.
 
     Raises:
      HTTPException (404): If the product record does not exist in inventory.
+     HTTPException (409): If a request with the same Idempotency-Key is in flight.
+    """
+    async def release():
+        try:
+            current_stock = await reservations.release(db, request.product_id, request.quantity, request.reservation_id)
+        except stock.ProductNotFound:
+            raise HTTPException(status_code=404, detail="Product not found in inventory")
+        return {"status": "released", "product_id": request.product_id, "stock": current_stock}
+
+    return await _idempotent("release", idempotency_key, request, response, release)
+
+
+@router.post("/reserve/batch")
+async def reserve_stock_batch(
+        request: InventoryBatchReserve,
+        response: Response,
+        db: AsyncSession = Depends(get_db),
+        idempotency_key: str | None = Header(default=None),
+):
     """
-    stmt = select(InventoryItem).where(InventoryItem.product_id == request.product_id)
-    result = await db.execute(stmt)
-    item = result.scalar_one_or_none()
+    Reserves every line item of an order all-or-nothing in one transaction.
 
-    if not item:
-        raise HTTPException(status_code=404, detail="Product not found in inventory")
+    Duplicate product ids are merged, all rows are locked in ascending
+    product_id order (so concurrent batches cannot deadlock), quantities are
+    validated, and only then are the decrements applied and committed. A cart
+    of N items costs one round trip and one commit instead of N. Supports
+    Idempotency-Key and reservation holds like /reserve.
+
+    Arguments:
+     request (InventoryBatchReserve): The line items (product_id, quantity) to reserve.
+     response (Response): The outgoing response (replay header).
+     db (AsyncSession): Asynchronous database session.
+     idempotency_key (str | None): Optional Idempotency-Key header.
+
+    Returns:
+     dict: Status message and the remaining stock of every reserved product.
+
+    Raises:
+     HTTPException (404): If any product is missing from inventory.
+     HTTPException (409): If any product has insufficient stock (nothing is
+      reserved), or a request with the same Idempotency-Key is in flight.
+    """
+    async def reserve_batch():
+        quantities = stock.merge_quantities(request.items)
+        try:
+            remaining = await reservations.reserve_many(db, quantities, request.reservation_id, request.hold_seconds)
+        except stock.ProductNotFound as ex:
+            raise HTTPException(status_code=404, detail=f"Products not found in inventory: {', '.join(ex.product_ids)}")
+        except stock.InsufficientStock as ex:
+            raise HTTPException(status_code=409, detail=f"Insufficient stock: {', '.join(ex.product_ids)}")
+        return {
+            "status": "reserved",
+            "items": [{"product_id": pid, "stock": level} for pid, level in remaining.items()]
+        }
+
+    return await _idempotent("reserve_batch", idempotency_key, request, response, reserve_batch)
+
+
+@router.post("/release/batch")
+async def release_stock_batch(
+        request: InventoryBatchRelease,
+        response: Response,
+        db: AsyncSession = Depends(get_db),
+        idempotency_key: str | None = Header(default=None),
+):
+    """
+    Returns stock for every line item of an order in one transaction.
+
+    The batch counterpart of /release, used by the Saga orchestrator to
+    compensate a whole batch reservation with a single call. Supports
+    Idempotency-Key and reservation holds like /release.
+
+    Arguments:
+     request (InventoryBatchRelease): The line items (product_id, quantity) to return.
+     response (Response): The outgoing response (replay header).
+     db (AsyncSession): Asynchronous database session.
+     idempotency_key (str | None): Optional Idempotency-Key header.
+
+    Returns:
+     dict: Status message and the resulting stock of every released product.
+
+    Raises:
+     HTTPException (404): If any product is missing from inventory; nothing is released.
+     HTTPException (409): If a request with the same Idempotency-Key is in flight.
+    """
+    async def release_batch():
+        quantities = stock.merge_quantities(request.items)
+        try:
+            current = await reservations.release_many(db, quantities, request.reservation_id)
+        except stock.ProductNotFound as ex:
+            raise HTTPException(status_code=404, detail=f"Products not found in inventory: {', '.join(ex.product_ids)}")
+        return {
+            "status": "released",
+            "items": [{"product_id": pid, "stock": level} for pid, level in current.items()]
+        }
 
-    # Increment stock
-    item.stock += request.quantity
-    item.version += 1
+    return await _idempotent("release_batch", idempotency_key, request, response, release_batch)
 
-    await db.commit()
 
-    # Publish event
+@router.post("/confirm")
+async def confirm_reservation(
+        request: InventoryConfirm,
+        response: Response,
+        db: AsyncSession = Depends(get_db),
+        idempotency_key: str | None = Header(default=None),
+):
+    """
+    Turns a held reservation into a final stock decrement.
+
+    Deletes the reservation's holds, so the expiry sweeper will no longer
+    return their stock. With the Redis ledger reservations are final at once
+    and this is a no-op.
+
+    Arguments:
+     request (InventoryConfirm): The reservation_id used when reserving.
+     response (Response): The outgoing response (replay header).
+     db (AsyncSession): Asynchronous database session.
+     idempotency_key (str | None): Optional Idempotency-Key header.
 
-    redis_client = await get_redis()
-    if redis_client:
-        event = {
-            "product_id": request.product_id,
-            "stock": item.stock,
-            "available": item.stock > 0
+    Returns:
+     dict: Status message and the confirmed quantity per product.
+
+    Raises:
+     HTTPException (404): If the reservation holds nothing (unknown, already
+      confirmed or released, or expired and returned to stock).
+    """
+    async def confirm():
+        confirmed = await reservations.confirm(db, request.reservation_id)
+        if confirmed is not None and not confirmed:
+            raise HTTPException(status_code=404, detail="Reservation not found or expired")
+        return {
+            "status": "confirmed",
+            "reservation_id": request.reservation_id,
+            "items": [{"product_id": pid, "quantity": qty} for pid, qty in (confirmed or {}).items()]
         }
-        await redis_client.publish("inventory_updates", json.dumps(event))
-        await redis_client.close()
 
-    return {"status": "released", "product_id": request.product_id}
+    return await _idempotent("confirm", idempotency_key, request, response, confirm)
+
+
+@router.post("/lookup", response_model=InventoryLookupResponse)
+async def lookup_stock(request: InventoryLookup, db: AsyncSession = Depends(get_db)):
+    """
+    Returns the stock of many products in one call (e.g. storefront badges).
+
+    Levels come from an in-process TTL/LRU cache; only misses are read, in a
+    single query. Writes of this service invalidate the cache, and updates
+    published by other replicas invalidate it as well.
+
+    Arguments:
+     request (InventoryLookup): Up to 1000 product ids.
+     db (AsyncSession): Asynchronous database session.
+
+    Returns:
+     InventoryLookupResponse: Stock and availability per known product, and the
+      ids without an inventory record.
+    """
+    product_ids = list(dict.fromkeys(request.product_ids))
+    levels = await stock_cache.lookup(db, product_ids)
+    return InventoryLookupResponse(
+        items=[StockLevel(product_id=pid, stock=levels[pid], available=levels[pid] > 0)
+               for pid in product_ids if pid in levels],
+        missing=[pid for pid in product_ids if pid not in levels],
+    )
+
+
+@router.get("/{product_id}", response_model=StockLevel)
+async def get_stock(product_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Returns the current stock of one product, served from the lookup cache.
+
+    Arguments:
+     product_id (str): The product to look up.
+     db (AsyncSession): Asynchronous database session.
+
+    Returns:
+     StockLevel: The product's stock and whether it is available.
+
+    Raises:
+     HTTPException (404): If the product is missing from inventory.
+    """
+    levels = await stock_cache.lookup(db, [product_id])
+    if product_id not in levels:
+        raise HTTPException(status_code=404, detail="Product not found in inventory")
+    return StockLevel(product_id=product_id, stock=levels[product_id], available=levels[product_id] > 0)
+
+
+@router.get("/{product_id}/balance")
+async def get_balance(product_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Returns a product's balance derived from its stock movement history.
+
+    The balance is the compactor's rolled-up snapshot plus the movements
+    appended since the last rollup. It matches the live stock once in-flight
+    write-behind batches (Redis ledger) have been flushed.
+
+    Arguments:
+     product_id (str): The product to look up.
+     db (AsyncSession): Asynchronous database session.
+
+    Returns:
+     dict: snapshot, pending (sum of unrolled movements) and their count, and
+      the resulting balance.
+
+    Raises:
+     HTTPException (404): If the product has no movement history.
+    """
+    balance = await movements.read_balance(db, product_id)
+    if balance is None:
+        raise HTTPException(status_code=404, detail="Product has no stock movements")
+    return balance
@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 
@@ -7,6 +8,46 @@ class Settings(BaseSettings):
     REDIS_URL: str
     ELASTICSEARCH_URL: str
 
+    # Reservation path: single conditional UPDATE ("atomic"), read + version check ("optimistic"),
+    # or Redis Lua ledger with write-behind to Postgres ("redis")
+    RESERVE_STRATEGY: Literal["atomic", "optimistic", "redis"] = "atomic"
+    # Lost version checks of the optimistic strategy are retried with jittered exponential backoff
+    OPTIMISTIC_MAX_RETRIES: int = 5
+    OPTIMISTIC_BACKOFF_BASE_MS: float = 2.0
+    OPTIMISTIC_BACKOFF_CAP_MS: float = 50.0
+    LEDGER_FLUSH_INTERVAL_MS: int = 5
+    LEDGER_RECONCILE_INTERVAL_SECONDS: int = 300
+
+    # Group commit: coalesce single /reserve and /release calls per window (Postgres strategies only)
+    RESERVE_COALESCE_ENABLED: bool = False
+    RESERVE_COALESCE_WINDOW_MS: float = 2.0
+    RESERVE_COALESCE_MAX_BATCH: int = 64
+
+    # Transactional outbox relay for 'inventory_updates' events
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_POLL_INTERVAL_MS: int = 50
+    # Events are only recorded when a product becomes (un)available or crosses LOW_STOCK_THRESHOLD;
+    # a product is published at most once per debounce window (its latest state wins)
+    LOW_STOCK_THRESHOLD: int = 0
+    OUTBOX_DEBOUNCE_MS: int = 250
+
+    # Idempotency-Key support on reserve/release: results kept in Redis for the TTL,
+    # concurrent duplicates are rejected while the first request holds the lock
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_LOCK_SECONDS: int = 30
+
+    # In-process cache behind GET /inventory/{product_id} and POST /inventory/lookup
+    STOCK_CACHE_TTL_SECONDS: float = 2.0
+    STOCK_CACHE_MAX_ENTRIES: int = 100_000
+
+    # Reservation holds (reserve with a reservation_id): lifetime and expiry sweeper
+    HOLD_DEFAULT_SECONDS: int = 900
+    HOLD_SWEEP_INTERVAL_SECONDS: float = 1.0
+    HOLD_SWEEP_BATCH_SIZE: int = 500
+
+    # Append-only stock_movements history, rolled up into stock_balances by a background compactor
+    MOVEMENTS_ROLLUP_INTERVAL_SECONDS: float = 5.0
+
     class Config:
         env_file = ".env"
 
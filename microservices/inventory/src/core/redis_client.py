@@ -0,0 +1,21 @@
+import redis.asyncio as redis
+from ..core.config import settings
+
+
+class RedisClient:
+    """Process-wide Redis connection pool shared by routes and background tasks."""
+
+    def __init__(self):
+        self.redis_url = settings.REDIS_URL
+        self.client: redis.Redis | None = None
+
+    async def connect(self):
+        if self.redis_url:
+            self.client = redis.from_url(self.redis_url, encoding="utf-8", decode_responses=True)
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
+
+
+redis_client = RedisClient()
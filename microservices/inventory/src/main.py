@@ -1,8 +1,17 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
+from sqlalchemy import text
 from .core.config import settings
 from .api.routers import inventory_routes
 from .core.database import engine, Base
+from .core.redis_client import redis_client
+from .services.ledger import ledger
+from .services.coalescer import coalescer
+from .services.outbox import relay
+from .services.stock_cache import cache
+from .services.holds import sweeper
+from .services.movements import compactor
+from http_client_lib import DeadlineMiddleware
 
 
 @asynccontextmanager
@@ -10,10 +19,41 @@ async def lifespan(app: FastAPI):
     # Create tables on startup
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips existing tables, so add columns introduced since then
+        await conn.execute(text(
+            "ALTER TABLE inventory_items ADD COLUMN IF NOT EXISTS shard_count integer NOT NULL DEFAULT 0"
+        ))
+    await redis_client.connect()
+
+    # Redis ledger: warm-load stock and start the write-behind flusher
+    if settings.RESERVE_STRATEGY == "redis":
+        await ledger.start()
+
+    # Publish committed stock changes from the outbox
+    await relay.start()
+    # Invalidate cached stock levels on other replicas' updates
+    await cache.start()
+    # Return the stock of reservation holds that were never confirmed
+    if settings.RESERVE_STRATEGY != "redis":
+        await sweeper.start()
+    # Roll the stock movement history up into balances
+    await compactor.start()
+
     yield
 
+    await compactor.stop()
+    await sweeper.stop()
+    await coalescer.close()
+    if settings.RESERVE_STRATEGY == "redis":
+        await ledger.stop()
+    await relay.stop()
+    await cache.stop()
+    await redis_client.close()
+
 
 app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
+# Stop working on requests whose caller (X-Request-Deadline) gave up
+app.add_middleware(DeadlineMiddleware)
 
 app.include_router(inventory_routes.router, prefix="/inventory", tags=["Inventory"])
 
@@ -1,3 +1,6 @@
+from datetime import datetime
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, UniqueConstraint, func, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 from ..core.database import Base
 
@@ -9,3 +12,113 @@ class InventoryItem(Base):
     product_id: Mapped[str] = mapped_column(unique=True, index=True, nullable=False)
     stock: Mapped[int] = mapped_column(default=0, nullable=False)
     version: Mapped[int] = mapped_column(default=1, nullable=False)
+    # 0 = stock lives in `stock`; N > 0 = stock is spread across N InventoryShard rows
+    shard_count: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+
+
+class InventoryShard(Base):
+    """
+    Sub-counter of a hot product's stock.
+
+    Spreading one product's stock over several rows lets concurrent reservations
+    lock different rows instead of serializing on a single inventory_items row.
+    """
+    __tablename__ = "inventory_shards"
+    __table_args__ = (UniqueConstraint("product_id", "shard_no"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    product_id: Mapped[str] = mapped_column(
+        ForeignKey("inventory_items.product_id", ondelete="CASCADE"), nullable=False
+    )
+    shard_no: Mapped[int] = mapped_column(nullable=False)
+    stock: Mapped[int] = mapped_column(default=0, nullable=False)
+
+
+class LedgerFlush(Base):
+    """
+    Write-behind batches of the Redis ledger already applied to Postgres.
+
+    Recorded in the same transaction as the stock deltas, so a batch replayed
+    after a crash (between commit and clearing it in Redis) is applied only once.
+    Later flushes delete records older than `ledger.FLUSH_RECORD_RETENTION`.
+    """
+    __tablename__ = "inventory_ledger_flushes"
+
+    batch_id: Mapped[str] = mapped_column(primary_key=True)
+    applied_at: Mapped[datetime] = mapped_column(server_default=func.now(), index=True, nullable=False)
+
+
+class OutboxEvent(Base):
+    """
+    Event waiting to be published to Redis (transactional outbox).
+
+    Written in the same transaction as the stock change it describes, then
+    published and deleted by the background relay.
+    """
+    __tablename__ = "inventory_outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    channel: Mapped[str] = mapped_column(nullable=False)
+    product_id: Mapped[str] = mapped_column(nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now(), nullable=False)
+
+
+class ReservationHold(Base):
+    """
+    Stock held for a reservation until it is confirmed, released or expires.
+
+    The held quantity is already subtracted from the product's stock. Confirming
+    deletes the hold (the decrement becomes final); releasing or expiring it
+    deletes the hold and returns the quantity.
+    """
+    __tablename__ = "inventory_holds"
+    __table_args__ = (UniqueConstraint("reservation_id", "product_id"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    reservation_id: Mapped[str] = mapped_column(nullable=False)
+    product_id: Mapped[str] = mapped_column(nullable=False)
+    quantity: Mapped[int] = mapped_column(nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
+
+
+class StockMovement(Base):
+    """
+    Append-only history of stock changes (one row per product per change).
+
+    Rows are only ever inserted, never updated. `xid` is the id of the writing
+    transaction; the compactor uses it to roll up exactly the movements of
+    finished transactions into `StockBalance`.
+    """
+    __tablename__ = "stock_movements"
+    __table_args__ = (Index("ix_stock_movements_product_xid", "product_id", "xid"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    product_id: Mapped[str] = mapped_column(nullable=False)
+    delta: Mapped[int] = mapped_column(nullable=False)
+    reason: Mapped[str] = mapped_column(nullable=False)
+    reference: Mapped[str | None] = mapped_column(nullable=True)
+    xid: Mapped[int] = mapped_column(
+        BigInteger, server_default=text("pg_current_xact_id()::text::bigint"), index=True, nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now(), nullable=False)
+
+
+class StockBalance(Base):
+    """Per-product sum of all rolled-up movements (materialized by the compactor)."""
+    __tablename__ = "stock_balances"
+
+    product_id: Mapped[str] = mapped_column(primary_key=True)
+    balance: Mapped[int] = mapped_column(nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class StockRollupState(Base):
+    """
+    Single-row rollup watermark: movements of transactions with xid below
+    `horizon` are included in the balances.
+    """
+    __tablename__ = "stock_rollup_state"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    horizon: Mapped[int] = mapped_column(BigInteger, nullable=False)
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import List, Optional
+from pydantic import BaseModel, Field
 
 
 class InventoryBase(BaseModel):
@@ -10,19 +11,62 @@ class InventoryCreate(InventoryBase):
     pass
 
 
-class InventoryReserve(BaseModel):
+class InventoryLine(BaseModel):
     product_id: str
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 
-class InventoryRelease(BaseModel):
+class InventoryHold(BaseModel):
+    reservation_id: Optional[str] = Field(
+        None, min_length=1, description="Hold the stock under this id until confirmed, released or expired"
+    )
+    hold_seconds: Optional[int] = Field(None, gt=0, description="Hold lifetime (defaults to HOLD_DEFAULT_SECONDS)")
+
+
+class InventoryReserve(InventoryLine, InventoryHold):
+    pass
+
+
+class InventoryRelease(InventoryLine):
+    reservation_id: Optional[str] = Field(None, min_length=1, description="Release what this reservation holds")
+
+
+class InventoryBatchReserve(InventoryHold):
+    items: List[InventoryLine] = Field(..., min_length=1)
+
+
+class InventoryBatchRelease(BaseModel):
+    items: List[InventoryLine] = Field(..., min_length=1)
+    reservation_id: Optional[str] = Field(None, min_length=1, description="Release what this reservation holds")
+
+
+class InventoryConfirm(BaseModel):
+    reservation_id: str = Field(..., min_length=1)
+
+
+class InventoryLookup(BaseModel):
+    product_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+
+class StockLevel(BaseModel):
     product_id: str
-    quantity: int
+    stock: int
+    available: bool
+
+
+class InventoryLookupResponse(BaseModel):
+    items: List[StockLevel]
+    missing: List[str]
+
+
+class InventoryShardConfig(BaseModel):
+    shard_count: int = Field(..., ge=0, le=256, description="0 disables sharding")
 
 
 class InventoryResponse(InventoryBase):
     id: int
     version: int
+    shard_count: int = 0
 
     class Config:
         from_attributes = True
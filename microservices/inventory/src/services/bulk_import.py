@@ -0,0 +1,195 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterable, AsyncIterator, Literal, Tuple
+from sqlalchemy import BigInteger, Column, Integer, MetaData, String, Table, case, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.schema import CreateTable
+from ..models.inventory import InventoryItem, InventoryShard, OutboxEvent, StockMovement
+from . import outbox
+from .stock import effective_stock
+
+ImportFormat = Literal["csv", "ndjson"]
+
+# Largest value the Integer `stock` columns hold (Postgres int4)
+MAX_STOCK = 2**31 - 1
+
+# Session-local staging table, dropped when the import transaction ends.
+# Kept out of Base.metadata so create_all never creates it.
+staging = Table(
+    "inventory_import_staging",
+    MetaData(),
+    Column("line", BigInteger, nullable=False),
+    Column("product_id", String, nullable=False),
+    Column("stock", Integer, nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+class InvalidImportRow(ValueError):
+    """A row of the import file could not be parsed; the whole import is rolled back."""
+
+    def __init__(self, line: int, reason: str):
+        super().__init__(f"Line {line}: {reason}")
+        self.line = line
+
+
+async def _lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Splits a streamed UTF-8 body into numbered lines without buffering more than one chunk."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            number += 1
+            yield number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+
+def _row(line: int, product_id, level) -> Tuple[int, str, int]:
+    if not isinstance(product_id, str) or not product_id.strip():
+        raise InvalidImportRow(line, "product_id is missing")
+    try:
+        level = int(level)
+    except (TypeError, ValueError):
+        raise InvalidImportRow(line, f"stock {level!r} is not an integer")
+    if level < 0:
+        raise InvalidImportRow(line, "stock must not be negative")
+    if level > MAX_STOCK:
+        raise InvalidImportRow(line, f"stock must not exceed {MAX_STOCK}")
+    return line, product_id.strip(), level
+
+
+async def parse_rows(chunks: AsyncIterable[bytes], fmt: ImportFormat) -> AsyncIterator[Tuple[int, str, int]]:
+    """
+    Parses a streamed import body into (line, product_id, stock) records.
+
+    CSV needs a header naming the `product_id` and `stock` columns; NDJSON
+    has one {"product_id": ..., "stock": ...} object per line. Blank lines
+    are skipped.
+
+    Raises:
+     InvalidImportRow: On the first malformed row, e.g. a stock outside 0..MAX_STOCK.
+    """
+    columns = None
+    async for number, line in _lines(chunks):
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise InvalidImportRow(number, "not a JSON object")
+            if not isinstance(record, dict):
+                raise InvalidImportRow(number, "not a JSON object")
+            yield _row(number, record.get("product_id"), record.get("stock"))
+            continue
+
+        values = next(csv.reader([line]))
+        if columns is None:
+            columns = [value.strip() for value in values]
+            if "product_id" not in columns or "stock" not in columns:
+                raise InvalidImportRow(number, "CSV header must contain product_id and stock")
+            continue
+        record = dict(zip(columns, values))
+        yield _row(number, record.get("product_id"), record.get("stock"))
+
+
+async def import_levels(db: AsyncSession, rows: AsyncIterable[Tuple[int, str, int]]) -> dict:
+    """
+    Sets the stock of many products in one transaction, in constant memory.
+
+    Rows are streamed into a temporary staging table with COPY. The last row
+    per product wins. Then four set-based statements run:
+    1. One outbox event per product that is new or whose availability band
+       changes (see `outbox.stock_band`), so subscribers get a single batch.
+    2. One stock movement per product whose level changes.
+    3. `INSERT ... ON CONFLICT DO UPDATE` creates missing items and overwrites
+       the stock of existing ones, bumping their version.
+    4. Sharded products get the new level spread evenly over their shards.
+    The caller commits (or rolls back on error; nothing is applied then).
+
+    Arguments:
+     db (AsyncSession): Asynchronous database session.
+     rows (AsyncIterable[Tuple[int, str, int]]): (line, product_id, stock) records.
+
+    Returns:
+     dict: Number of rows read, products written and events recorded.
+
+    Raises:
+     InvalidImportRow: If a row cannot be parsed.
+    """
+    await db.execute(CreateTable(staging))
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    status = await raw.driver_connection.copy_records_to_table(
+        staging.name, records=rows, columns=[c.name for c in staging.columns]
+    )
+    row_count = int(status.split()[-1])
+
+    latest = (
+        select(staging.c.product_id, staging.c.stock)
+        .distinct(staging.c.product_id)
+        .order_by(staging.c.product_id, staging.c.line.desc())
+        .subquery("latest")
+    )
+
+    previous = effective_stock()
+    events = await db.execute(
+        insert(OutboxEvent).from_select(
+            ["channel", "product_id", "payload"],
+            select(
+                literal(outbox.INVENTORY_UPDATES),
+                latest.c.product_id,
+                outbox.payload_expression(latest.c.product_id, latest.c.stock),
+            )
+            .select_from(latest.outerjoin(InventoryItem, InventoryItem.product_id == latest.c.product_id))
+            .where(
+                (InventoryItem.id.is_(None))
+                | (outbox.band_expression(previous) != outbox.band_expression(latest.c.stock))
+            ),
+        )
+    )
+
+    change = latest.c.stock - func.coalesce(previous, 0)
+    await db.execute(
+        insert(StockMovement).from_select(
+            ["product_id", "delta", "reason"],
+            select(latest.c.product_id, change, literal("import"))
+            .select_from(latest.outerjoin(InventoryItem, InventoryItem.product_id == latest.c.product_id))
+            .where(change != 0),
+        )
+    )
+
+    upsert = insert(InventoryItem).from_select(["product_id", "stock"], select(latest.c.product_id, latest.c.stock))
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[InventoryItem.product_id],
+        set_={
+            # Sharded items keep their level in the shards (step 4)
+            "stock": case((InventoryItem.shard_count > 0, InventoryItem.stock), else_=upsert.excluded.stock),
+            "version": InventoryItem.version + 1,
+        },
+    )
+    products = await db.execute(upsert)
+
+    await db.execute(
+        update(InventoryShard)
+        .where(
+            InventoryShard.product_id == latest.c.product_id,
+            InventoryItem.product_id == latest.c.product_id,
+            InventoryItem.shard_count > 0,
+        )
+        .values(
+            stock=latest.c.stock // InventoryItem.shard_count
+            + case((InventoryShard.shard_no < latest.c.stock % InventoryItem.shard_count, 1), else_=0)
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    return {"rows": row_count, "products": products.rowcount, "events": events.rowcount}
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from . import movements, outbox, stock
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Operation:
+    product_id: str
+    delta: int  # negative = reserve, positive = release
+    future: asyncio.Future = field(repr=False)
+
+
+def allocate(level: int, deltas: List[int]) -> Tuple[List[int | None], int]:
+    """
+    Replays a product's queued operations in arrival order against its stock level.
+
+    Releases always succeed; a reservation succeeds only if the running level
+    still covers it, exactly as if the requests had committed one by one.
+
+    Arguments:
+     level (int): The locked stock level before the batch.
+     deltas (List[int]): Requested changes (negative = reserve, positive = release).
+
+    Returns:
+     Tuple[List[int | None], int]: The level each caller observes after its own
+      operation (None for a rejected reservation), and the final level.
+    """
+    outcomes: List[int | None] = []
+    for delta in deltas:
+        if level + delta < 0:
+            outcomes.append(None)
+            continue
+        level += delta
+        outcomes.append(level)
+    return outcomes, level
+
+
+class ReservationCoalescer:
+    """
+    Group commit for single-item /reserve and /release requests.
+
+    Requests arriving within a short window (RESERVE_COALESCE_WINDOW_MS) or
+    until RESERVE_COALESCE_MAX_BATCH requests have queued are applied together:
+    one transaction locks the touched rows in product_id order, replays each
+    product's operations in arrival order (see `allocate`), writes one UPDATE
+    per product and commits once. Every caller then gets its own result.
+    Under load this trades up to one window of added latency for one commit
+    per batch instead of one per request.
+    """
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[_Operation] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._inflight: set[asyncio.Task] = set()
+        self.batches = 0
+        self.operations = 0
+
+    async def reserve(self, product_id: str, quantity: int) -> int:
+        """
+        Queues a reservation and waits for its batch to commit.
+
+        Returns:
+         int: The remaining stock after this reservation.
+
+        Raises:
+         stock.ProductNotFound: If the product has no inventory record.
+         stock.InsufficientStock: If the stock left for this caller is too low.
+        """
+        return await self._submit(product_id, -quantity)
+
+    async def release(self, product_id: str, quantity: int) -> int:
+        """
+        Queues a release and waits for its batch to commit.
+
+        Raises:
+         stock.ProductNotFound: If the product has no inventory record.
+        """
+        return await self._submit(product_id, quantity)
+
+    async def _submit(self, product_id: str, delta: int) -> int:
+        loop = asyncio.get_running_loop()
+        operation = _Operation(product_id, delta, loop.create_future())
+        self._pending.append(operation)
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await operation.future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._apply(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _apply(self, batch: List[_Operation]):
+        by_product: Dict[str, List[_Operation]] = {}
+        for operation in batch:
+            by_product.setdefault(operation.product_id, []).append(operation)
+
+        results: Dict[int, int | Exception] = {}
+        try:
+            async with AsyncSessionLocal() as db:
+                items, shards, levels = await stock.lock_levels(db, by_product, strict=False)
+
+                deltas = {}
+                for product_id, operations in by_product.items():
+                    if product_id not in levels:
+                        for operation in operations:
+                            results[id(operation)] = stock.ProductNotFound(product_id)
+                        continue
+                    outcomes, final = allocate(levels[product_id], [op.delta for op in operations])
+                    for operation, outcome in zip(operations, outcomes):
+                        results[id(operation)] = (
+                            outcome if outcome is not None else stock.InsufficientStock(product_id)
+                        )
+                    if final != levels[product_id]:
+                        deltas[product_id] = final - levels[product_id]
+
+                changed = stock.apply_locked(items, shards, levels, deltas)
+                movements.record(db, deltas, "group_commit")
+                outbox.enqueue(db, changed, deltas)
+                await db.commit()
+        except Exception as ex:
+            logger.error(f"Coalesced batch of {len(batch)} operations failed: {ex}")
+            results = {id(operation): ex for operation in batch}
+
+        self.batches += 1
+        self.operations += len(batch)
+        for operation in batch:
+            if operation.future.done():
+                continue
+            outcome = results[id(operation)]
+            if isinstance(outcome, Exception):
+                operation.future.set_exception(outcome)
+            else:
+                operation.future.set_result(outcome)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "operations": self.operations,
+            "avg_batch_size": round(self.operations / self.batches, 2) if self.batches else 0.0,
+        }
+
+    async def close(self):
+        """Flushes queued operations and waits for in-flight batches to commit."""
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+
+coalescer = ReservationCoalescer(settings.RESERVE_COALESCE_WINDOW_MS, settings.RESERVE_COALESCE_MAX_BATCH)
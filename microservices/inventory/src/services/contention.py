@@ -0,0 +1,92 @@
+import asyncio
+import random
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Dict, TypeVar
+from ..core.config import settings
+from .stock import ConcurrentUpdate
+
+T = TypeVar("T")
+
+
+@dataclass
+class ProductContention:
+    attempts: int = 0
+    conflicts: int = 0
+    exhausted: int = 0
+
+
+def backoff_delay(retry: int) -> float:
+    """
+    Full-jitter exponential backoff before the given retry (1-based), in seconds.
+
+    The delay is drawn uniformly from [0, min(cap, base * 2 ** (retry - 1))], which
+    spreads competing writers out instead of letting them collide again in lockstep.
+    """
+    ceiling = min(settings.OPTIMISTIC_BACKOFF_CAP_MS, settings.OPTIMISTIC_BACKOFF_BASE_MS * 2 ** (retry - 1))
+    return random.uniform(0, ceiling) / 1000
+
+
+class ContentionTracker:
+    """
+    Retries version-check conflicts of the optimistic strategy inside the service.
+
+    A lost version check is retried up to OPTIMISTIC_MAX_RETRIES times with
+    jittered exponential backoff; only when the budget is spent does
+    ConcurrentUpdate reach the caller. Attempts, conflicts and exhausted
+    budgets are counted per product so hot products can be spotted (and
+    sharded) from the admin metrics.
+    """
+
+    def __init__(self):
+        self.products: Dict[str, ProductContention] = {}
+
+    async def run(self, product_id: str, attempt: Callable[[], Awaitable[T]],
+                  on_conflict: Callable[[], Awaitable[None]]) -> T:
+        """
+        Runs `attempt` until it wins its version check or the retry budget is spent.
+
+        Arguments:
+         product_id (str): The contended product (statistics key).
+         attempt (Callable[[], Awaitable[T]]): One optimistic read-modify-write.
+         on_conflict (Callable[[], Awaitable[None]]): Resets state after a lost
+          check (typically a session rollback).
+
+        Returns:
+         T: The result of the successful attempt.
+
+        Raises:
+         ConcurrentUpdate: If every attempt lost its version check.
+        """
+        counters = self.products.setdefault(product_id, ProductContention())
+        retry = 0
+        while True:
+            counters.attempts += 1
+            try:
+                return await attempt()
+            except ConcurrentUpdate:
+                counters.conflicts += 1
+                await on_conflict()
+                if retry >= settings.OPTIMISTIC_MAX_RETRIES:
+                    counters.exhausted += 1
+                    raise
+                retry += 1
+                await asyncio.sleep(backoff_delay(retry))
+
+    def stats(self, top: int = 20) -> dict:
+        """Totals plus the `top` products with the most conflicts and their conflict rates."""
+        hottest = sorted(self.products.items(), key=lambda entry: entry[1].conflicts, reverse=True)[:top]
+        attempts = sum(c.attempts for c in self.products.values())
+        conflicts = sum(c.conflicts for c in self.products.values())
+        return {
+            "attempts": attempts,
+            "conflicts": conflicts,
+            "conflict_rate": round(conflicts / attempts, 4) if attempts else 0.0,
+            "exhausted": sum(c.exhausted for c in self.products.values()),
+            "products": {
+                pid: {**asdict(c), "conflict_rate": round(c.conflicts / c.attempts, 4)}
+                for pid, c in hottest if c.conflicts
+            },
+        }
+
+
+tracker = ContentionTracker()
@@ -0,0 +1,98 @@
+import hashlib
+import json
+from typing import Any
+from ..core.config import settings
+from ..core.redis_client import redis_client
+
+KEY_PREFIX = "inventory:idempotency"
+
+
+class IdempotencyError(Exception):
+    """Base class for requests that cannot be executed under their Idempotency-Key."""
+
+
+class RequestInProgress(IdempotencyError):
+    """Another request with the same key is still being processed."""
+
+
+class KeyReused(IdempotencyError):
+    """The key was already used for a request with a different payload."""
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a request payload, used to detect reuse of a key for another request."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Remembers the result of requests carrying an Idempotency-Key in Redis.
+
+    `begin` claims the key with SET NX and a short lock TTL
+    (IDEMPOTENCY_LOCK_SECONDS) so a concurrent duplicate is rejected instead of
+    executed twice. `complete` replaces the claim with the result, kept for
+    IDEMPOTENCY_TTL_SECONDS; a repeated request is then answered from Redis
+    without touching Postgres. `abandon` drops the claim of a request that
+    failed without side effects, so it can be retried with the same key.
+    Without a Redis connection keys are ignored.
+    """
+
+    @staticmethod
+    def _name(scope: str, key: str) -> str:
+        return f"{KEY_PREFIX}:{scope}:{key}"
+
+    async def begin(self, scope: str, key: str, request_fingerprint: str) -> Any | None:
+        """
+        Claims a key or returns the stored result of its earlier request.
+
+        Arguments:
+         scope (str): The operation the key belongs to (e.g. "reserve").
+         key (str): The client-supplied Idempotency-Key.
+         request_fingerprint (str): `fingerprint` of the request payload.
+
+        Returns:
+         Any | None: The stored response body to replay, or None if the caller
+          holds the claim and must execute the request.
+
+        Raises:
+         RequestInProgress: If the first request with this key has not finished.
+         KeyReused: If the key was used with a different payload.
+        """
+        client = redis_client.client
+        if client is None:
+            return None
+
+        name = self._name(scope, key)
+        claim = json.dumps({"fingerprint": request_fingerprint, "done": False})
+        while True:
+            if await client.set(name, claim, nx=True, ex=settings.IDEMPOTENCY_LOCK_SECONDS):
+                return None
+            stored = await client.get(name)
+            if stored is not None:
+                break
+            # The previous claim expired between SET and GET; try to claim again
+
+        record = json.loads(stored)
+        if record["fingerprint"] != request_fingerprint:
+            raise KeyReused(key)
+        if not record["done"]:
+            raise RequestInProgress(key)
+        return record["body"]
+
+    async def complete(self, scope: str, key: str, request_fingerprint: str, body: Any):
+        """Stores the response body of a successful request for IDEMPOTENCY_TTL_SECONDS."""
+        client = redis_client.client
+        if client is None:
+            return
+        record = json.dumps({"fingerprint": request_fingerprint, "done": True, "body": body})
+        await client.set(self._name(scope, key), record, ex=settings.IDEMPOTENCY_TTL_SECONDS)
+
+    async def abandon(self, scope: str, key: str):
+        """Releases the claim of a request that failed, allowing a retry with the same key."""
+        client = redis_client.client
+        if client is None:
+            return
+        await client.delete(self._name(scope, key))
+
+
+store = IdempotencyStore()
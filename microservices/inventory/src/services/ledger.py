@@ -0,0 +1,374 @@
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+from typing import Dict, List
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.redis_client import redis_client
+from ..models.inventory import InventoryItem, LedgerFlush
+from . import movements, outbox, stock
+
+logger = logging.getLogger(__name__)
+
+STOCK_KEY = "inventory:ledger:stock"
+DELTAS_KEY = "inventory:ledger:deltas"
+FLUSHING_KEY = "inventory:ledger:flushing"
+FLUSHING_ID_KEY = "inventory:ledger:flushing:id"
+SWAPS_KEY = "inventory:ledger:swaps"
+
+# Reconciliation re-reads when flushes keep swapping batches under it
+RECONCILE_ATTEMPTS = 5
+
+# Ids of applied batches are kept this long, so a replica that read a batch
+# just before it was cleared still finds it applied
+FLUSH_RECORD_RETENTION = timedelta(minutes=5)
+
+# KEYS: stock, deltas | ARGV: product_id, qty
+# Returns {1, remaining} on success, {0, stock} if insufficient, {-1, 0} if unknown product.
+RESERVE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if not current then return {-1, 0} end
+local qty = tonumber(ARGV[2])
+if tonumber(current) < qty then return {0, tonumber(current)} end
+redis.call('HINCRBY', KEYS[2], ARGV[1], -qty)
+return {1, redis.call('HINCRBY', KEYS[1], ARGV[1], -qty)}
+"""
+
+# KEYS: stock, deltas | ARGV: product_id, qty
+RELEASE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then return {-1, 0} end
+local qty = tonumber(ARGV[2])
+redis.call('HINCRBY', KEYS[2], ARGV[1], qty)
+return {1, redis.call('HINCRBY', KEYS[1], ARGV[1], qty)}
+"""
+
+# KEYS: stock, deltas | ARGV: pid1, qty1, pid2, qty2, ... (positive qty = reserve, negative = release)
+# All-or-nothing: returns {-1, pid...} for unknown products, {0, pid...} for short ones,
+# otherwise {1, pid1, level1, pid2, level2, ...}.
+APPLY_MANY_SCRIPT = """
+local missing, short = {-1}, {0}
+for i = 1, #ARGV, 2 do
+  local current = redis.call('HGET', KEYS[1], ARGV[i])
+  if not current then
+    table.insert(missing, ARGV[i])
+  elseif tonumber(current) < tonumber(ARGV[i + 1]) then
+    table.insert(short, ARGV[i])
+  end
+end
+if #missing > 1 then return missing end
+if #short > 1 then return short end
+local result = {1}
+for i = 1, #ARGV, 2 do
+  local qty = tonumber(ARGV[i + 1])
+  redis.call('HINCRBY', KEYS[2], ARGV[i], -qty)
+  table.insert(result, ARGV[i])
+  table.insert(result, redis.call('HINCRBY', KEYS[1], ARGV[i], -qty))
+end
+return result
+"""
+
+# KEYS: stock, deltas | ARGV: product_id, level, fallback current level
+# Overwrites the level and books the difference as a delta, so Postgres follows on the next flush.
+SET_LEVEL_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or ARGV[3])
+local delta = tonumber(ARGV[2]) - current
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if delta ~= 0 then redis.call('HINCRBY', KEYS[2], ARGV[1], delta) end
+return delta
+"""
+
+# KEYS: deltas, flushing, flushing id, swaps | ARGV: new batch id
+# Returns {batch id, pid1, delta1, ...} for the batch to flush: a leftover one from a crashed
+# flush first, otherwise the pending deltas renamed under the fresh id (counted in swaps);
+# false if idle.
+SWAP_SCRIPT = """
+local batch_id = redis.call('GET', KEYS[3])
+if not batch_id then
+  if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+  batch_id = ARGV[1]
+  redis.call('RENAME', KEYS[1], KEYS[2])
+  redis.call('SET', KEYS[3], batch_id)
+  redis.call('INCR', KEYS[4])
+end
+local result = redis.call('HGETALL', KEYS[2])
+table.insert(result, 1, batch_id)
+return result
+"""
+
+# KEYS: flushing, flushing id | ARGV: batch id
+# Clears the swapped-out batch, unless another replica already replaced it.
+CLEAR_SCRIPT = """
+if redis.call('GET', KEYS[2]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1], KEYS[2])
+end
+return 0
+"""
+
+
+class RedisStockLedger:
+    """
+    Redis-resident stock counters for the `redis` reservation strategy.
+
+    Reservations and releases are single Lua scripts against a stock hash, so
+    they finish in one Redis round trip with no Postgres commit on the request
+    path. Each script also books its change in a deltas hash. A write-behind
+    flusher periodically swaps that hash out and applies the net delta per
+    product to Postgres in one transaction.
+
+    Crash safety:
+     - Deltas live in Redis, not in process memory, so a crashed replica loses
+       nothing; any replica (or the next startup) flushes them.
+     - A swapped-out batch keeps its id until it is cleared. It is recorded in
+       `inventory_ledger_flushes` in the same transaction as the deltas, so a
+       batch re-read after a crash between commit and clear is applied once.
+     - `reconcile()` compares Redis (stock minus unflushed deltas) with
+       Postgres and reports every product that drifted.
+    Redis must run with persistence (AOF) for the ledger to survive a Redis restart.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._flush_lock = asyncio.Lock()
+        self._scripts = {}
+
+    def _script(self, source: str):
+        if source not in self._scripts:
+            self._scripts[source] = redis_client.client.register_script(source)
+        return self._scripts[source]
+
+    async def reserve(self, product_id: str, quantity: int) -> int:
+        """
+        Atomically reserves stock in Redis.
+
+        Returns:
+         int: The remaining stock.
+
+        Raises:
+         stock.ProductNotFound: If the product is not in the ledger.
+         stock.InsufficientStock: If the stock is lower than the quantity.
+        """
+        status, level = await self._script(RESERVE_SCRIPT)(keys=[STOCK_KEY, DELTAS_KEY], args=[product_id, quantity])
+        if status == -1:
+            raise stock.ProductNotFound(product_id)
+        if status == 0:
+            raise stock.InsufficientStock(product_id)
+        return level
+
+    async def release(self, product_id: str, quantity: int) -> int:
+        """
+        Atomically returns stock in Redis.
+
+        Raises:
+         stock.ProductNotFound: If the product is not in the ledger.
+        """
+        status, level = await self._script(RELEASE_SCRIPT)(keys=[STOCK_KEY, DELTAS_KEY], args=[product_id, quantity])
+        if status == -1:
+            raise stock.ProductNotFound(product_id)
+        return level
+
+    async def _apply_many(self, quantities: Dict[str, int]) -> Dict[str, int]:
+        args: List = []
+        for product_id, quantity in quantities.items():
+            args.extend([product_id, quantity])
+        status, *rest = await self._script(APPLY_MANY_SCRIPT)(keys=[STOCK_KEY, DELTAS_KEY], args=args)
+        if status == -1:
+            raise stock.ProductNotFound(*rest)
+        if status == 0:
+            raise stock.InsufficientStock(*rest)
+        return {rest[i]: int(rest[i + 1]) for i in range(0, len(rest), 2)}
+
+    async def reserve_many(self, quantities: Dict[str, int]) -> Dict[str, int]:
+        """All-or-nothing batch reservation; see `stock.reserve_many`."""
+        return await self._apply_many(quantities)
+
+    async def release_many(self, quantities: Dict[str, int]) -> Dict[str, int]:
+        """All-or-nothing batch release; see `stock.release_many`."""
+        return await self._apply_many({pid: -qty for pid, qty in quantities.items()})
+
+    async def set_level(self, product_id: str, level: int, current: int):
+        """
+        Overwrites a product's level (admin correction or new product).
+
+        The difference to the previous Redis level (or `current`, the Postgres
+        level, if the product is not loaded yet) is booked as a delta, so
+        Postgres converges on the next flush.
+        """
+        await self._script(SET_LEVEL_SCRIPT)(keys=[STOCK_KEY, DELTAS_KEY], args=[product_id, level, current])
+
+    async def add_product(self, product_id: str, level: int):
+        """Registers a product created in Postgres; existing ledger levels win."""
+        await redis_client.client.hsetnx(STOCK_KEY, product_id, level)
+
+    async def level(self, product_id: str) -> int | None:
+        value = await redis_client.client.hget(STOCK_KEY, product_id)
+        return int(value) if value is not None else None
+
+    async def levels(self, product_ids: List[str]) -> Dict[str, int]:
+        """Ledger levels of several products in one HMGET; unknown products are absent."""
+        values = await redis_client.client.hmget(STOCK_KEY, product_ids)
+        return {pid: int(value) for pid, value in zip(product_ids, values) if value is not None}
+
+    async def flush(self) -> Dict[str, int]:
+        """
+        Applies the pending net deltas to Postgres (write-behind).
+
+        The resulting levels are recorded in the outbox within the same
+        transaction, so availability events follow the flushed state. Records
+        of batches applied more than FLUSH_RECORD_RETENTION ago are deleted in
+        it as well.
+
+        Returns:
+         Dict[str, int]: Postgres stock per product after the flush (empty if idle).
+        """
+        async with self._flush_lock:
+            batch = await self._script(SWAP_SCRIPT)(
+                keys=[DELTAS_KEY, FLUSHING_KEY, FLUSHING_ID_KEY, SWAPS_KEY], args=[uuid.uuid4().hex]
+            )
+            if not batch:
+                return {}
+
+            batch_id, *pairs = batch
+            deltas = {pairs[i]: int(pairs[i + 1]) for i in range(0, len(pairs), 2) if int(pairs[i + 1])}
+            levels = {}
+            async with AsyncSessionLocal() as db:
+                claimed = await db.execute(
+                    insert(LedgerFlush)
+                    .values(batch_id=batch_id)
+                    .on_conflict_do_nothing()
+                    .returning(LedgerFlush.batch_id)
+                )
+                if claimed.scalar_one_or_none() is None:
+                    logger.warning(f"Ledger batch {batch_id} was already applied, discarding it")
+                elif deltas:
+                    levels = await stock.apply_deltas(db, deltas)
+                    movements.record(db, {pid: d for pid, d in deltas.items() if pid in levels}, "ledger_flush", batch_id)
+                    outbox.enqueue(db, levels, deltas)
+                # Earlier batches were cleared from Redis before this one was swapped out
+                await db.execute(
+                    delete(LedgerFlush).where(
+                        LedgerFlush.batch_id != batch_id,
+                        LedgerFlush.applied_at < func.now() - FLUSH_RECORD_RETENTION,
+                    )
+                )
+                await db.commit()
+
+            await self._script(CLEAR_SCRIPT)(keys=[FLUSHING_KEY, FLUSHING_ID_KEY], args=[batch_id])
+            return levels
+
+    async def warm_load(self):
+        """
+        Loads every product's Postgres stock into the ledger.
+
+        Leftover deltas are flushed first so Postgres is current. Products that
+        are already in the ledger (kept by another replica or a persistent
+        Redis) are not overwritten.
+        """
+        while await self.flush():
+            pass
+
+        client = redis_client.client
+        stmt = select(InventoryItem.product_id, stock.effective_stock())
+        loaded = 0
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt.execution_options(yield_per=1000))
+            async for rows in result.partitions():
+                async with client.pipeline(transaction=False) as pipe:
+                    for product_id, level in rows:
+                        pipe.hsetnx(STOCK_KEY, product_id, level)
+                    loaded += sum(await pipe.execute())
+        logger.info(f"Ledger warm-load added {loaded} products")
+
+    async def reconcile(self) -> List[dict]:
+        """
+        Compares the ledger with Postgres.
+
+        For every product, the Redis level minus its unflushed deltas must equal
+        the Postgres level. A swapped-out batch counts as unflushed unless its id
+        is already recorded as applied.
+
+        Levels, pending and swapped-out deltas are read in one Redis
+        transaction, and the applied batches and stock in one Postgres snapshot,
+        so a batch counts either on both sides or on neither. Flushes of this
+        process wait for the reconciliation; if another replica swaps out a
+        new batch between both reads (its deltas may then already be in the
+        snapshot), the reads are repeated.
+
+        Returns:
+         List[dict]: One entry per drifted product (empty when consistent).
+        """
+        client = redis_client.client
+        async with self._flush_lock:
+            for _ in range(RECONCILE_ATTEMPTS):
+                async with client.pipeline(transaction=True) as pipe:
+                    pipe.hgetall(STOCK_KEY)
+                    pipe.hgetall(DELTAS_KEY)
+                    pipe.hgetall(FLUSHING_KEY)
+                    pipe.get(FLUSHING_ID_KEY)
+                    pipe.get(SWAPS_KEY)
+                    levels, pending, flushing, flushing_id, swaps = await pipe.execute()
+
+                async with AsyncSessionLocal() as db:
+                    await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+                    if flushing_id and await db.get(LedgerFlush, flushing_id):
+                        flushing = {}
+                    result = await db.execute(select(InventoryItem.product_id, stock.effective_stock()))
+                    persisted = {product_id: level for product_id, level in result}
+
+                if await client.get(SWAPS_KEY) == swaps:
+                    break
+            else:
+                logger.warning("Ledger kept flushing during reconciliation; drift may be overstated")
+
+        drift = []
+        for product_id in sorted(set(levels) | set(persisted)):
+            expected = persisted.get(product_id)
+            if product_id in levels:
+                unflushed = int(pending.get(product_id, 0)) + int(flushing.get(product_id, 0))
+                ledger_level = int(levels[product_id]) - unflushed
+            else:
+                ledger_level = None
+            if ledger_level != expected:
+                drift.append({"product_id": product_id, "ledger": ledger_level, "postgres": expected})
+
+        if drift:
+            logger.error(f"Ledger reconciliation found {len(drift)} drifted products: {drift[:20]}")
+        return drift
+
+    async def _run(self):
+        interval = settings.LEDGER_FLUSH_INTERVAL_MS / 1000
+        reconcile_every = settings.LEDGER_RECONCILE_INTERVAL_SECONDS
+        loop = asyncio.get_running_loop()
+        next_reconcile = loop.time() + reconcile_every
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await self.flush()
+                if reconcile_every and loop.time() >= next_reconcile:
+                    next_reconcile = loop.time() + reconcile_every
+                    await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error(f"Ledger flush failed: {ex}")
+
+    async def start(self):
+        """Warm-loads the ledger, checks it against Postgres and starts the flusher."""
+        await self.warm_load()
+        await self.reconcile()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the flusher and writes back whatever is still pending."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+ledger = RedisStockLedger()
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from typing import Dict
+from sqlalchemy import BigInteger, Text, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.inventory import InventoryItem, StockBalance, StockMovement, StockRollupState
+from .stock import effective_stock
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant identifying the compactor's advisory lock
+COMPACTOR_LOCK_KEY = 0x1A7E_0B0D
+
+
+def record(db: AsyncSession, deltas: Dict[str, int], reason: str, reference: str | None = None):
+    """
+    Appends one movement per changed product in the caller's transaction.
+
+    Arguments:
+     db (AsyncSession): The session holding the stock change.
+     deltas (Dict[str, int]): Applied change per product (negative = taken out).
+     reason (str): What caused the change (e.g. "reserve", "correction").
+     reference (str | None): Optional reservation or batch id.
+    """
+    db.add_all([
+        StockMovement(product_id=product_id, delta=delta, reason=reason, reference=reference)
+        for product_id, delta in deltas.items() if delta
+    ])
+
+
+def _snapshot_xmin():
+    """Oldest transaction id still running; every transaction below it has finished."""
+    return func.pg_snapshot_xmin(func.pg_current_snapshot()).cast(Text).cast(BigInteger)
+
+
+def _horizon():
+    return func.coalesce(
+        select(StockRollupState.horizon).where(StockRollupState.id == 1).scalar_subquery(), 0
+    )
+
+
+async def read_balance(db: AsyncSession, product_id: str) -> dict | None:
+    """
+    Returns a product's balance as rolled-up snapshot plus not yet rolled-up movements.
+
+    Both parts are read in one statement, so a concurrent rollup is either
+    fully included in the snapshot or not at all.
+
+    Returns:
+     dict | None: snapshot, pending delta and count, and their sum as `balance`;
+      None if the product has no history.
+    """
+    pending = select(StockMovement.delta).where(
+        StockMovement.product_id == product_id, StockMovement.xid >= _horizon()
+    ).subquery()
+    stmt = select(
+        select(StockBalance.balance).where(StockBalance.product_id == product_id).scalar_subquery().label("snapshot"),
+        select(func.coalesce(func.sum(pending.c.delta), 0)).scalar_subquery().label("pending"),
+        select(func.count()).select_from(pending).scalar_subquery().label("pending_movements"),
+    )
+    row = (await db.execute(stmt)).one()
+    if row.snapshot is None and not row.pending_movements:
+        return None
+    snapshot = row.snapshot or 0
+    return {
+        "product_id": product_id,
+        "snapshot": snapshot,
+        "pending": int(row.pending),
+        "pending_movements": row.pending_movements,
+        "balance": snapshot + int(row.pending),
+    }
+
+
+class MovementCompactor:
+    """
+    Background task rolling stock movements up into `stock_balances`.
+
+    Each round reads the snapshot's xmin (every transaction with a lower id
+    has committed or aborted) and folds all movements written by transactions
+    between the previous horizon and it into the balances with one
+    `INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE`, then advances
+    the horizon. Filtering on the writer's xid instead of the movement id
+    means a transaction that commits late can never be skipped. An advisory
+    lock keeps a single compactor active across replicas.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.rollups = 0
+        self.products_rolled = 0
+
+    async def _bootstrap(self, db: AsyncSession):
+        """
+        Records opening movements so that every item's history sums up to its stock.
+
+        Stock and recorded movements are compared in a single statement, i.e.
+        one snapshot: changes still in flight are missing from both sides.
+        """
+        recorded = func.coalesce(
+            select(func.sum(StockMovement.delta))
+            .where(StockMovement.product_id == InventoryItem.product_id)
+            .scalar_subquery(),
+            0,
+        )
+        opening = effective_stock() - recorded
+        await db.execute(
+            insert(StockMovement).from_select(
+                ["product_id", "delta", "reason"],
+                select(InventoryItem.product_id, opening, literal("opening")).where(opening != 0),
+            )
+        )
+        await db.execute(insert(StockRollupState).values(id=1, horizon=0).on_conflict_do_nothing())
+
+    async def compact_once(self) -> int:
+        """
+        Rolls up the movements of all finished transactions.
+
+        Returns:
+         int: Number of balances updated (0 if idle or another replica holds the lock).
+        """
+        async with AsyncSessionLocal() as db:
+            if not await db.scalar(select(func.pg_try_advisory_xact_lock(COMPACTOR_LOCK_KEY))):
+                return 0
+
+            previous = await db.scalar(
+                select(StockRollupState.horizon).where(StockRollupState.id == 1).with_for_update()
+            )
+            if previous is None:
+                await self._bootstrap(db)
+                await db.commit()
+                return 0
+
+            horizon = await db.scalar(select(_snapshot_xmin()))
+            if horizon <= previous:
+                return 0
+
+            window = (
+                select(StockMovement.product_id, func.sum(StockMovement.delta))
+                .where(StockMovement.xid >= previous, StockMovement.xid < horizon)
+                .group_by(StockMovement.product_id)
+            )
+            stmt = insert(StockBalance).from_select(["product_id", "balance"], window)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[StockBalance.product_id],
+                set_={"balance": StockBalance.balance + stmt.excluded.balance, "updated_at": func.now()},
+            )
+            result = await db.execute(stmt)
+            await db.execute(update(StockRollupState).where(StockRollupState.id == 1).values(horizon=horizon))
+            await db.commit()
+
+        self.rollups += 1
+        self.products_rolled += result.rowcount
+        return result.rowcount
+
+    async def _run(self):
+        while True:
+            try:
+                await self.compact_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error(f"Movement compactor failed: {ex}")
+            await asyncio.sleep(settings.MOVEMENTS_ROLLUP_INTERVAL_SECONDS)
+
+    def stats(self) -> dict:
+        return {"rollups": self.rollups, "products_rolled": self.products_rolled}
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+compactor = MovementCompactor()
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List
+from sqlalchemy import case, delete, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.redis_client import redis_client
+from ..models.inventory import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_UPDATES = "inventory_updates"
+
+# Arbitrary constant identifying the relay's advisory lock
+RELAY_LOCK_KEY = 0x1A7E_0B0C
+
+
+def stock_band(level: int) -> int:
+    """Availability band of a stock level: 0 = sold out, 1 = low stock, 2 = in stock."""
+    if level <= 0:
+        return 0
+    if level <= settings.LOW_STOCK_THRESHOLD:
+        return 1
+    return 2
+
+
+def band_expression(level):
+    """SQL counterpart of `stock_band` for set-based writes."""
+    return case((level <= 0, 0), (level <= settings.LOW_STOCK_THRESHOLD, 1), else_=2)
+
+
+def payload_expression(product_id, level):
+    """SQL counterpart of the event payload recorded by `enqueue`."""
+    return func.jsonb_build_object(
+        literal("product_id"), product_id,
+        literal("available"), level > 0,
+        literal("low_stock"), band_expression(level) == 1,
+        literal("stock"), level,
+    )
+
+
+def enqueue(db: AsyncSession, levels: Dict[str, int], deltas: Dict[str, int] | None = None):
+    """
+    Records 'inventory_updates' events in the caller's transaction.
+
+    Nothing is sent here: the event becomes visible to the relay only if the
+    stock change it describes commits, and it survives a crash right after.
+    Subscribers only care about availability, so when `deltas` is given a
+    product is recorded only if the change moved it into another band (sold
+    out, at or below LOW_STOCK_THRESHOLD, in stock); without it every product
+    is recorded (new items, manual corrections).
+
+    Arguments:
+     db (AsyncSession): The session holding the stock change.
+     levels (Dict[str, int]): Stock per product after the change.
+     deltas (Dict[str, int] | None): The applied change per product (negative = reserved).
+    """
+    events = []
+    for product_id, level in levels.items():
+        band = stock_band(level)
+        if deltas is not None and stock_band(level - deltas.get(product_id, 0)) == band:
+            continue
+        events.append(OutboxEvent(
+            channel=INVENTORY_UPDATES,
+            product_id=product_id,
+            payload={"product_id": product_id, "available": band > 0, "low_stock": band == 1, "stock": level},
+        ))
+    db.add_all(events)
+
+
+def coalesce(events: List[OutboxEvent]) -> List[OutboxEvent]:
+    """Keeps only the newest event per (channel, product) of an id-ordered batch."""
+    latest: Dict[tuple, OutboxEvent] = {}
+    for event in events:
+        latest[(event.channel, event.product_id)] = event
+    return list(latest.values())
+
+
+class OutboxRelay:
+    """
+    Background publisher draining the inventory outbox.
+
+    Each round takes the oldest OUTBOX_BATCH_SIZE events, collapses several
+    updates of the same product into its latest state, publishes them through
+    one pipeline on the pooled Redis connection and deletes the batch in the
+    same transaction. A product published less than OUTBOX_DEBOUNCE_MS ago is
+    left in the outbox until its window ends, so a burst of flips reaches
+    subscribers as one event carrying the final state. A transaction-scoped
+    advisory lock keeps a single relay active across replicas, so a product's
+    updates are never reordered.
+    Delivery is at-least-once: a crash after publishing re-sends the batch,
+    which is harmless because events carry absolute state.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._last_published: Dict[str, float] = {}
+        self.published = 0
+        self.coalesced = 0
+
+    async def drain_once(self) -> int:
+        """
+        Publishes and deletes one batch of outbox events.
+
+        Returns:
+         int: Number of outbox rows consumed (0 if idle or another relay holds the lock).
+        """
+        async with AsyncSessionLocal() as db:
+            if not await db.scalar(select(func.pg_try_advisory_xact_lock(RELAY_LOCK_KEY))):
+                return 0
+
+            stmt = select(OutboxEvent).order_by(OutboxEvent.id).limit(settings.OUTBOX_BATCH_SIZE)
+            debounced = self._debounced()
+            if debounced:
+                stmt = stmt.where(OutboxEvent.product_id.notin_(debounced))
+            events = list((await db.execute(stmt)).scalars())
+            if not events:
+                return 0
+
+            to_publish = coalesce(events)
+            async with redis_client.client.pipeline(transaction=False) as pipe:
+                for event in to_publish:
+                    pipe.publish(event.channel, json.dumps(event.payload))
+                await pipe.execute()
+
+            await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([event.id for event in events])))
+            await db.commit()
+
+        now = time.monotonic()
+        for event in to_publish:
+            self._last_published[event.product_id] = now
+        self.published += len(to_publish)
+        self.coalesced += len(events) - len(to_publish)
+        return len(events)
+
+    def _debounced(self) -> List[str]:
+        """Products still inside their debounce window; expired entries are dropped."""
+        cutoff = time.monotonic() - settings.OUTBOX_DEBOUNCE_MS / 1000
+        self._last_published = {pid: at for pid, at in self._last_published.items() if at > cutoff}
+        return list(self._last_published)
+
+    async def _run(self):
+        interval = settings.OUTBOX_POLL_INTERVAL_MS / 1000
+        while True:
+            try:
+                if await self.drain_once() < settings.OUTBOX_BATCH_SIZE:
+                    await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error(f"Outbox relay failed: {ex}")
+                await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {"published": self.published, "coalesced": self.coalesced}
+
+    async def start(self):
+        if redis_client.client:
+            self._task = asyncio.create_task(self._run())
+        else:
+            logger.warning("REDIS_URL not set; inventory outbox relay not started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+relay = OutboxRelay()
@@ -0,0 +1,167 @@
+import functools
+from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from . import holds, movements, outbox, stock
+from .contention import tracker
+from .coalescer import coalescer
+from .ledger import ledger
+from .stock_cache import cache
+
+
+def _invalidates_cache(operation):
+    """Drops cached levels of the touched product(s) once the write finished or failed."""
+    @functools.wraps(operation)
+    async def wrapper(db: AsyncSession, target, *args, **kwargs):
+        try:
+            return await operation(db, target, *args, **kwargs)
+        finally:
+            cache.invalidate([target] if isinstance(target, str) else target)
+    return wrapper
+
+
+@_invalidates_cache
+async def reserve(db: AsyncSession, product_id: str, quantity: int,
+                  reservation_id: str | None = None, hold_seconds: int | None = None) -> int:
+    """
+    Reserves stock through the configured path and makes the change durable.
+
+    Dispatches to the Redis ledger (`redis` strategy), the group-commit
+    coalescer (RESERVE_COALESCE_ENABLED), or a direct Postgres update
+    (`atomic` / `optimistic`; lost version checks are retried, see
+    `contention.ContentionTracker`). On the direct path the 'inventory_updates'
+    event (if availability changed) is written to the outbox and committed with
+    the stock change; the ledger and the coalescer record their events in their
+    own transactions. Cached levels of the product are invalidated either way.
+
+    With a `reservation_id` the quantity is also recorded as a hold that
+    expires unless confirmed (see `holds`); such reservations always take the
+    direct path. The Redis ledger does not support holds and ignores the id.
+
+    Returns:
+     int: The remaining stock.
+
+    Raises:
+     stock.ProductNotFound, stock.InsufficientStock
+     stock.ConcurrentUpdate: If the optimistic retry budget was exhausted.
+    """
+    if settings.RESERVE_STRATEGY == "redis":
+        return await ledger.reserve(product_id, quantity)
+    if settings.RESERVE_COALESCE_ENABLED and reservation_id is None:
+        return await coalescer.reserve(product_id, quantity)
+
+    if settings.RESERVE_STRATEGY == "optimistic":
+        level = await tracker.run(
+            product_id,
+            lambda: stock.reserve_optimistic(db, product_id, quantity),
+            db.rollback,
+        )
+    else:
+        level = await stock.reserve(db, product_id, quantity)
+    if reservation_id is not None:
+        await holds.place(db, reservation_id, {product_id: quantity}, hold_seconds)
+    movements.record(db, {product_id: -quantity}, "reserve", reservation_id)
+    outbox.enqueue(db, {product_id: level}, {product_id: -quantity})
+    await db.commit()
+    return level
+
+
+@_invalidates_cache
+async def release(db: AsyncSession, product_id: str, quantity: int, reservation_id: str | None = None) -> int:
+    """
+    Returns stock through the configured path; see `reserve`.
+
+    With a `reservation_id` the quantity still held for the product under that
+    reservation is returned instead of `quantity`. Nothing is returned if the
+    hold was already confirmed, released or expired, so a duplicated or late
+    compensation cannot add stock twice.
+
+    Raises:
+     stock.ProductNotFound
+    """
+    if settings.RESERVE_STRATEGY == "redis":
+        return await ledger.release(product_id, quantity)
+    if reservation_id is not None:
+        return (await _release_held(db, reservation_id, [product_id]))[product_id]
+    if settings.RESERVE_COALESCE_ENABLED:
+        return await coalescer.release(product_id, quantity)
+
+    level = await stock.release(db, product_id, quantity)
+    movements.record(db, {product_id: quantity}, "release")
+    outbox.enqueue(db, {product_id: level}, {product_id: quantity})
+    await db.commit()
+    return level
+
+
+@_invalidates_cache
+async def reserve_many(db: AsyncSession, quantities: Dict[str, int],
+                       reservation_id: str | None = None, hold_seconds: int | None = None) -> Dict[str, int]:
+    """
+    All-or-nothing batch reservation in the ledger or in one Postgres transaction.
+
+    With a `reservation_id` the quantities are held as in `reserve`.
+
+    Raises:
+     stock.ProductNotFound, stock.InsufficientStock
+    """
+    if settings.RESERVE_STRATEGY == "redis":
+        return await ledger.reserve_many(quantities)
+
+    levels = await stock.reserve_many(db, quantities)
+    deltas = {pid: -qty for pid, qty in quantities.items()}
+    if reservation_id is not None:
+        await holds.place(db, reservation_id, quantities, hold_seconds)
+    movements.record(db, deltas, "reserve", reservation_id)
+    outbox.enqueue(db, levels, deltas)
+    await db.commit()
+    return levels
+
+
+@_invalidates_cache
+async def release_many(db: AsyncSession, quantities: Dict[str, int],
+                       reservation_id: str | None = None) -> Dict[str, int]:
+    """
+    All-or-nothing batch release in the ledger or in one Postgres transaction.
+
+    With a `reservation_id` the held quantities are returned as in `release`.
+
+    Raises:
+     stock.ProductNotFound
+    """
+    if settings.RESERVE_STRATEGY == "redis":
+        return await ledger.release_many(quantities)
+    if reservation_id is not None:
+        return await _release_held(db, reservation_id, list(quantities))
+
+    levels = await stock.release_many(db, quantities)
+    movements.record(db, quantities, "release")
+    outbox.enqueue(db, levels, quantities)
+    await db.commit()
+    return levels
+
+
+async def _release_held(db: AsyncSession, reservation_id: str, product_ids: List[str]) -> Dict[str, int]:
+    # Item rows before holds, the order reservations and the hold sweeper lock in
+    items, shards, current = await stock.lock_levels(db, product_ids)
+    held = await holds.take(db, reservation_id, product_ids)
+    levels = stock.apply_locked(items, shards, current, held)
+    movements.record(db, held, "release", reservation_id)
+    outbox.enqueue(db, levels, held)
+    await db.commit()
+    return dict(sorted({**current, **levels}.items()))
+
+
+async def confirm(db: AsyncSession, reservation_id: str) -> Dict[str, int] | None:
+    """
+    Makes a reservation final by deleting its holds.
+
+    Returns:
+     Dict[str, int] | None: The confirmed quantity per product (empty if nothing
+      is held any more), or None with the Redis ledger, whose reservations are
+      final right away.
+    """
+    if settings.RESERVE_STRATEGY == "redis":
+        return None
+    confirmed = await holds.take(db, reservation_id)
+    await db.commit()
+    return confirmed
@@ -0,0 +1,494 @@
+import random
+from typing import Dict, Iterable, List
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.inventory import InventoryItem, InventoryShard
+
+
+class StockError(Exception):
+    """Base class for failed stock mutations; carries the offending product ids."""
+
+    def __init__(self, *product_ids: str):
+        super().__init__(*product_ids)
+        self.product_ids = list(product_ids)
+
+    @property
+    def product_id(self) -> str:
+        return self.product_ids[0]
+
+
+class ProductNotFound(StockError):
+    """Raised when no inventory record exists for the product."""
+
+
+class InsufficientStock(StockError):
+    """Raised when the requested quantity exceeds the available stock."""
+
+
+class ConcurrentUpdate(StockError):
+    """Raised when an optimistic version check loses a race against another writer."""
+
+
+def effective_stock():
+    """
+    SQL expression for a product's sellable stock.
+
+    Unsharded items keep their stock in `inventory_items.stock`; sharded items
+    are the sum of their `inventory_shards` rows.
+    """
+    shard_total = (
+        select(func.coalesce(func.sum(InventoryShard.stock), 0))
+        .where(InventoryShard.product_id == InventoryItem.product_id)
+        .scalar_subquery()
+    )
+    return case((InventoryItem.shard_count > 0, shard_total), else_=InventoryItem.stock)
+
+
+async def read_levels(db: AsyncSession, product_ids: Iterable[str]) -> Dict[str, int]:
+    """
+    Reads the effective stock of several products without locking.
+
+    Returns:
+     Dict[str, int]: Stock per product; products without a record are absent.
+    """
+    stmt = select(InventoryItem.product_id, effective_stock()).where(InventoryItem.product_id.in_(list(product_ids)))
+    return {product_id: level for product_id, level in (await db.execute(stmt)).all()}
+
+
+async def _shard_count(db: AsyncSession, product_id: str) -> int:
+    """
+    Looks up whether a product is sharded.
+
+    Called only on the slow path, after a conditional UPDATE on the unsharded
+    row matched nothing, to tell "missing", "sharded" and "too little stock" apart.
+
+    Raises:
+     ProductNotFound: If no inventory record exists for the product.
+    """
+    stmt = select(InventoryItem.shard_count).where(InventoryItem.product_id == product_id)
+    shard_count = await db.scalar(stmt)
+    if shard_count is None:
+        raise ProductNotFound(product_id)
+    return shard_count
+
+
+async def _sharded_total(db: AsyncSession, product_id: str) -> int:
+    stmt = select(func.coalesce(func.sum(InventoryShard.stock), 0)).where(InventoryShard.product_id == product_id)
+    return await db.scalar(stmt)
+
+
+async def _lock_shards(db: AsyncSession, product_ids: Iterable[str]) -> Dict[str, List[InventoryShard]]:
+    """
+    Row-locks the shards of the given products in (product_id, shard_no) order.
+
+    Every multi-shard writer locks in this order, so they cannot deadlock each
+    other; single-shard reservations hold one shard lock at a time.
+    """
+    stmt = (
+        select(InventoryShard)
+        .where(InventoryShard.product_id.in_(sorted(set(product_ids))))
+        .order_by(InventoryShard.product_id, InventoryShard.shard_no)
+        .with_for_update()
+    )
+    shards: Dict[str, List[InventoryShard]] = {}
+    for shard in (await db.execute(stmt)).scalars():
+        shards.setdefault(shard.product_id, []).append(shard)
+    return shards
+
+
+def _drain(shards: List[InventoryShard], quantity: int):
+    """Takes `quantity` units from locked shards, fullest first."""
+    for shard in sorted(shards, key=lambda s: s.stock, reverse=True):
+        taken = min(shard.stock, quantity)
+        shard.stock -= taken
+        quantity -= taken
+        if not quantity:
+            return
+
+
+def split_stock(total: int, shard_count: int) -> List[int]:
+    """Spreads `total` units as evenly as possible over `shard_count` shards."""
+    base, extra = divmod(total, shard_count)
+    return [base + (1 if shard_no < extra else 0) for shard_no in range(shard_count)]
+
+
+async def _reserve_sharded(db: AsyncSession, product_id: str, quantity: int) -> int:
+    """
+    Reserves from a sharded product.
+
+    Reads (without locking) which shards can cover the quantity on their own,
+    then tries them in random order with a conditional UPDATE, so concurrent
+    callers spread across shards. If no single shard suffices, or every
+    candidate was drained by a concurrent caller, all shards are locked and
+    the quantity is taken across them.
+
+    Returns:
+     int: The remaining stock over all shards.
+
+    Raises:
+     InsufficientStock: If all shards together hold less than the quantity.
+    """
+    candidates_stmt = select(InventoryShard.shard_no).where(
+        InventoryShard.product_id == product_id,
+        InventoryShard.stock >= quantity
+    )
+    candidates = list((await db.execute(candidates_stmt)).scalars())
+    random.shuffle(candidates)
+
+    for shard_no in candidates:
+        stmt = (
+            update(InventoryShard)
+            .where(
+                InventoryShard.product_id == product_id,
+                InventoryShard.shard_no == shard_no,
+                InventoryShard.stock >= quantity
+            )
+            .values(stock=InventoryShard.stock - quantity)
+            .returning(InventoryShard.id)
+            .execution_options(synchronize_session=False)
+        )
+        if (await db.execute(stmt)).scalar_one_or_none() is not None:
+            return await _sharded_total(db, product_id)
+
+    # Fallback: no single shard can cover the quantity
+    shards = (await _lock_shards(db, [product_id])).get(product_id, [])
+    total = sum(shard.stock for shard in shards)
+    if total < quantity:
+        raise InsufficientStock(product_id)
+    _drain(shards, quantity)
+    await db.flush()
+    return total - quantity
+
+
+async def _release_sharded(db: AsyncSession, product_id: str, quantity: int, shard_count: int) -> int:
+    """Returns units to one randomly chosen shard of a sharded product."""
+    stmt = (
+        update(InventoryShard)
+        .where(
+            InventoryShard.product_id == product_id,
+            InventoryShard.shard_no == random.randrange(shard_count)
+        )
+        .values(stock=InventoryShard.stock + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(stmt)
+    return await _sharded_total(db, product_id)
+
+
+async def reserve(db: AsyncSession, product_id: str, quantity: int) -> int:
+    """
+    Decrements stock with a single conditional UPDATE.
+
+    The availability check and the decrement happen in one statement
+    (`UPDATE ... WHERE stock >= :qty RETURNING stock`), so concurrent callers
+    simply queue on the row lock instead of failing a version check.
+    Sharded products are detected on the slow path and reserved from their
+    shards. The caller owns the transaction and must commit.
+
+    Arguments:
+     db (AsyncSession): Asynchronous database session.
+     product_id (str): Product whose stock is decremented.
+     quantity (int): Number of units to reserve.
+
+    Returns:
+     int: The remaining stock after the reservation.
+
+    Raises:
+     ProductNotFound: If the product has no inventory record.
+     InsufficientStock: If the remaining stock is lower than the quantity.
+    """
+    stmt = (
+        update(InventoryItem)
+        .where(
+            InventoryItem.product_id == product_id,
+            InventoryItem.shard_count == 0,
+            InventoryItem.stock >= quantity
+        )
+        .values(
+            stock=InventoryItem.stock - quantity,
+            version=InventoryItem.version + 1
+        )
+        .returning(InventoryItem.stock)
+        .execution_options(synchronize_session=False)
+    )
+    remaining = (await db.execute(stmt)).scalar_one_or_none()
+    if remaining is not None:
+        return remaining
+
+    if await _shard_count(db, product_id):
+        return await _reserve_sharded(db, product_id, quantity)
+    raise InsufficientStock(product_id)
+
+
+async def reserve_optimistic(db: AsyncSession, product_id: str, quantity: int) -> int:
+    """
+    Decrements stock using Optimistic Locking (read, then version-checked UPDATE).
+
+    Kept as the `optimistic` reservation strategy. It never blocks on a row lock,
+    but under contention most callers lose the version check. Sharded products
+    always use the shard path.
+
+    Returns:
+     int: The remaining stock after the reservation.
+
+    Raises:
+     ProductNotFound: If the product has no inventory record.
+     InsufficientStock: If the remaining stock is lower than the quantity.
+     ConcurrentUpdate: If another writer bumped the version in the interim.
+    """
+    stmt = select(
+        InventoryItem.id, InventoryItem.stock, InventoryItem.version, InventoryItem.shard_count
+    ).where(InventoryItem.product_id == product_id)
+    row = (await db.execute(stmt)).one_or_none()
+
+    if row is None:
+        raise ProductNotFound(product_id)
+
+    if row.shard_count:
+        return await _reserve_sharded(db, product_id, quantity)
+
+    if row.stock < quantity:
+        raise InsufficientStock(product_id)
+
+    update_stmt = (
+        update(InventoryItem)
+        .where(
+            InventoryItem.id == row.id,
+            InventoryItem.version == row.version
+        )
+        .values(
+            stock=InventoryItem.stock - quantity,
+            version=InventoryItem.version + 1
+        )
+        .execution_options(synchronize_session=False)  # Skip session sync for performance
+    )
+    result = await db.execute(update_stmt)
+
+    if result.rowcount == 0:
+        raise ConcurrentUpdate(product_id)
+
+    return row.stock - quantity
+
+
+async def release(db: AsyncSession, product_id: str, quantity: int) -> int:
+    """
+    Increments stock with a single UPDATE (Compensating Transaction).
+
+    Returns:
+     int: The stock after the release.
+
+    Raises:
+     ProductNotFound: If the product has no inventory record.
+    """
+    stmt = (
+        update(InventoryItem)
+        .where(
+            InventoryItem.product_id == product_id,
+            InventoryItem.shard_count == 0
+        )
+        .values(
+            stock=InventoryItem.stock + quantity,
+            version=InventoryItem.version + 1
+        )
+        .returning(InventoryItem.stock)
+        .execution_options(synchronize_session=False)
+    )
+    current = (await db.execute(stmt)).scalar_one_or_none()
+    if current is not None:
+        return current
+
+    shard_count = await _shard_count(db, product_id)
+    return await _release_sharded(db, product_id, quantity, shard_count)
+
+
+def merge_quantities(items: Iterable) -> Dict[str, int]:
+    """
+    Collapses line items into one quantity per product, keyed in product_id order.
+
+    Arguments:
+     items (Iterable): Objects exposing `product_id` and `quantity` attributes.
+
+    Returns:
+     Dict[str, int]: Total quantity per product, sorted by product_id.
+    """
+    merged: Dict[str, int] = {}
+    for item in items:
+        merged[item.product_id] = merged.get(item.product_id, 0) + item.quantity
+    return dict(sorted(merged.items()))
+
+
+async def _lock_items(db: AsyncSession, product_ids: Iterable[str], strict: bool = True) -> Dict[str, InventoryItem]:
+    """
+    Loads and row-locks inventory records (`SELECT ... FOR UPDATE`).
+
+    Rows are locked in ascending product_id order, so two batches touching
+    overlapping products always acquire their locks in the same sequence and
+    cannot deadlock each other.
+
+    Raises:
+     ProductNotFound: Listing every requested product without an inventory
+      record (only when `strict`; otherwise they are simply absent).
+    """
+    product_ids = sorted(set(product_ids))
+    stmt = (
+        select(InventoryItem)
+        .where(InventoryItem.product_id.in_(product_ids))
+        .order_by(InventoryItem.product_id)
+        .with_for_update()
+    )
+    items = {item.product_id: item for item in (await db.execute(stmt)).scalars()}
+
+    missing = [pid for pid in product_ids if pid not in items]
+    if missing and strict:
+        raise ProductNotFound(*missing)
+    return items
+
+
+async def lock_levels(db: AsyncSession, product_ids: Iterable[str], strict: bool = True):
+    """
+    Locks the inventory rows of a batch and, for sharded products, their shards.
+
+    Returns:
+     tuple: (items by product_id, shards by product_id, current stock by product_id).
+    """
+    items = await _lock_items(db, product_ids, strict)
+    sharded = [pid for pid, item in items.items() if item.shard_count]
+    shards = await _lock_shards(db, sharded) if sharded else {}
+
+    levels = {
+        pid: sum(s.stock for s in shards.get(pid, [])) if item.shard_count else item.stock
+        for pid, item in items.items()
+    }
+    return items, shards, levels
+
+
+def apply_locked(items: Dict[str, InventoryItem], shards: Dict[str, List[InventoryShard]],
+                 levels: Dict[str, int], deltas: Dict[str, int]) -> Dict[str, int]:
+    """
+    Applies stock deltas to rows locked by `lock_levels`; changes are flushed on commit.
+
+    A negative delta on a sharded product drains its shards fullest first
+    (never below zero); a positive one goes to a random shard.
+
+    Returns:
+     Dict[str, int]: Stock per product after the deltas.
+    """
+    result = {}
+    for pid, delta in deltas.items():
+        item = items[pid]
+        if pid in shards:
+            if delta >= 0:
+                random.choice(shards[pid]).stock += delta
+            else:
+                _drain(shards[pid], min(-delta, levels[pid]))
+            result[pid] = sum(s.stock for s in shards[pid])
+        else:
+            item.stock += delta
+            item.version += 1
+            result[pid] = item.stock
+    return result
+
+
+async def reserve_many(db: AsyncSession, quantities: Dict[str, int]) -> Dict[str, int]:
+    """
+    Reserves several products all-or-nothing inside the caller's transaction.
+
+    Every row is locked first (see `_lock_items`), then all quantities are
+    validated, and only if each product has enough stock are the decrements
+    applied. On any failure nothing is modified and the caller rolls back.
+
+    Arguments:
+     db (AsyncSession): Asynchronous database session.
+     quantities (Dict[str, int]): Quantity to reserve per product.
+
+    Returns:
+     Dict[str, int]: Remaining stock per product.
+
+    Raises:
+     ProductNotFound: If any product has no inventory record.
+     InsufficientStock: Listing every product whose stock is too low.
+    """
+    items, shards, levels = await lock_levels(db, quantities)
+
+    short = [pid for pid, qty in quantities.items() if levels[pid] < qty]
+    if short:
+        raise InsufficientStock(*short)
+
+    return apply_locked(items, shards, levels, {pid: -qty for pid, qty in quantities.items()})
+
+
+async def release_many(db: AsyncSession, quantities: Dict[str, int]) -> Dict[str, int]:
+    """
+    Returns stock for several products all-or-nothing inside the caller's transaction.
+
+    Returns:
+     Dict[str, int]: Stock per product after the release.
+
+    Raises:
+     ProductNotFound: If any product has no inventory record.
+    """
+    items, shards, levels = await lock_levels(db, quantities)
+    return apply_locked(items, shards, levels, quantities)
+
+
+async def set_level(db: AsyncSession, item: InventoryItem, level: int):
+    """
+    Overwrites a product's stock (admin correction), respecting its sharding.
+
+    Sharded products get the new level spread evenly over their existing shards
+    in a single UPDATE. The caller bumps the version and commits.
+    """
+    if not item.shard_count:
+        item.stock = level
+        return
+
+    base, extra = divmod(level, item.shard_count)
+    stmt = (
+        update(InventoryShard)
+        .where(InventoryShard.product_id == item.product_id)
+        .values(stock=base + case((InventoryShard.shard_no < extra, 1), else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(stmt)
+
+
+async def reshard(db: AsyncSession, product_id: str, shard_count: int) -> InventoryItem:
+    """
+    Switches a product between a single stock row and N sub-counter shards.
+
+    The item row is locked, its current stock (row or shard total) is collected
+    and then redistributed: into `shard_count` new shards, or back into the
+    item row when `shard_count` is 0.
+
+    Returns:
+     InventoryItem: The locked, updated item (stock holds the total when unsharded).
+
+    Raises:
+     ProductNotFound: If the product has no inventory record.
+    """
+    items, shards, levels = await lock_levels(db, [product_id])
+    item, total = items[product_id], levels[product_id]
+
+    await db.execute(delete(InventoryShard).where(InventoryShard.product_id == product_id))
+    for shard_no, shard_stock in enumerate(split_stock(total, shard_count) if shard_count else []):
+        db.add(InventoryShard(product_id=product_id, shard_no=shard_no, stock=shard_stock))
+
+    item.stock = 0 if shard_count else total
+    item.shard_count = shard_count
+    item.version += 1
+    return item
+
+
+async def apply_deltas(db: AsyncSession, deltas: Dict[str, int]) -> Dict[str, int]:
+    """
+    Applies already-validated net stock deltas (write-behind from the Redis ledger).
+
+    Rows are locked in product_id order like a batch reservation. Products that
+    no longer exist are skipped, and sharded products that cannot cover a
+    negative delta are drained to zero, so a flush can never get stuck.
+
+    Returns:
+     Dict[str, int]: Stock per product after the deltas, for products that exist.
+    """
+    items, shards, levels = await lock_levels(db, deltas, strict=False)
+    return apply_locked(items, shards, levels, {pid: delta for pid, delta in deltas.items() if pid in items})
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.redis_client import redis_client
+from . import stock
+from .ledger import ledger
+
+logger = logging.getLogger(__name__)
+
+# Product ids whose cached levels are stale, published by the replica that changed them
+INVALIDATIONS = "inventory:stock_invalidations"
+
+
+class StockCache:
+    """
+    In-process TTL + LRU cache of product stock levels for read endpoints.
+
+    Entries expire after `ttl` seconds; beyond `max_entries` the least
+    recently used entry is evicted. Writes of this process invalidate the
+    products they touch once committed. The invalidated product ids are also
+    published on the INVALIDATIONS channel, batched into one message per
+    burst, and other replicas drop them on receipt. `inventory_updates`
+    events are not enough for that, since they only cover availability
+    changes and are debounced.
+
+    A filled product is dropped if it was invalidated while its read was in
+    flight, so a slow read cannot put back a level that a concurrent write
+    already replaced. Invalidations are stamped per product with a logical
+    clock; only the last `max_entries` stamps are kept, and a fill older than
+    a forgotten stamp (or than a `clear`) is dropped as a whole.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, Tuple[int, float]] = OrderedDict()
+        self._clock = 0
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+        self._floor = 0
+        self._origin = uuid.uuid4().hex
+        self._outgoing: set | None = None
+        self._outgoing_all = False
+        self._pending = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._publisher: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._latencies: deque = deque(maxlen=1024)
+
+    @property
+    def epoch(self) -> int:
+        """Invalidation clock; pass the value read before a fill to `put`."""
+        return self._clock
+
+    def get_many(self, product_ids: Iterable[str]) -> Tuple[Dict[str, int], List[str]]:
+        """
+        Looks up several products.
+
+        Returns:
+         Tuple[Dict[str, int], List[str]]: Cached levels, and the products to read.
+        """
+        now = time.monotonic()
+        found, missing = {}, []
+        for product_id in product_ids:
+            entry = self._entries.get(product_id)
+            if entry is None or entry[1] <= now:
+                missing.append(product_id)
+                continue
+            self._entries.move_to_end(product_id)
+            found[product_id] = entry[0]
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def put(self, levels: Dict[str, int], epoch: int):
+        """Caches levels read at `epoch`, except those of products invalidated since."""
+        if epoch < self._floor:
+            return
+        expires = time.monotonic() + self.ttl
+        for product_id, level in levels.items():
+            if self._invalidated.get(product_id, 0) > epoch:
+                continue
+            self._entries[product_id] = (level, expires)
+            self._entries.move_to_end(product_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, product_ids: Iterable[str]):
+        """Drops products changed by this process, here and on the other replicas."""
+        product_ids = list(product_ids)
+        self._drop(product_ids)
+        if self._outgoing is not None:
+            self._outgoing.update(product_ids)
+            self._pending.set()
+
+    def clear(self):
+        """Drops every entry, here and on the other replicas (e.g. after a bulk import)."""
+        self._reset()
+        if self._outgoing is not None:
+            self._outgoing_all = True
+            self._pending.set()
+
+    def _drop(self, product_ids: Iterable[str]):
+        for product_id in product_ids:
+            self._clock += 1
+            self._invalidated[product_id] = self._clock
+            self._invalidated.move_to_end(product_id)
+            self._entries.pop(product_id, None)
+        while len(self._invalidated) > self.max_entries:
+            _, stamp = self._invalidated.popitem(last=False)
+            self._floor = max(self._floor, stamp)
+
+    def _reset(self):
+        self._clock += 1
+        self._floor = self._clock
+        self._invalidated.clear()
+        self._entries.clear()
+
+    def record_latency(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        latencies = sorted(self._latencies)
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "lookup_ms_avg": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "lookup_ms_p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 3) if latencies else 0.0,
+        }
+
+    def _receive(self, data: str):
+        """Applies an invalidation message published by another replica."""
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or message.get("origin") == self._origin:
+            return
+        if message.get("all"):
+            self._reset()
+        else:
+            self._drop(message.get("product_ids") or [])
+
+    async def _listen(self):
+        pubsub = redis_client.client.pubsub()
+        await pubsub.subscribe(INVALIDATIONS)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._receive(message["data"])
+        finally:
+            await pubsub.aclose()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                # Entries written meanwhile by other replicas may be stale
+                logger.error(f"Stock cache invalidation listener failed: {ex}")
+                self._reset()
+                await asyncio.sleep(1)
+
+    async def _publish(self):
+        """Sends the products invalidated since the last message, one message per burst."""
+        while True:
+            await self._pending.wait()
+            self._pending.clear()
+            message = {"origin": self._origin}
+            if self._outgoing_all:
+                message["all"] = True
+            else:
+                message["product_ids"] = sorted(self._outgoing)
+            self._outgoing, self._outgoing_all = set(), False
+            try:
+                await redis_client.client.publish(INVALIDATIONS, json.dumps(message))
+            except Exception as ex:
+                # Other replicas serve these products until their entries expire
+                logger.error(f"Publishing stock cache invalidations failed: {ex}")
+
+    async def start(self):
+        if redis_client.client:
+            self._outgoing = set()
+            self._task = asyncio.create_task(self._run())
+            self._publisher = asyncio.create_task(self._publish())
+        else:
+            logger.warning("REDIS_URL not set; stock cache relies on its TTL for other replicas' writes")
+
+    async def stop(self):
+        for task in (self._task, self._publisher):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._outgoing = None
+
+cache = StockCache(settings.STOCK_CACHE_MAX_ENTRIES, settings.STOCK_CACHE_TTL_SECONDS)
+
+
+async def lookup(db: AsyncSession, product_ids: List[str]) -> Dict[str, int]:
+    """
+    Returns the stock of several products, reading only cache misses.
+
+    Misses are read in one query from Postgres, or with the `redis` strategy
+    in one HMGET from the ledger (which is ahead of Postgres there).
+
+    Returns:
+     Dict[str, int]: Stock per product; unknown products are absent.
+    """
+    started = time.perf_counter()
+    levels, missing = cache.get_many(product_ids)
+    if missing:
+        epoch = cache.epoch
+        if settings.RESERVE_STRATEGY == "redis":
+            fetched = await ledger.levels(missing)
+        else:
+            fetched = await stock.read_levels(db, missing)
+        cache.put(fetched, epoch)
+        levels.update(fetched)
+    cache.record_latency(time.perf_counter() - started)
+    return levels
@@ -13,5 +13,12 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str
     AUTH_SERVICE_URL: str
 
+    # Shared HTTP client pools (one per upstream service)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    HTTP2_ENABLED: bool = False
+
 
 settings = Settings()
@@ -0,0 +1,10 @@
+from http_client_lib import HttpClientPool
+from ..core.config import settings
+
+http_clients = HttpClientPool(
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    timeout=settings.HTTP_TIMEOUT_SECONDS,
+    http2=settings.HTTP2_ENABLED,
+)
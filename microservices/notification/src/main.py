@@ -7,6 +7,7 @@ from .services.telegram_bot import dp, bot
 from .services.consumer import notification_consumer
 from .api import ws
 from .core.redis_client import redis_client
+from .core.http_client import http_clients
 
 
 @asynccontextmanager
@@ -32,6 +33,7 @@ async def lifespan(app: FastAPI):
         bot_task.cancel()  # Or better stop polling gracefully
     if bot:
         await bot.session.close()
+    await http_clients.aclose()
     await redis_client.close()
 
 
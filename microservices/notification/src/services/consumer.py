@@ -80,7 +80,8 @@ async def notification_consumer():
                 elif msg_type == "order_update":
                     user_id = data.get("user_id")
                     status = data.get("status")
-                    text = f"Your order is now {status}"
+                    order_id = data.get("order_id")
+                    text = f"Your order #{order_id} is now {status}" if order_id else f"Your order is now {status}"
                     logging.info(f"Notifying user {user_id}: {status}")
                     await manager.send_personal_message(text, user_id)
 
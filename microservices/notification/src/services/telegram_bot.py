@@ -1,8 +1,8 @@
 import logging
-import httpx
 from aiogram import Bot, Dispatcher, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 from ..core.config import settings
+from ..core.http_client import http_clients
 
 bot = Bot(token=settings.TELEGRAM_BOT_TOKEN)
 dp = Dispatcher()
@@ -41,17 +41,17 @@ async def handle_contact(message: Message):
     logging.info(f"Recieved contact: {phone} for chat_id {chat_id}")
 
     # Call Auth Service Internal API
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{settings.AUTH_SERVICE_URL}/internal/users/bind-telegram",
-                json={"phone_number": phone, "chat_id": chat_id},
-            )
-            response.raise_for_status()
-            await message.answer(f"Phone: {phone} successfully linked! You can now request OTP on the website")
-        except Exception as ex:
-            logging.error(f"Failed to bind telegram user: {ex}")
-            await message.answer(f"Failed to link account. Please try again later.")
+    client = http_clients.client(settings.AUTH_SERVICE_URL)
+    try:
+        response = await client.post(
+            f"{settings.AUTH_SERVICE_URL}/internal/users/bind-telegram",
+            json={"phone_number": phone, "chat_id": chat_id},
+        )
+        response.raise_for_status()
+        await message.answer(f"Phone: {phone} successfully linked! You can now request OTP on the website")
+    except Exception as ex:
+        logging.error(f"Failed to bind telegram user: {ex}")
+        await message.answer(f"Failed to link account. Please try again later.")
 
 
 @dp.message(F.text == "/start")
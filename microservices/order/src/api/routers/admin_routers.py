@@ -1,40 +1,190 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import distinct, func, select
 from ...core.database import get_db
-from ...models.order import Order, OrderStatus
-from ...schemas.order import OrderResponse
+from ...core.http_client import breakers, http_clients
+from ...services import notifications, order_status, outbox
+from ...services.order_counts import counts
+from ...services.order_queue import workers
+from ...services.outbox import relay
+from ...services.pricing import prices
+from ...services.saga_recovery import recovery
+from ...models.order import STATUS_TRANSITIONS, Order, OrderItem, OrderStatus
+from ...schemas.order import BulkStatusResult, BulkStatusUpdate, OrderResponse, ProductSales
 from jwt_core_lib.dependencies import get_current_admin, TokenData
 from typing import List
 
 router = APIRouter()
 
 
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("/", response_model=List[OrderResponse])
 async def list_orders(
+        response: Response,
+        cursor: str | None = None,
         skip: int = 0,
-        limit: int = 100,
+        limit: int = Query(default=100, ge=1, le=1000),
         status: OrderStatus | None = None,
+        user_id: str | None = None,
         db: AsyncSession = Depends(get_db),
         admin: TokenData = Depends(get_current_admin)
 ):
     """
-    Retrieves a paginated list of all orders, optionally filtered by status.
+    Retrieves a paginated list of all orders, newest first, optionally filtered by status or user.
 
-    This endpoint is secured and accessible only by administrative users. It constructs
-    an asynchronous SQLAlchemy query, allowing filtering based on the OrderStatus enum.
+    This endpoint is secured and accessible only by administrative users. Pages are read
+    with keyset pagination (`WHERE id < :last ORDER BY id DESC LIMIT :n`) served by the
+    `(status, id)` and `(user_id, id)` indexes, so every page costs the same no matter how
+    deep it is. When more orders may follow, the opaque cursor for the next page is returned
+    in the `X-Next-Cursor` response header. `skip` (OFFSET) is still accepted for the first
+    request but gets slower the deeper it goes. Unless filtering by user, the approximate
+    number of matching orders is returned in the `X-Total-Count-Estimate` header (see
+    `order_counts.OrderCounts`).
 
     Arguments:
-     skip (int): The number of orders to skip (pagination offset). Defaults to 0.
-     limit (int): The maximum number of orders to return. Defaults to 100.
+     response (Response): The outgoing response (next-page cursor and count headers).
+     cursor (str | None): Cursor from a previous page's X-Next-Cursor header.
+     skip (int): The number of orders to skip (ignored with a cursor). Defaults to 0.
+     limit (int): The maximum number of orders to return (1-1000). Defaults to 100.
      status (OrderStatus | None): Optional filter to only return orders matching a specific status (e.g., 'SHIPPED').
+     user_id (str | None): Optional filter to only return the orders of one user.
      db (AsyncSession): The asynchronous database session dependency.
      admin (TokenData): Dependency ensuring the requester has valid administrator credentials.
 
     Returns:
      List[OrderResponse]: A list of order objects.
+
+    Raises:
+     HTTPException (400): If the cursor is malformed.
+    """
+    query = select(Order).order_by(Order.id.desc()).limit(limit)
+    if status:
+        query = query.where(Order.status == status)
+    if user_id:
+        query = query.where(Order.user_id == user_id)
+    if cursor:
+        query = query.where(Order.id < _decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
+
+    orders = (await db.execute(query)).scalars().all()
+    if len(orders) == limit:
+        response.headers["X-Next-Cursor"] = _encode_cursor(orders[-1].id)
+    if not user_id:
+        response.headers["X-Total-Count-Estimate"] = str(await counts.get(db, status))
+    return orders
+
+
+@router.get("/products/sales", response_model=List[ProductSales])
+async def product_sales(
+        limit: int = 20,
+        status: OrderStatus | None = None,
+        db: AsyncSession = Depends(get_db),
+        admin: TokenData = Depends(get_current_admin)
+):
+    """
+    Ranks products by revenue, aggregated over the normalized order lines.
+
+    Arguments:
+     limit (int): The maximum number of products to return. Defaults to 20.
+     status (OrderStatus | None): Optional filter to only count orders in this status (e.g. 'PAID').
+     db (AsyncSession): The asynchronous database session dependency.
+     admin (TokenData): Dependency ensuring the requester has valid administrator credentials.
+
+    Returns:
+     List[ProductSales]: Per product the number of orders, units sold and revenue
+      (lines of orders placed before price snapshots count as units only).
+    """
+    revenue = func.coalesce(func.sum(OrderItem.quantity * OrderItem.unit_price), 0.0)
+    query = (
+        select(
+            OrderItem.product_id,
+            func.count(distinct(OrderItem.order_id)).label("orders"),
+            func.sum(OrderItem.quantity).label("units"),
+            revenue.label("revenue"),
+        )
+        .group_by(OrderItem.product_id)
+        .order_by(revenue.desc())
+        .limit(limit)
+    )
+    if status:
+        query = query.join(Order, Order.id == OrderItem.order_id).where(Order.status == status)
+
+    result = await db.execute(query)
+    return [ProductSales(**row) for row in result.mappings()]
+
+
+@router.get("/products/{product_id}/sales", response_model=ProductSales)
+async def single_product_sales(
+        product_id: str,
+        status: OrderStatus | None = None,
+        db: AsyncSession = Depends(get_db),
+        admin: TokenData = Depends(get_current_admin)
+):
+    """
+    Aggregates the order lines of one product, found through the `product_id` index.
+
+    Arguments:
+     product_id (str): The product to aggregate.
+     status (OrderStatus | None): Optional filter to only count orders in this status (e.g. 'PAID').
+     db (AsyncSession): The asynchronous database session dependency.
+     admin (TokenData): Dependency ensuring the requester has valid administrator credentials.
+
+    Returns:
+     ProductSales: Number of orders, units sold and revenue (all 0 if never ordered).
+    """
+    query = (
+        select(
+            func.count(distinct(OrderItem.order_id)).label("orders"),
+            func.coalesce(func.sum(OrderItem.quantity), 0).label("units"),
+            func.coalesce(func.sum(OrderItem.quantity * OrderItem.unit_price), 0.0).label("revenue"),
+        )
+        .where(OrderItem.product_id == product_id)
+    )
+    if status:
+        query = query.join(Order, Order.id == OrderItem.order_id).where(Order.status == status)
+
+    row = (await db.execute(query)).mappings().one()
+    return ProductSales(product_id=product_id, **row)
+
+
+@router.get("/products/{product_id}/orders", response_model=List[OrderResponse])
+async def orders_with_product(
+        product_id: str,
+        skip: int = 0,
+        limit: int = 100,
+        status: OrderStatus | None = None,
+        db: AsyncSession = Depends(get_db),
+        admin: TokenData = Depends(get_current_admin)
+):
     """
-    query = select(Order).offset(skip).limit(limit)
+    Retrieves the orders containing a product, newest first.
+
+    Arguments:
+     product_id (str): The product the orders must contain.
+     skip (int): The number of orders to skip (pagination offset). Defaults to 0.
+     limit (int): The maximum number of orders to return. Defaults to 100.
+     status (OrderStatus | None): Optional filter on the order status.
+     db (AsyncSession): The asynchronous database session dependency.
+     admin (TokenData): Dependency ensuring the requester has valid administrator credentials.
+
+    Returns:
+     List[OrderResponse]: The matching orders.
+    """
+    containing = select(OrderItem.order_id).where(OrderItem.product_id == product_id)
+    query = select(Order).where(Order.id.in_(containing)).order_by(Order.id.desc()).offset(skip).limit(limit)
     if status:
         query = query.where(Order.status == status)
 
@@ -42,6 +192,34 @@ async def list_orders(
     return result.scalars().all()
 
 
+@router.get("/metrics")
+async def order_metrics(admin: TokenData = Depends(get_current_admin)):
+    """
+    Exposes in-process counters of the order service.
+
+    Arguments:
+     admin (TokenData): Validated admin token data.
+
+    Returns:
+     dict: Per-upstream HTTP client pool statistics (requests, requests that
+      found every connection busy, new connections and reuse ratio, open and
+      idle connections), circuit breaker states (windowed failure and
+      slow-call rates, times opened, rejected calls), the saga workers
+      (busy workers, completed, failed and abandoned sagas) and saga recovery
+      (interrupted sagas completed, compensated, failed and given up), the
+      price cache (fresh and stale hits, misses, catalog lookups) and the outbox
+      relay (published events and batches).
+    """
+    return {
+        "http_clients": http_clients.stats(),
+        "circuit_breakers": breakers.stats(),
+        "saga_workers": workers.stats(),
+        "saga_recovery": recovery.stats(),
+        "price_cache": prices.stats(),
+        "outbox": relay.stats(),
+    }
+
+
 @router.put("/{order_id}/status", response_model=OrderResponse)
 async def update_order_status(
         order_id: int,
@@ -75,3 +253,51 @@ async def update_order_status(
     await db.commit()
     await db.refresh(order)
     return order
+
+
+@router.post("/status/bulk", response_model=BulkStatusResult)
+async def bulk_update_order_status(
+        update_in: BulkStatusUpdate,
+        db: AsyncSession = Depends(get_db),
+        admin: TokenData = Depends(get_current_admin),
+):
+    """
+    Moves many orders to a new status at once (e.g. a carrier feed marking orders 'SHIPPED').
+
+    The orders are either listed explicitly or selected by filters. They are updated
+    with one `UPDATE ... RETURNING` per chunk in a single transaction, and only where
+    the transition is legal (see `STATUS_TRANSITIONS`); listed orders that could not
+    be moved are reported as rejected. Affected users then get their 'order_update'
+    notifications, recorded in the outbox in the same transaction and published by the
+    outbox relay in pipelined batches.
+
+    Arguments:
+     update_in (BulkStatusUpdate): The target status, and the order ids or filters.
+     db (AsyncSession): The asynchronous database session.
+     admin (TokenData): Dependency ensuring administrative access.
+
+    Returns:
+     BulkStatusResult: Number of updated orders and the rejected order ids.
+
+    Raises:
+     HTTPException (422): If no order may be moved to the target status, or neither
+      order ids nor a filter were given.
+    """
+    if update_in.status not in STATUS_TRANSITIONS:
+        raise HTTPException(status_code=422, detail=f"Orders cannot be moved to {update_in.status.value}")
+    if update_in.order_ids is None and update_in.current_status is None and update_in.user_id is None:
+        raise HTTPException(status_code=422, detail="Either order_ids or a filter is required")
+
+    updated = await order_status.bulk_transition(
+        db, update_in.status, update_in.order_ids, update_in.current_status, update_in.user_id
+    )
+    outbox.enqueue(db, [
+        notifications.order_update(order_id, user_id, update_in.status) for order_id, user_id in updated
+    ])
+    await db.commit()
+
+    rejected = []
+    if update_in.order_ids is not None:
+        updated_ids = {order_id for order_id, _ in updated}
+        rejected = [order_id for order_id in update_in.order_ids if order_id not in updated_ids]
+    return BulkStatusResult(status=update_in.status, updated=len(updated), rejected=rejected)
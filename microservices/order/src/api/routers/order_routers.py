@@ -1,13 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ...core.database import get_db
 from ...models.order import Order, OrderStatus
 from ...schemas.order import OrderCreate, OrderResponse
+from ...services import order_items, order_queue, pricing, saga_log
 from ...services.saga import SagaOrchestrator
 from jwt_core_lib.dependencies import get_current_user, TokenData
-import redis.asyncio as redis
-import json
 from ...core.config import settings
 
 router = APIRouter()
@@ -16,6 +15,7 @@ router = APIRouter()
 @router.post("/", response_model=OrderResponse)
 async def create_order(
         order_in: OrderCreate,
+        response: Response,
         db: AsyncSession = Depends(get_db),
         user: TokenData = Depends(get_current_user),
 ):
@@ -23,38 +23,72 @@ async def create_order(
     Creates an initial order record in the database and initiates the execution of a Saga.
 
     The function follows these critical steps:
-    1. Local Transaction: A new Order record is created in the local database with a PENDING status.
+    0. Pricing: Current catalog prices are snapshotted onto the items (one batch lookup
+       for the products not in the price cache) and summed into `total_amount`.
+    1. Local Transaction: A new Order record is created in the local database with a PENDING status,
+       together with its normalized `order_items` rows.
     2. Saga Execution: The SagaOrchestrator takes over, coordinating distributed transactions
        (e.g., reserving inventory, processing payment).
     3. Failure Handling: The Saga handles its own rollback. If the Saga fails, the Order
        status is updated (e.g., to FAILED) before being returned.
-    4. Notification: Upon successful completion of the Saga, an event is published to Redis
-       to notify admins and confirm the order with the user.
+    4. Notification: The outcome is recorded in the order outbox together with the final
+       status and relayed to Redis; on success a 'new_order' event notifies admins and
+       confirms the order with the user.
+
+    With ORDER_ASYNC_PLACEMENT the saga is not run inside the request: the order
+    is committed together with a queue job and answered with 202 Accepted while
+    still PENDING. A saga worker (see `order_queue.SagaWorkerPool`) runs it, and
+    the client follows it via GET /orders/{order_id} or the 'order_update'
+    WebSocket notification.
 
     Arguments:
      order_in (OrderCreate): The desired items and simulation flags for the new order.
+     response (Response): Used to answer 202 and point to the order in async mode.
      db (AsyncSession): The asynchronous database session for local transaction management.
      user (TokenData): Injected dependency containing the authenticated user's details (phone).
 
     Returns:
-     OrderResponse: The final order object, which will have a status of FAILED or COMPLETED
-      after the Saga execution.
+     OrderResponse: The final order object, which will have a status of PAID, CANCELED or
+      FAILED after the Saga execution (PENDING in async mode).
+
+    Raises:
+     HTTPException (422): If the catalog does not know some of the products.
+     HTTPException (503): If prices are not cached and the catalog is unavailable.
 
     Side Effects:
-     Starts a distributed transaction via SagaOrchestrator.
-     Publishes a 'new_order' event to the Redis 'notifications' channel upon success.
+     Starts a distributed transaction via SagaOrchestrator, or queues it.
+     Records 'order_update' and, upon success, 'new_order' events in the order outbox, in the saga's
+     final transaction; `outbox.OutboxRelay` publishes them to the Redis 'notifications' channel.
     """
-    # Create Local Order (Pending)
-    # Convert Pydantic items to dict list for JSON storage
-    items_json = [item.model_dump() for item in order_in.items]
+    # Convert Pydantic items to dict list for JSON storage, with the price paid per unit
+    try:
+        items_json, total_amount = await pricing.price_items([item.model_dump() for item in order_in.items])
+    except pricing.UnknownProducts as ex:
+        raise HTTPException(status_code=422, detail=str(ex))
+    except pricing.CatalogUnavailable:
+        raise HTTPException(status_code=503, detail="Catalog service unavailable")
 
+    # Create Local Order (Pending)
     order = Order(
         user_id=user.phone,
         status=OrderStatus.PENDING,
         items=items_json,
-        total_amount=0.0
+        total_amount=total_amount
     )
     db.add(order)
+    await db.flush()
+    order_items.add(db, order)
+    # Starts the saga log, so that recovery finds the order even if nothing else gets recorded
+    await saga_log.record(db, order.id, saga_log.CREATED)
+
+    if settings.ORDER_ASYNC_PLACEMENT:
+        order_queue.enqueue(db, order, order_in.simulate_failure)
+        await db.commit()
+        order_queue.workers.notify()
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers["Location"] = f"/orders/{order.id}"
+        return order
+
     await db.commit()
     await db.refresh(order)
 
@@ -62,23 +96,35 @@ async def create_order(
     saga = SagaOrchestrator(db, order)
     try:
         await saga.execute(simulate_failure=order_in.simulate_failure)
-
-        # Publish new order event for admins
-        if settings.REDIS_URL:
-            redis_client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
-            event = {
-                "type": "new_order",
-                "order_id": order.id,
-                "user_id": order.user_id,
-                "amount": order.total_amount
-            }
-            await redis_client.publish("notifications", json.dumps(event))
-            await redis_client.close()
-
-    except Exception as ex:
+    except Exception:
         # Saga has already handled rollback and status update
-        await db.refresh(order)
-        return order
+        pass
 
     await db.refresh(order)
     return order
+
+
+@router.get("/{order_id}", response_model=OrderResponse)
+async def get_order(
+        order_id: int,
+        db: AsyncSession = Depends(get_db),
+        user: TokenData = Depends(get_current_user),
+):
+    """
+    Returns one of the current user's orders, e.g. to poll an order accepted with 202.
+
+    Arguments:
+     order_id (int): The unique identifier of the order.
+     db (AsyncSession): The asynchronous database session.
+     user (TokenData): The authenticated user; only their own orders are visible.
+
+    Returns:
+     OrderResponse: The order with its current status.
+
+    Raises:
+     HTTPException (404): If the order does not exist or belongs to another user.
+    """
+    order = await db.get(Order, order_id)
+    if not order or order.user_id != user.phone:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
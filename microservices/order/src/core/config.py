@@ -12,8 +12,70 @@ class Settings(BaseSettings):
     ELASTICSEARCH_URL: str
     INVENTORY_SERVICE_URL: str
     PAYMENT_SERVICE_URL: str
+    CATALOG_SERVICE_URL: str = "http://service_a:8000/products"
     JWT_SECRET: str
     SECRET_KEY: str
 
+    # Cache of catalog prices: fresh for TTL, then served stale while refreshed
+    PRICE_CACHE_TTL_SECONDS: float = 60.0
+    PRICE_CACHE_STALE_SECONDS: float = 600.0
+    PRICE_CACHE_MAX_ENTRIES: int = 10000
+
+    # How long approximate order counts of admin listings are cached
+    ORDER_COUNT_CACHE_SECONDS: float = 60.0
+
+    # Orders updated per statement by bulk admin status changes
+    BULK_STATUS_CHUNK_SIZE: int = 1000
+
+    # Relay of the order event outbox to the notification service
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_POLL_INTERVAL_MS: int = 100
+
+    # Whether the inventory service keeps reservation holds (False when it runs
+    # RESERVE_STRATEGY=redis): without them, releasing stock the saga cannot prove
+    # it reserved would add phantom stock, so such releases are skipped
+    INVENTORY_HOLDS_ENABLED: bool = True
+    # Lifetime of the saga's stock holds; must outlast the worst-case recovery delay
+    SAGA_HOLD_SECONDS: int = 900
+
+    # Upper bound on concurrent per-item inventory calls of one saga
+    SAGA_MAX_CONCURRENCY: int = 10
+
+    # Deadline of API requests (X-Request-Deadline) and time budgets of the saga steps
+    REQUEST_DEADLINE_SECONDS: float = 10.0
+    SAGA_RESERVE_TIMEOUT_SECONDS: float = 3.0
+    SAGA_PAYMENT_TIMEOUT_SECONDS: float = 5.0
+    SAGA_CONFIRM_TIMEOUT_SECONDS: float = 2.0
+    SAGA_COMPENSATE_TIMEOUT_SECONDS: float = 5.0
+
+    # Answer order placement with 202 and run sagas on background workers
+    ORDER_ASYNC_PLACEMENT: bool = False
+    SAGA_WORKERS: int = 16
+    ORDER_JOB_POLL_INTERVAL_SECONDS: float = 0.5
+    ORDER_JOB_LEASE_SECONDS: int = 60
+    ORDER_JOB_MAX_ATTEMPTS: int = 5
+
+    # Recovery of sagas interrupted by a crash (must exceed the longest saga)
+    SAGA_RECOVERY_AFTER_SECONDS: int = 300
+    SAGA_RECOVERY_INTERVAL_SECONDS: float = 30.0
+    SAGA_RECOVERY_BATCH_SIZE: int = 50
+    SAGA_RECOVERY_MAX_ATTEMPTS: int = 5
+
+    # Shared HTTP client pools (one per upstream service)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_TIMEOUT_SECONDS: float = 10.0
+    HTTP2_ENABLED: bool = False
+
+    # Process-wide circuit breakers per upstream (sliding window of recent calls)
+    BREAKER_WINDOW_SIZE: int = 20
+    BREAKER_MIN_CALLS: int = 10
+    BREAKER_FAILURE_RATE: float = 0.5
+    BREAKER_SLOW_CALL_RATE: float = 0.8
+    BREAKER_SLOW_CALL_SECONDS: float = 2.0
+    BREAKER_OPEN_SECONDS: float = 30.0
+    BREAKER_HALF_OPEN_PROBES: int = 3
+
 
 settings = Settings()
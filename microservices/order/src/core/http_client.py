@@ -0,0 +1,20 @@
+from http_client_lib import BreakerRegistry, HttpClientPool
+from ..core.config import settings
+
+http_clients = HttpClientPool(
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    timeout=settings.HTTP_TIMEOUT_SECONDS,
+    http2=settings.HTTP2_ENABLED,
+)
+
+breakers = BreakerRegistry(
+    window_size=settings.BREAKER_WINDOW_SIZE,
+    min_calls=settings.BREAKER_MIN_CALLS,
+    failure_rate=settings.BREAKER_FAILURE_RATE,
+    slow_call_rate=settings.BREAKER_SLOW_CALL_RATE,
+    slow_call_seconds=settings.BREAKER_SLOW_CALL_SECONDS,
+    open_seconds=settings.BREAKER_OPEN_SECONDS,
+    half_open_probes=settings.BREAKER_HALF_OPEN_PROBES,
+)
@@ -1,18 +1,48 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
+from sqlalchemy import text
 from .core.config import  settings
 
 from .api.routers import order_routers
 from .core.database import engine, Base
+from .core.http_client import http_clients
+from .models.order import Order
+from http_client_lib import DeadlineMiddleware
+from .services import order_items, outbox
+from .services.order_queue import workers
+from .services.pricing import prices
+from .services.saga_recovery import recovery
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips existing tables, so add indexes introduced since then
+        for index in Order.__table__.indexes:
+            await conn.run_sync(index.create, checkfirst=True)
+        # Superseded by ix_orders_user_id_id (user_id is its leading column)
+        await conn.execute(text("DROP INDEX IF EXISTS ix_orders_user_id"))
+    await order_items.backfill()
+    await recovery.start()
+    await outbox.relay.start()
+    if settings.ORDER_ASYNC_PLACEMENT:
+        await workers.start()
     yield
+    await workers.stop()
+    await recovery.stop()
+    await outbox.relay.stop()
+    await prices.close()
+    await http_clients.aclose()
+    await outbox.close()
 
 app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
+# Bound every request; the grace period lets a timed-out saga still compensate
+app.add_middleware(
+    DeadlineMiddleware,
+    default_timeout=settings.REQUEST_DEADLINE_SECONDS,
+    grace=settings.SAGA_COMPENSATE_TIMEOUT_SECONDS,
+)
 
 app.include_router(order_routers.router, prefix="/orders", tags=["Orders"])
 from .api.routers import admin_routers
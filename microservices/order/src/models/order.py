@@ -1,6 +1,7 @@
+from datetime import datetime
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import String
+from sqlalchemy import DateTime, ForeignKey, Index, String, UniqueConstraint, func
 import enum
 from ..core.database import Base
 
@@ -14,13 +15,97 @@ class OrderStatus(str, enum.Enum):
     FAILED = "FAILED"
 
 
+# Statuses an admin may move an order out of, per target status. PENDING
+# orders belong to their running saga and PAID is only reached through it.
+STATUS_TRANSITIONS = {
+    OrderStatus.SHIPPED: (OrderStatus.PAID,),
+    OrderStatus.CANCELED: (OrderStatus.PAID,),
+}
+
+
 class Order(Base):
     """SQLAlchemy model for customer orders."""
 
     __tablename__ = "orders"
+    # Keyset pagination of admin listings per status or per user, newest first
+    __table_args__ = (
+        Index("ix_orders_status_id", "status", "id"),
+        Index("ix_orders_user_id_id", "user_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    user_id: Mapped[str] = mapped_column(index=True, nullable=False)
+    user_id: Mapped[str] = mapped_column(nullable=False)
     status: Mapped[OrderStatus] = mapped_column(String, default=OrderStatus.PENDING)
     items: Mapped[dict] = mapped_column(JSONB, nullable=False, default={})
     total_amount: Mapped[float] = mapped_column(default=0.0)
+
+
+class OrderItem(Base):
+    """
+    One line of an order, normalized out of `Order.items` for querying.
+
+    Written in the same transaction as the order; `Order.items` stays the
+    document returned by the API, while these rows back lookups and sales
+    aggregates by product. `unit_price` is NULL for orders placed before
+    prices were snapshotted.
+    """
+
+    __tablename__ = "order_items"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id", ondelete="CASCADE"), index=True)
+    product_id: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    quantity: Mapped[int] = mapped_column(nullable=False)
+    unit_price: Mapped[float | None] = mapped_column(nullable=True)
+
+
+class OutboxEvent(Base):
+    """
+    Order event waiting to be published to Redis (transactional outbox).
+
+    Written in the same transaction as the order change it describes, then
+    published and deleted by the background relay.
+    """
+
+    __tablename__ = "order_outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    channel: Mapped[str] = mapped_column(nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class OrderJob(Base):
+    """
+    Durable queue entry of an order whose saga still has to run.
+
+    A worker claims the job by pushing `available_at` one lease into the
+    future and deletes it once the order left PENDING; a job whose worker
+    died becomes available again when the lease runs out.
+    """
+
+    __tablename__ = "order_jobs"
+
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id", ondelete="CASCADE"), primary_key=True)
+    simulate_failure: Mapped[bool] = mapped_column(default=False)
+    attempts: Mapped[int] = mapped_column(default=0)
+    available_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class SagaStep(Base):
+    """
+    Durable log of the saga steps an order completed.
+
+    One row per (order, step); recording a step again refreshes `recorded_at`
+    and its payload. The log outlives the process running the saga, so an
+    interrupted saga can be resumed or compensated by any replica.
+    """
+
+    __tablename__ = "saga_steps"
+    __table_args__ = (UniqueConstraint("order_id", "step", name="uq_saga_steps_order_step"),)
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id", ondelete="CASCADE"), index=True)
+    step: Mapped[str] = mapped_column(String, nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False, default={})
+    recorded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
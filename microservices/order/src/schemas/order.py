@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from ..models.order import OrderStatus
 
 
@@ -22,3 +22,26 @@ class OrderResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class ProductSales(BaseModel):
+    product_id: str
+    orders: int
+    units: int
+    revenue: float
+
+
+class BulkStatusUpdate(BaseModel):
+    status: OrderStatus
+    # Either explicit orders...
+    order_ids: Optional[List[int]] = Field(default=None, max_length=100_000)
+    # ...or every order matching these filters
+    current_status: Optional[OrderStatus] = None
+    user_id: Optional[str] = None
+
+
+class BulkStatusResult(BaseModel):
+    status: OrderStatus
+    updated: int
+    # Requested orders that do not exist or cannot move to the target status
+    rejected: List[int] = []
@@ -0,0 +1,26 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.order import Order, OrderStatus
+from . import outbox
+
+
+def order_update(order_id: int, user_id: str, status: OrderStatus) -> dict:
+    """'order_update' event telling a user their order changed status."""
+    return {"type": "order_update", "order_id": order_id, "user_id": user_id, "status": status}
+
+
+def order_finished(db: AsyncSession, order: Order):
+    """
+    Records the saga's outcome for the user and, on success, the new order for admins.
+
+    The events go to the outbox in the caller's transaction, so they are sent
+    (by `outbox.OutboxRelay`) if and only if the final order status commits.
+    """
+    events = [order_update(order.id, order.user_id, order.status)]
+    if order.status == OrderStatus.PAID:
+        events.append({
+            "type": "new_order",
+            "order_id": order.id,
+            "user_id": order.user_id,
+            "amount": order.total_amount,
+        })
+    outbox.enqueue(db, events)
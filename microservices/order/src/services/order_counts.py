@@ -0,0 +1,73 @@
+import time
+from typing import Dict, Tuple
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..models.order import Order, OrderStatus
+
+# Below this many rows an exact COUNT(*) is cheap and more useful than an estimate
+EXACT_BELOW = 10_000
+
+_STATISTICS = text(
+    """
+    SELECT c.reltuples::bigint AS total,
+           s.most_common_vals::text::text[] AS statuses,
+           s.most_common_freqs AS freqs
+    FROM pg_class c
+    LEFT JOIN pg_stats s
+      ON s.schemaname = current_schema() AND s.tablename = c.relname AND s.attname = 'status'
+    WHERE c.oid = to_regclass('orders')
+    """
+)
+
+
+class OrderCounts:
+    """
+    Approximate number of orders, overall and per status, for admin listings.
+
+    Estimates come from the planner statistics (`pg_class.reltuples` times
+    the status' frequency in `pg_stats`), so they cost two catalog lookups
+    instead of a `COUNT(*)` over millions of rows, and are as fresh as the
+    last (auto)ANALYZE. Tables without statistics yet, or small enough, are
+    counted exactly. Results are cached per status for `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._counts: Dict[str | None, Tuple[int, float]] = {}
+
+    async def _estimate(self, db: AsyncSession, status: OrderStatus | None) -> int:
+        row = (await db.execute(_STATISTICS)).first()
+        if row is not None and row.total >= EXACT_BELOW:
+            if status is None:
+                return row.total
+            if row.statuses is not None:
+                freqs = dict(zip(row.statuses, row.freqs))
+                return round(row.total * freqs.get(status.value, 0.0))
+
+        query = select(func.count()).select_from(Order)
+        if status is not None:
+            query = query.where(Order.status == status)
+        return await db.scalar(query)
+
+    async def get(self, db: AsyncSession, status: OrderStatus | None = None) -> int:
+        """
+        Returns the (approximate) number of orders, optionally in one status.
+
+        Arguments:
+         db (AsyncSession): Session used on a cache miss.
+         status (OrderStatus | None): Only count orders in this status.
+
+        Returns:
+         int: The cached or freshly estimated count.
+        """
+        now = time.monotonic()
+        entry = self._counts.get(status)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        count = await self._estimate(db, status)
+        self._counts[status] = (count, now + self.ttl)
+        return count
+
+
+counts = OrderCounts(settings.ORDER_COUNT_CACHE_SECONDS)
@@ -0,0 +1,88 @@
+import logging
+from sqlalchemy import Float, Integer, String, column, exists, func, join, select, true
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.database import AsyncSessionLocal
+from ..models.order import Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant identifying the backfill's advisory lock
+BACKFILL_LOCK_KEY = 0x0D3E_171E
+
+
+def add(db: AsyncSession, order: Order):
+    """
+    Adds the normalized lines of a flushed order in the caller's transaction.
+
+    Arguments:
+     db (AsyncSession): The session holding the new order.
+     order (Order): The order, with `items` as stored in its JSONB column.
+    """
+    db.add_all([
+        OrderItem(
+            order_id=order.id,
+            product_id=item["product_id"],
+            quantity=item["quantity"],
+            unit_price=item.get("unit_price"),
+        )
+        for item in order.items
+    ])
+
+
+def _backfill_needed():
+    """
+    Selects an order that predates the first order with lines, if any.
+
+    Orders get their lines in the transaction inserting them and the backfill
+    is a single statement, so only orders older than the oldest line can lack
+    lines (or have none to add, if their items are empty). Once backfilled
+    this reads only those orders, unlike the anti-join over every order.
+    """
+    # Without any line yet, every order counts; one bound keeps it a primary key range scan
+    first_line = func.coalesce(
+        select(func.min(OrderItem.order_id)).scalar_subquery(),
+        select(func.max(Order.id) + 1).scalar_subquery(),
+    )
+    return (
+        select(Order.id)
+        .where(Order.id < first_line, func.jsonb_array_length(Order.items) > 0)
+        .limit(1)
+    )
+
+
+async def backfill() -> int:
+    """
+    Normalizes the items of orders placed before `order_items` existed.
+
+    Unpacks the JSONB items of every order without lines in one
+    INSERT ... SELECT. A transaction-scoped advisory lock keeps replicas
+    starting together from inserting the same lines twice. Runs at every
+    startup, so it returns right away once no order predates the lines.
+
+    Returns:
+     int: Number of lines inserted (0 if there was nothing to backfill or
+     another replica holds the lock).
+    """
+    lines = (
+        func.jsonb_to_recordset(Order.items)
+        .table_valued(column("product_id", String), column("quantity", Integer), column("unit_price", Float))
+        .render_derived(name="line", with_types=True)
+    )
+    missing = (
+        select(Order.id, lines.c.product_id, lines.c.quantity, lines.c.unit_price)
+        .select_from(join(Order, lines, true()))
+        .where(~exists().where(OrderItem.order_id == Order.id))
+    )
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(_backfill_needed()) is None:
+            return 0
+        if not await db.scalar(select(func.pg_try_advisory_xact_lock(BACKFILL_LOCK_KEY))):
+            return 0
+        result = await db.execute(
+            insert(OrderItem).from_select(["order_id", "product_id", "quantity", "unit_price"], missing)
+        )
+        await db.commit()
+    if result.rowcount:
+        logger.warning(f"Backfilled {result.rowcount} order items")
+    return result.rowcount
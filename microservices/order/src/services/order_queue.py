@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import List, Set
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.order import Order, OrderJob, OrderStatus
+from . import notifications, saga_log
+from .saga import SagaOrchestrator
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(db: AsyncSession, order: Order, simulate_failure: bool = False):
+    """
+    Queues the saga of a flushed PENDING order, in the caller's transaction.
+
+    Committing the order and its job together means an accepted order is
+    never lost, even if the process dies right after answering 202.
+    """
+    db.add(OrderJob(order_id=order.id, simulate_failure=simulate_failure))
+
+
+async def claim(db: AsyncSession, limit: int) -> List[OrderJob]:
+    """
+    Leases up to `limit` available jobs, oldest first.
+
+    Jobs are picked with `FOR UPDATE SKIP LOCKED`, so concurrent claims (other
+    replicas) get disjoint jobs without waiting on each other.
+    """
+    available = (
+        select(OrderJob.order_id)
+        .where(OrderJob.available_at <= func.now())
+        .order_by(OrderJob.available_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = (
+        update(OrderJob)
+        .where(OrderJob.order_id.in_(available.scalar_subquery()))
+        .values(
+            available_at=func.now() + timedelta(seconds=settings.ORDER_JOB_LEASE_SECONDS),
+            attempts=OrderJob.attempts + 1,
+        )
+        .returning(OrderJob)
+    )
+    jobs = list((await db.execute(stmt)).scalars())
+    await db.commit()
+    return jobs
+
+
+class SagaWorkerPool:
+    """
+    Runs queued order sagas on up to SAGA_WORKERS concurrent tasks.
+
+    A dispatcher claims as many jobs as there are idle workers, waking up
+    when a job is queued in this process or after ORDER_JOB_POLL_INTERVAL_SECONDS
+    (jobs of other replicas, expired leases). Each job runs the saga in its
+    own session (the saga records the outcome for the notification service)
+    and is then deleted. Sagas are idempotent towards the inventory service, so a
+    job re-run after a crash simply runs the saga again, unless its log shows
+    it was already paid: then it is only completed (`SagaOrchestrator.recover`).
+    After ORDER_JOB_MAX_ATTEMPTS the order is marked FAILED (its stock holds
+    expire on their own).
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._task: asyncio.Task | None = None
+        self._running: Set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self.completed = 0
+        self.failed = 0
+        self.abandoned = 0
+
+    def notify(self):
+        """Wakes the dispatcher after a job was committed."""
+        self._wake.set()
+
+    async def _process(self, job: OrderJob):
+        async with AsyncSessionLocal() as db:
+            order = await db.get(Order, job.order_id)
+            if order is not None and order.status == OrderStatus.PENDING:
+                if job.attempts > settings.ORDER_JOB_MAX_ATTEMPTS:
+                    logger.error(f"Giving up on order {order.id} after {job.attempts - 1} attempts")
+                    order.status = OrderStatus.FAILED
+                    notifications.order_finished(db, order)
+                    await db.commit()
+                    self.abandoned += 1
+                else:
+                    saga = SagaOrchestrator(db, order)
+                    steps = await saga_log.steps(db, order.id) if job.attempts > 1 else {}
+                    try:
+                        if saga_log.PAID in steps:
+                            await saga.recover(steps)
+                        else:
+                            await saga.execute(simulate_failure=job.simulate_failure)
+                        self.completed += 1
+                    except Exception:
+                        # The saga rolled back and cancelled the order itself
+                        self.failed += 1
+                    await db.refresh(order)
+
+            if order is None or order.status != OrderStatus.PENDING:
+                await db.execute(delete(OrderJob).where(OrderJob.order_id == job.order_id))
+                await db.commit()
+
+    async def _dispatch(self):
+        while True:
+            self._wake.clear()
+            idle = self.workers - len(self._running)
+            jobs = []
+            if idle > 0:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        jobs = await claim(db, idle)
+                except Exception as ex:
+                    logger.error(f"Claiming order jobs failed: {ex}")
+            for job in jobs:
+                task = asyncio.create_task(self._process(job))
+                self._running.add(task)
+                task.add_done_callback(self._finished)
+            if len(jobs) < idle or idle <= 0:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.ORDER_JOB_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Order job failed: {task.exception()}")
+        self._wake.set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": len(self._running),
+            "completed": self.completed,
+            "failed": self.failed,
+            "abandoned": self.abandoned,
+        }
+
+    async def start(self):
+        self._task = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        """Stops claiming and lets running sagas finish."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+
+workers = SagaWorkerPool(settings.SAGA_WORKERS)
@@ -0,0 +1,75 @@
+from typing import List, Sequence, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..models.order import STATUS_TRANSITIONS, Order, OrderStatus
+
+
+def _transition(target: OrderStatus, sources: Sequence[OrderStatus]):
+    return (
+        update(Order)
+        .where(Order.status.in_(sources))
+        .values(status=target)
+        .returning(Order.id, Order.user_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def bulk_transition(
+        db: AsyncSession,
+        target: OrderStatus,
+        order_ids: List[int] | None = None,
+        current_status: OrderStatus | None = None,
+        user_id: str | None = None,
+) -> List[Tuple[int, str]]:
+    """
+    Moves many orders to `target` with one UPDATE ... RETURNING per chunk.
+
+    Only orders whose current status may legally move to `target` (see
+    `STATUS_TRANSITIONS`) are updated; the check is part of the statement's
+    WHERE clause, so concurrent changes cannot slip an illegal transition in.
+    Explicit `order_ids` are updated in chunks of BULK_STATUS_CHUNK_SIZE;
+    otherwise every order matching the filters is, walking the primary key
+    one chunk of candidate ids at a time until no candidates are left.
+    Nothing is committed.
+
+    Arguments:
+     db (AsyncSession): The session to run the updates in.
+     target (OrderStatus): The new status.
+     order_ids (List[int] | None): The orders to update.
+     current_status (OrderStatus | None): Without ids, only update orders in this status.
+     user_id (str | None): Without ids, only update the orders of this user.
+
+    Returns:
+     List[Tuple[int, str]]: Id and user of every updated order.
+    """
+    sources = [status for status in STATUS_TRANSITIONS.get(target, ()) if current_status in (None, status)]
+    if not sources:
+        return []
+    chunk_size = settings.BULK_STATUS_CHUNK_SIZE
+    updated = []
+
+    if order_ids is not None:
+        for start in range(0, len(order_ids), chunk_size):
+            chunk = order_ids[start:start + chunk_size]
+            result = await db.execute(_transition(target, sources).where(Order.id.in_(chunk)))
+            updated.extend(result.tuples())
+        return updated
+
+    last_id = 0
+    while True:
+        candidates = (
+            select(Order.id)
+            .where(Order.status.in_(sources), Order.id > last_id)
+            .order_by(Order.id)
+            .limit(chunk_size)
+        )
+        if user_id is not None:
+            candidates = candidates.where(Order.user_id == user_id)
+        ids = list((await db.execute(candidates)).scalars())
+        if not ids:
+            return updated
+        # Candidates whose status changed meanwhile are filtered out by the update
+        result = await db.execute(_transition(target, sources).where(Order.id.in_(ids)))
+        updated.extend(result.tuples())
+        last_id = ids[-1]
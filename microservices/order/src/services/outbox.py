@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+from typing import List
+import redis.asyncio as redis
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.order import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS = "notifications"
+
+# Arbitrary constant identifying the relay's advisory lock
+RELAY_LOCK_KEY = 0x0D3E_0B0C
+
+_client: redis.Redis | None = None
+
+
+def client() -> redis.Redis:
+    """The process-wide Redis connection pool used for publishing."""
+    global _client
+    if _client is None:
+        _client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    return _client
+
+
+def enqueue(db: AsyncSession, events: List[dict]):
+    """
+    Records events for the 'notifications' channel in the caller's transaction.
+
+    Nothing is sent here: an event becomes visible to the relay only if the
+    order change it describes commits, and it survives a crash right after.
+    Without REDIS_URL nothing is recorded, as nothing would ever relay it.
+
+    Arguments:
+     db (AsyncSession): The session holding the order change.
+     events (List[dict]): The events, as published.
+    """
+    if not settings.REDIS_URL:
+        return
+    db.add_all([OutboxEvent(channel=NOTIFICATIONS, payload=event) for event in events])
+
+
+class OutboxRelay:
+    """
+    Background publisher draining the order outbox.
+
+    Each round takes the OUTBOX_BATCH_SIZE committed events with the lowest
+    ids, publishes them through one pipeline on the pooled Redis connection
+    and deletes them in the same transaction. A transaction-scoped advisory
+    lock keeps a single relay active across replicas, so events are published
+    in id (insert) order; an event whose transaction commits late may still
+    follow events with higher ids. Delivery is at-least-once: a crash after
+    publishing re-sends the batch.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.published = 0
+        self.batches = 0
+
+    async def drain_once(self) -> int:
+        """
+        Publishes and deletes one batch of outbox events.
+
+        Returns:
+         int: Number of events published (0 if idle or another relay holds the lock).
+        """
+        async with AsyncSessionLocal() as db:
+            if not await db.scalar(select(func.pg_try_advisory_xact_lock(RELAY_LOCK_KEY))):
+                return 0
+
+            events = list((await db.execute(
+                select(OutboxEvent).order_by(OutboxEvent.id).limit(settings.OUTBOX_BATCH_SIZE)
+            )).scalars())
+            if not events:
+                return 0
+
+            async with client().pipeline(transaction=False) as pipe:
+                for event in events:
+                    pipe.publish(event.channel, json.dumps(event.payload))
+                await pipe.execute()
+
+            await db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([event.id for event in events])))
+            await db.commit()
+
+        self.published += len(events)
+        self.batches += 1
+        return len(events)
+
+    async def _run(self):
+        interval = settings.OUTBOX_POLL_INTERVAL_MS / 1000
+        while True:
+            try:
+                if await self.drain_once() < settings.OUTBOX_BATCH_SIZE:
+                    await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error(f"Outbox relay failed: {ex}")
+                await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {"published": self.published, "batches": self.batches}
+
+    async def start(self):
+        if settings.REDIS_URL:
+            self._task = asyncio.create_task(self._run())
+        else:
+            logger.warning("REDIS_URL not set; order outbox relay not started")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+relay = OutboxRelay()
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
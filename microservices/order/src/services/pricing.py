@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+from http_client_lib import deadline
+from ..core.config import settings
+from ..core.http_client import breakers, http_clients
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownProducts(Exception):
+    """Raised when the catalog does not know some of the priced products."""
+
+    def __init__(self, product_ids: List[str]):
+        super().__init__(f"Unknown products: {', '.join(product_ids)}")
+        self.product_ids = product_ids
+
+
+class CatalogUnavailable(Exception):
+    """Raised when prices are neither cached nor obtainable from the catalog."""
+
+
+class PriceCache:
+    """
+    In-process price cache with stale-while-revalidate.
+
+    A price younger than `ttl` is served as is. An older one is still served
+    for up to `stale` more seconds, while a background refresh fetches it
+    again (at most one refresh per product in flight), so a cart of cached
+    products never waits on the catalog. Only products without a usable price
+    are fetched in the request, all with a single batch call together with
+    the stale ones. If the catalog fails, stale prices keep being served
+    until they expire.
+    """
+
+    def __init__(self, ttl: float, stale: float, max_entries: int):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._prices: Dict[str, Tuple[float, float]] = {}
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    async def _fetch(self, product_ids: List[str]) -> Tuple[Dict[str, float], List[str]]:
+        url = f"{settings.CATALOG_SERVICE_URL}/prices"
+        client = http_clients.client(url)
+
+        async def lookup():
+            response = await client.post(url, json={"product_ids": product_ids}, headers=deadline.headers())
+            response.raise_for_status()
+            return response.json()
+
+        self.fetches += 1
+        try:
+            body = await breakers.get("catalog").call(lookup)
+        except Exception:
+            self.fetch_errors += 1
+            raise
+        fetched_at = time.monotonic()
+        for product_id, price in body["prices"].items():
+            self._prices[product_id] = (price, fetched_at)
+        if len(self._prices) > self.max_entries:
+            # Drop the oldest entries; a full sort is fine at this rate
+            oldest = sorted(self._prices, key=lambda pid: self._prices[pid][1])
+            for product_id in oldest[:len(self._prices) - self.max_entries]:
+                del self._prices[product_id]
+        return body["prices"], body["missing"]
+
+    async def _refresh(self, product_ids: List[str]):
+        try:
+            # Outlives the request that triggered it, so drop its deadline
+            async with deadline.budget(None, detached=True):
+                await self._fetch(product_ids)
+        except Exception as ex:
+            logger.warning(f"Background price refresh failed: {ex}")
+        finally:
+            self._refreshing.difference_update(product_ids)
+
+    def _revalidate(self, product_ids: List[str]):
+        product_ids = [pid for pid in product_ids if pid not in self._refreshing]
+        if not product_ids:
+            return
+        self._refreshing.update(product_ids)
+        task = asyncio.create_task(self._refresh(product_ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def get_many(self, product_ids: Iterable[str]) -> Dict[str, float]:
+        """
+        Returns the price of every product, fetching at most once from the catalog.
+
+        Raises:
+         UnknownProducts: If the catalog does not know some of the products.
+         CatalogUnavailable: If some prices are not cached and the catalog failed.
+        """
+        now = time.monotonic()
+        prices, stale, missing = {}, [], []
+        for product_id in dict.fromkeys(product_ids):
+            entry = self._prices.get(product_id)
+            age = None if entry is None else now - entry[1]
+            if age is None or age >= self.ttl + self.stale:
+                missing.append(product_id)
+                continue
+            prices[product_id] = entry[0]
+            if age >= self.ttl:
+                stale.append(product_id)
+        self.misses += len(missing)
+        self.stale_hits += len(stale)
+        self.hits += len(prices) - len(stale)
+
+        if not missing:
+            self._revalidate(stale)
+            return prices
+
+        # Fetching anyway: revalidate the stale prices in the same call
+        try:
+            fetched, unknown = await self._fetch(missing + [pid for pid in stale if pid not in self._refreshing])
+        except Exception as ex:
+            raise CatalogUnavailable(f"Could not fetch prices: {ex}") from ex
+        unknown = [pid for pid in unknown if pid in missing]
+        if unknown:
+            raise UnknownProducts(unknown)
+        prices.update(fetched)
+        return prices
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._prices),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+        }
+
+    async def close(self):
+        """Waits for background refreshes to settle."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+prices = PriceCache(settings.PRICE_CACHE_TTL_SECONDS, settings.PRICE_CACHE_STALE_SECONDS,
+                    settings.PRICE_CACHE_MAX_ENTRIES)
+
+
+async def price_items(items: List[dict]) -> Tuple[List[dict], float]:
+    """
+    Snapshots the current unit price onto every order item.
+
+    Arguments:
+     items (List[dict]): Order items with `product_id` and `quantity`.
+
+    Returns:
+     Tuple[List[dict], float]: The items with `unit_price` added, and the order total.
+
+    Raises:
+     UnknownProducts, CatalogUnavailable: See `PriceCache.get_many`.
+    """
+    unit_prices = await prices.get_many(item["product_id"] for item in items)
+    priced = [{**item, "unit_price": unit_prices[item["product_id"]]} for item in items]
+    total = round(sum(item["unit_price"] * item["quantity"] for item in priced), 2)
+    return priced, total
@@ -1,10 +1,12 @@
 import httpx
 import logging
 import asyncio
-import time
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.order import Order, OrderStatus
 from ..core.config import settings
+from ..core.http_client import breakers, http_clients
+from http_client_lib import deadline
+from . import notifications, saga_log
 
 INVENTORY_SERVICE_URL = settings.INVENTORY_SERVICE_URL
 PAYMENT_SERVICE_URL = settings.PAYMENT_SERVICE_URL
@@ -12,68 +14,46 @@ PAYMENT_SERVICE_URL = settings.PAYMENT_SERVICE_URL
 logger = logging.getLogger(__name__)
 
 
-class CircuitBreakerOpen(Exception):
-    """Raised when a circuit breaker is open and rejects calls."""
+class InventoryRejected(Exception):
+    """The inventory service answered but refused the request (4xx), e.g. insufficient stock."""
 
 
-class AsyncCircuitBreaker:
-    """
-    Implements a minimal, thread-safe asynchronous Circuit Breaker pattern.
+class PaymentDeclined(Exception):
+    """The payment was refused for this order (e.g. declined card), not a payment outage."""
 
-    It tracks consecutive failures for a wrapped coroutine. Once the failure count
-    exceeds `max_failures`, the circuit opens, immediately rejecting new calls
-    until `reset_timeout` has elapsed.
 
-    Arguments:
-     max_failures (int): The number of consecutive exceptions required to switch
-      the state from CLOSED to OPEN. Defaults to 3.
-     reset_timeout (float): The duration in seconds the circuit remains OPEN
-      before transitioning to HALF_OPEN to attempt a probe call. Defaults to 30.0.
+def _call_failed(response: httpx.Response, message: str) -> Exception:
     """
+    Error for a non-200 inventory response.
 
-    def __init__(self, max_failures: int = 3, reset_timeout: float = 30.0):
-        self.max_failures = max_failures
-        self.reset_timeout = reset_timeout
-        self.failure_count = 0
-        self.last_failure_time: float | None = None
-        self.state = "CLOSED"
-        self._lock = asyncio.Lock()
-
-    async def call(self, func, *args, **kwargs):
-        """
-        Execute a coroutine under circuit breaker protection.
+    Refusals (4xx) come from a healthy service and must not trip its circuit
+    breaker, so they are raised as `InventoryRejected`.
+    """
+    error = InventoryRejected if 400 <= response.status_code < 500 else Exception
+    return error(f"{message}: {response.text}")
 
-        Returns:
-            The awaited result of `func`.
-        Raises:
-            CircuitBreakerOpen: if the circuit is open and timeout has not elapsed.
-            Exception: any exception raised by the wrapped coroutine.
-        """
-        async with self._lock:
-            if self.state == "OPEN":
-                if self.last_failure_time and (time.time() - self.last_failure_time) >= self.reset_timeout:
-                    self.state = "HALF_OPEN"
-                else:
-                    raise CircuitBreakerOpen("Circuit breaker is open")
 
-        try:
-            result = await func(*args, **kwargs)
-        except Exception:
-            async with self._lock:
-                self.failure_count += 1
-                self.last_failure_time = time.time()
-                if self.failure_count >= self.max_failures:
-                    self.state = "OPEN"
-            raise
+def _endpoint_missing(response: httpx.Response) -> bool:
+    """
+    Tells an unknown route apart from a domain-level 404 (e.g. missing product).
 
-        async with self._lock:
-            self.state = "CLOSED"
-            self.failure_count = 0
-            self.last_failure_time = None
-        return result
+    FastAPI answers unknown paths with 404 {"detail": "Not Found"} and known paths
+    with the wrong method with 405.
+    """
+    if response.status_code == 405:
+        return True
+    if response.status_code != 404:
+        return False
+    try:
+        return response.json().get("detail") == "Not Found"
+    except ValueError:
+        return False
 
 
 class SagaOrchestrator:
+    # Flipped to False once the inventory service turns out to lack the batch endpoints
+    batch_supported: bool = True
+
     def __init__(self, db: AsyncSession, order: Order):
         """
         Coordinates the order creation saga across inventory and payment services.
@@ -85,63 +65,282 @@ class SagaOrchestrator:
         self.db = db
         self.order = order
         self.reserved_items = []
-        self.inventory_breaker = AsyncCircuitBreaker()
-        self.payment_breaker = AsyncCircuitBreaker()
+        # Appended to the Idempotency-Keys of a paid order's renewed reservation
+        self.key_suffix = ""
+        self.inventory_breaker = breakers.get("inventory", ignore_exceptions=(InventoryRejected,))
+        # Declines are per order (and client-triggerable with simulate_failure): never trip the breaker
+        self.payment_breaker = breakers.get("payment", ignore_exceptions=(PaymentDeclined,))
+
+    @property
+    def reservation_id(self) -> str:
+        """Id under which the inventory service holds this order's stock."""
+        return f"order-{self.order.id}"
+
+    def _headers(self, step: str) -> dict:
+        """
+        Idempotency-Key and X-Request-Deadline for an inventory call of this order.
+
+        The key is derived from the order id and the step (plus `key_suffix`
+        once a paid order reserves again), so a retried or duplicated call is
+        applied by the inventory service only once. The
+        deadline is that of the current step, so the inventory service stops
+        working on a call the saga no longer waits for.
+        """
+        return {"Idempotency-Key": f"order-{self.order.id}-{step}{self.key_suffix}", **deadline.headers()}
 
     async def execute(self, simulate_failure: bool = False):
         """
         Executes the 'Create Order' Saga.
         Steps:
-        1. Reserve Stock (Service B)
+        1. Reserve Stock (Service B), held under the order's reservation id
         2. Process Payment (Mock)
-        3. Confirm Order
+        3. Confirm the stock hold
+        4. Confirm Order
+
+        Each completed step is committed to the saga log (see `saga_log`), so
+        that `recover` can finish or compensate the saga if this process dies.
+
+        Every step runs within its own SAGA_*_TIMEOUT_SECONDS budget, capped by
+        the request deadline if there is one.
         """
         try:
             # Reserve stock
-            await self._reserve_stock()
+            try:
+                async with deadline.budget(settings.SAGA_RESERVE_TIMEOUT_SECONDS):
+                    await self._reserve_stock()
+            except deadline.DeadlineExceeded:
+                if settings.INVENTORY_HOLDS_ENABLED:
+                    # Calls cut off in flight may still have reserved: release all that is held
+                    self.reserved_items = self._merged_items()
+                else:
+                    # A release adds back the full quantity: only release what surely was reserved
+                    logger.error(f"Reserving order {self.order.id} timed out; in-flight reservations are not released")
+                raise
+            await saga_log.record(self.db, self.order.id, saga_log.RESERVED, {"items": self.reserved_items})
+            await self.db.commit()
 
             # Process payment
-            await self._process_payment(simulate_failure)
-
-            # Success - Update Order to Paid
-            self.order.status = OrderStatus.PAID
+            async with deadline.budget(settings.SAGA_PAYMENT_TIMEOUT_SECONDS):
+                await self._process_payment(simulate_failure)
+            await saga_log.record(self.db, self.order.id, saga_log.PAID)
             await self.db.commit()
-            logger.info(f"Saga Completed: Order {self.order.id} PAID")
+
+            await self._complete()
 
         except Exception as ex:
             logger.error(f"Saga failed: {ex}. Initiating Rollback")
             await self._rollback(str(ex))
             raise ex
 
+    async def recover(self, steps: dict):
+        """
+        Continues a saga that was interrupted, from its recorded steps.
+
+        A paid saga is completed (holds confirmed, order PAID). If its holds
+        expired before recovery got to them, the stock is reserved again and
+        confirmed; if that fails the order is left PENDING for the next attempt
+        (and eventually FAILED), never cancelled, since the customer has paid.
+        An unpaid saga is compensated: if the log does not say what was
+        reserved, every product of the order is released under the order's
+        reservation id, and the inventory service only returns what is still
+        held, so products the saga never got to reserve are not added back.
+        Without inventory holds (INVENTORY_HOLDS_ENABLED off) such a release
+        would add back the full quantities, so the order is then cancelled
+        without releasing stock.
+
+        Args:
+            steps: The order's saga log, as returned by `saga_log.steps`.
+        Raises:
+            Exception: if completing the paid saga failed (it is compensated
+                then, unless its stock could not be reserved again).
+        """
+        reserved = steps.get(saga_log.RESERVED, {}).get("items")
+        if reserved:
+            self.reserved_items = reserved
+        elif settings.INVENTORY_HOLDS_ENABLED:
+            self.reserved_items = self._merged_items()
+        else:
+            logger.error(f"Order {self.order.id} may hold unrecorded reservations; not releasing them without holds")
+
+        if saga_log.PAID not in steps:
+            logger.warning(f"Compensating order {self.order.id}, interrupted before payment")
+            await self._rollback("Saga interrupted before payment")
+            return
+
+        logger.warning(f"Completing order {self.order.id}, interrupted after payment")
+        try:
+            await self._complete()
+        except InventoryRejected:
+            # Not compensated: the holds expired, but the customer has paid
+            await self._reserve_again(steps.get(saga_log.RECOVERY, {}).get("attempts", 0))
+            await self._complete()
+        except Exception as ex:
+            logger.error(f"Saga recovery failed: {ex}. Initiating Rollback")
+            await self._rollback(str(ex))
+            raise ex
+
+    async def _complete(self):
+        """Makes the reservation final before the hold expires and marks the order PAID."""
+        async with deadline.budget(settings.SAGA_CONFIRM_TIMEOUT_SECONDS):
+            await self._confirm_stock()
+
+        # Success - Update Order to Paid
+        self.order.status = OrderStatus.PAID
+        await saga_log.record(self.db, self.order.id, saga_log.CONFIRMED)
+        notifications.order_finished(self.db, self.order)
+        await self.db.commit()
+        logger.info(f"Saga Completed: Order {self.order.id} PAID")
+
+    async def _reserve_again(self, attempt: int):
+        """
+        Reserves the stock of a paid order whose holds expired unconfirmed.
+
+        The calls use fresh Idempotency-Keys (per recovery attempt), since the
+        original reservation's keys would only replay it.
+
+        Args:
+            attempt: The recovery attempt, part of the new keys.
+        Raises:
+            Exception: if the stock could not be reserved (whatever was reserved
+                is released again, so the next attempt starts from scratch).
+        """
+        logger.warning(f"Stock holds of paid order {self.order.id} expired, reserving again")
+        self.key_suffix = f"-again-{attempt}"
+        self.reserved_items = []
+        try:
+            async with deadline.budget(settings.SAGA_RESERVE_TIMEOUT_SECONDS):
+                await self._reserve_stock()
+        except Exception as ex:
+            logger.error(f"Paid order {self.order.id} could not be reserved again, needs attention: {ex}")
+            if isinstance(ex, deadline.DeadlineExceeded) and settings.INVENTORY_HOLDS_ENABLED:
+                # Calls cut off in flight may still have reserved: release all that is held
+                self.reserved_items = self._merged_items()
+            try:
+                async with deadline.budget(settings.SAGA_COMPENSATE_TIMEOUT_SECONDS, detached=True):
+                    await self._release_stock()
+            except deadline.DeadlineExceeded:
+                logger.error(f"Releasing stock for order {self.order.id} timed out")
+            raise
+
     async def _reserve_stock(self):
         """
-        Calls Service B to reserve stock for each item.
-        If partially successful, we might need complex rollback,
-        but for simple Saga we treat the whole batch reservation as one unit
-        (Service B should ideally support batch or we loop).
-        We assume Service B supports single item reserve, so we loop.
-        If any fails, we catch triggers rollback for ALREADY reserved items.
-
-        Service C calls Service B for each item.
-        We track reserved items to rollback only them.
-        """
-        async with httpx.AsyncClient() as client:
-            for item in self.order.items:
-                pid = item["product_id"]
-                qty = item["quantity"]
-
-                async def reserve():
-                    response = await client.post(
-                        f"{INVENTORY_SERVICE_URL}/reserve",
-                        json={"product_id": pid, "quantity": qty},
-                    )
-                    if response.status_code != 200:
-                        raise Exception(f"Failed to reserve stock for {pid}: {response.text}")
-                    return response
+        Calls Service B to reserve stock for the whole order.
+
+        Prefers the all-or-nothing /reserve/batch endpoint: one round trip and one
+        transaction for the entire cart. If the inventory service does not expose
+        it (older deployment), falls back to one /reserve call per product, sent
+        concurrently (at most SAGA_MAX_CONCURRENCY at a time). Every call is
+        awaited even if another one fails, and only the successful ones are
+        tracked, so that rollback releases exactly those.
+
+        Raises:
+            Exception: the first failed reservation, after all calls settled.
+        """
+        client = http_clients.client(INVENTORY_SERVICE_URL)
+        if await self._reserve_stock_batch(client):
+            return
+
+        semaphore = asyncio.Semaphore(settings.SAGA_MAX_CONCURRENCY)
+        lines = self._merged_items()
+
+        async def reserve_line(pid: str, qty: int):
+            async def reserve():
+                response = await client.post(
+                    f"{INVENTORY_SERVICE_URL}/reserve",
+                    json={
+                        "product_id": pid,
+                        "quantity": qty,
+                        "reservation_id": self.reservation_id,
+                        "hold_seconds": settings.SAGA_HOLD_SECONDS,
+                    },
+                    headers=self._headers(f"reserve-{pid}"),
+                )
+                if response.status_code != 200:
+                    raise _call_failed(response, f"Failed to reserve stock for {pid}")
+                return response
 
+            async with semaphore:
                 await self.inventory_breaker.call(reserve)
-                self.reserved_items.append({"product_id": pid, "quantity": qty})
-                logger.info(f"Reserved {qty} of {pid}")
+            # Tracked right away, so a deadline cancelling the other calls cannot lose it
+            self.reserved_items.append({"product_id": pid, "quantity": qty})
+            logger.info(f"Reserved {qty} of {pid}")
+
+        results = await asyncio.gather(
+            *(reserve_line(line["product_id"], line["quantity"]) for line in lines), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    def _merged_items(self) -> list:
+        """Order items with the quantities of repeated products added up, in first-seen order."""
+        merged = {}
+        for item in self.order.items:
+            merged[item["product_id"]] = merged.get(item["product_id"], 0) + item["quantity"]
+        return [{"product_id": pid, "quantity": qty} for pid, qty in merged.items()]
+
+    async def _reserve_stock_batch(self, client: httpx.AsyncClient) -> bool:
+        """
+        Reserves all order items with a single /reserve/batch call.
+
+        Returns:
+            True if the batch was reserved, False if the endpoint is unavailable
+            and the caller should fall back to per-item reservations.
+        Raises:
+            Exception: if the inventory service rejected the batch (nothing reserved).
+        """
+        if not SagaOrchestrator.batch_supported:
+            return False
+
+        items = [{"product_id": item["product_id"], "quantity": item["quantity"]} for item in self.order.items]
+
+        async def reserve_batch():
+            response = await client.post(
+                f"{INVENTORY_SERVICE_URL}/reserve/batch",
+                json={"items": items, "reservation_id": self.reservation_id, "hold_seconds": settings.SAGA_HOLD_SECONDS},
+                headers=self._headers("reserve"),
+            )
+            if _endpoint_missing(response):
+                return False
+            if response.status_code != 200:
+                raise _call_failed(response, "Failed to reserve stock")
+            return True
+
+        if not await self.inventory_breaker.call(reserve_batch):
+            logger.warning("Inventory service has no batch reservation endpoint, using per-item calls")
+            SagaOrchestrator.batch_supported = False
+            return False
+
+        self.reserved_items.extend(items)
+        logger.info(f"Reserved {len(items)} items for order {self.order.id}")
+        return True
+
+    async def _confirm_stock(self):
+        """
+        Turns the order's stock holds into final decrements.
+
+        Until confirmed, the inventory service returns held stock on its own
+        once the hold expires, so a crash anywhere before this point cannot
+        leak stock. An inventory service without /confirm (no holds) is fine.
+
+        Raises:
+            Exception: if the holds could not be confirmed (e.g. already expired).
+        """
+        client = http_clients.client(INVENTORY_SERVICE_URL)
+
+        async def confirm():
+            response = await client.post(
+                f"{INVENTORY_SERVICE_URL}/confirm",
+                json={"reservation_id": self.reservation_id},
+                headers=self._headers("confirm"),
+            )
+            if _endpoint_missing(response):
+                return
+            if response.status_code != 200:
+                raise _call_failed(response, "Failed to confirm stock")
+
+        await self.inventory_breaker.call(confirm)
+        logger.info(f"Confirmed stock for order {self.order.id}")
 
     async def _process_payment(self, simulate_failure: bool):
         """
@@ -154,7 +353,7 @@ class SagaOrchestrator:
         async def _mock_payment():
             await asyncio.sleep(0.5)  # Simulate latency
             if simulate_failure:
-                raise Exception("Payment rejected")
+                raise PaymentDeclined("Payment rejected")
             return True
 
         await self.payment_breaker.call(_mock_payment)
@@ -169,22 +368,75 @@ class SagaOrchestrator:
         Args:
             reason: Human readable explanation of why rollback executed.
         """
-        # Release Stock
-        async with httpx.AsyncClient() as client:
-            for item in getattr(self, "reserved_items", []):
-                pid = item["product_id"]
-                qty = item["quantity"]
-                try:
-                    await client.post(
-                        f"{INVENTORY_SERVICE_URL}/release",
-                        json={"product_id": pid, "quantity": qty},
-                    )
-                    logger.info(f"Rolled back stock for {pid}")
-                except Exception as ex:
-                    logger.error(f"Failed to release stock for {pid}: {ex}")
-
-        # Cancel Order
+        # Release Stock, even if the request deadline already passed
+        try:
+            async with deadline.budget(settings.SAGA_COMPENSATE_TIMEOUT_SECONDS, detached=True):
+                await self._release_stock()
+        except deadline.DeadlineExceeded:
+            # Holds not released in time expire on their own
+            logger.error(f"Releasing stock for order {self.order.id} timed out")
+
+        await self._cancel_order(reason)
+
+    async def _release_stock(self):
+        """Releases the reserved items with one batch call, or with concurrent per-item calls."""
+        client = http_clients.client(INVENTORY_SERVICE_URL)
+        if self.reserved_items and not await self._release_stock_batch(client):
+            semaphore = asyncio.Semaphore(settings.SAGA_MAX_CONCURRENCY)
+
+            async def release_line(pid: str, qty: int):
+                async with semaphore:
+                    try:
+                        await client.post(
+                            f"{INVENTORY_SERVICE_URL}/release",
+                            json={"product_id": pid, "quantity": qty, "reservation_id": self.reservation_id},
+                            headers=self._headers(f"release-{pid}"),
+                        )
+                        logger.info(f"Rolled back stock for {pid}")
+                    except Exception as ex:
+                        logger.error(f"Failed to release stock for {pid}: {ex}")
+
+            await asyncio.gather(
+                *(release_line(item["product_id"], item["quantity"]) for item in self.reserved_items)
+            )
+
+    async def _release_stock_batch(self, client: httpx.AsyncClient) -> bool:
+        """
+        Releases all reserved items with a single /release/batch call.
+
+        Returns:
+            False if the endpoint is unavailable and the caller should release
+            item by item, True otherwise (failures are logged, not raised).
+        """
+        if not SagaOrchestrator.batch_supported:
+            return False
+        try:
+            response = await client.post(
+                f"{INVENTORY_SERVICE_URL}/release/batch",
+                json={"items": self.reserved_items, "reservation_id": self.reservation_id},
+                headers=self._headers("release"),
+            )
+            if _endpoint_missing(response):
+                SagaOrchestrator.batch_supported = False
+                return False
+            if response.status_code != 200:
+                logger.error(f"Failed to release stock for order {self.order.id}: {response.text}")
+            else:
+                logger.info(f"Rolled back stock for order {self.order.id}")
+        except Exception as ex:
+            logger.error(f"Failed to release stock for order {self.order.id}: {ex}")
+        return True
+
+    async def _cancel_order(self, reason: str):
+        """
+        Marks the order CANCELED after its reservations were compensated.
+
+        Args:
+            reason: Human readable explanation of why rollback executed.
+        """
         self.order.status = OrderStatus.CANCELED  # or Failed
         self.order.items = self.order.items
+        await saga_log.record(self.db, self.order.id, saga_log.COMPENSATED, {"reason": reason})
+        notifications.order_finished(self.db, self.order)
         await self.db.commit()
         logger.info(f"Order {self.order.id} Canceled. Reason: {reason}")
@@ -0,0 +1,43 @@
+from typing import Dict
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.order import SagaStep
+
+# Step names, in saga order
+CREATED = "created"
+RESERVED = "reserved"
+PAID = "paid"
+CONFIRMED = "confirmed"
+COMPENSATED = "compensated"
+RECOVERY = "recovery"
+
+
+async def record(db: AsyncSession, order_id: int, step: str, payload: dict | None = None):
+    """
+    Records a completed step in the caller's transaction.
+
+    Arguments:
+     db (AsyncSession): The session that also holds the step's local changes.
+     order_id (int): The order whose saga made progress.
+     step (str): One of the step names of this module.
+     payload (dict | None): What recovery needs to know about the step
+      (e.g. the reserved items).
+    """
+    stmt = insert(SagaStep).values(order_id=order_id, step=step, payload=payload or {})
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_saga_steps_order_step",
+        set_={"payload": stmt.excluded.payload, "recorded_at": func.now()},
+    )
+    await db.execute(stmt)
+
+
+async def steps(db: AsyncSession, order_id: int) -> Dict[str, dict]:
+    """
+    Returns the recorded steps of an order.
+
+    Returns:
+     Dict[str, dict]: Payload per completed step.
+    """
+    rows = await db.execute(select(SagaStep.step, SagaStep.payload).where(SagaStep.order_id == order_id))
+    return dict(rows.tuples().all())
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import List
+from sqlalchemy import exists, func, or_, select
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.order import Order, OrderJob, OrderStatus, SagaStep
+from . import notifications, saga_log
+from .saga import SagaOrchestrator
+
+logger = logging.getLogger(__name__)
+
+
+def worst_recovery_delay() -> float:
+    """
+    Longest time from reserving stock to confirming it in a recovered saga.
+
+    Returns:
+     float: Seconds; a crash right after payment is noticed after
+     SAGA_RECOVERY_AFTER_SECONDS, at the next round at the latest.
+    """
+    return (
+        settings.SAGA_RESERVE_TIMEOUT_SECONDS
+        + settings.SAGA_PAYMENT_TIMEOUT_SECONDS
+        + settings.SAGA_RECOVERY_AFTER_SECONDS
+        + settings.SAGA_RECOVERY_INTERVAL_SECONDS
+        + settings.SAGA_CONFIRM_TIMEOUT_SECONDS
+    )
+
+
+class SagaRecovery:
+    """
+    Background task finishing sagas whose process died midway.
+
+    A saga counts as interrupted when its order is still PENDING, has no
+    queued job (those are retried by the saga workers) and its log has not
+    moved for SAGA_RECOVERY_AFTER_SECONDS. Orders are logged as CREATED in
+    the transaction inserting them, so a PENDING order without any log
+    predates the saga log and counts as interrupted too. Each round claims a batch of them
+    with `FOR UPDATE SKIP LOCKED` and stamps a `recovery` step, which both
+    counts the attempt and keeps other replicas away for another period.
+    The batch is then resumed or compensated concurrently (see
+    `SagaOrchestrator.recover`); after SAGA_RECOVERY_MAX_ATTEMPTS the order is
+    marked FAILED. Runs at startup and then every SAGA_RECOVERY_INTERVAL_SECONDS.
+    Refuses to start if the saga's holds (SAGA_HOLD_SECONDS) could expire
+    before recovery reaches a paid saga (see `worst_recovery_delay`).
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.completed = 0
+        self.compensated = 0
+        self.failed = 0
+        self.abandoned = 0
+
+    async def _claim(self) -> List[int]:
+        last_step = select(func.max(SagaStep.recorded_at)).where(SagaStep.order_id == Order.id).scalar_subquery()
+        queued = exists().where(OrderJob.order_id == Order.id)
+        stmt = (
+            select(Order.id)
+            .where(
+                Order.status == OrderStatus.PENDING,
+                ~queued,
+                or_(
+                    last_step.is_(None),
+                    last_step < func.now() - timedelta(seconds=settings.SAGA_RECOVERY_AFTER_SECONDS),
+                ),
+            )
+            .order_by(Order.id)
+            .limit(settings.SAGA_RECOVERY_BATCH_SIZE)
+            .with_for_update(of=Order, skip_locked=True)
+        )
+        async with AsyncSessionLocal() as db:
+            order_ids = list((await db.execute(stmt)).scalars())
+            if not order_ids:
+                return []
+            attempts = dict((await db.execute(
+                select(SagaStep.order_id, SagaStep.payload)
+                .where(SagaStep.order_id.in_(order_ids), SagaStep.step == saga_log.RECOVERY)
+            )).tuples().all())
+            for order_id in order_ids:
+                attempt = attempts.get(order_id, {}).get("attempts", 0) + 1
+                await saga_log.record(db, order_id, saga_log.RECOVERY, {"attempts": attempt})
+            await db.commit()
+        return order_ids
+
+    async def _recover(self, order_id: int):
+        async with AsyncSessionLocal() as db:
+            order = await db.get(Order, order_id)
+            if order is None or order.status != OrderStatus.PENDING:
+                return
+            steps = await saga_log.steps(db, order_id)
+
+            if steps[saga_log.RECOVERY]["attempts"] > settings.SAGA_RECOVERY_MAX_ATTEMPTS:
+                logger.error(f"Giving up on recovering order {order_id}")
+                order.status = OrderStatus.FAILED
+                notifications.order_finished(db, order)
+                await db.commit()
+                self.abandoned += 1
+            else:
+                try:
+                    await SagaOrchestrator(db, order).recover(steps)
+                except Exception as ex:
+                    logger.error(f"Recovering order {order_id} failed: {ex}")
+                    self.failed += 1
+                await db.refresh(order)
+                if order.status == OrderStatus.PAID:
+                    self.completed += 1
+                elif order.status == OrderStatus.CANCELED:
+                    self.compensated += 1
+
+    async def recover_once(self) -> int:
+        """
+        Recovers one batch of interrupted sagas.
+
+        Returns:
+         int: Number of sagas claimed.
+        """
+        order_ids = await self._claim()
+        if order_ids:
+            logger.warning(f"Recovering {len(order_ids)} interrupted sagas")
+            results = await asyncio.gather(
+                *(self._recover(order_id) for order_id in order_ids), return_exceptions=True
+            )
+            for order_id, result in zip(order_ids, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Recovering order {order_id} failed: {result}")
+        return len(order_ids)
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.recover_once() < settings.SAGA_RECOVERY_BATCH_SIZE:
+                    await asyncio.sleep(settings.SAGA_RECOVERY_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.error(f"Saga recovery failed: {ex}")
+                await asyncio.sleep(settings.SAGA_RECOVERY_INTERVAL_SECONDS)
+
+    def stats(self) -> dict:
+        return {
+            "completed": self.completed,
+            "compensated": self.compensated,
+            "failed": self.failed,
+            "abandoned": self.abandoned,
+        }
+
+    async def start(self):
+        if settings.INVENTORY_HOLDS_ENABLED and settings.SAGA_HOLD_SECONDS <= worst_recovery_delay():
+            # Holds expiring before recovery gets to a paid saga make it reserve again
+            raise RuntimeError(
+                f"SAGA_HOLD_SECONDS={settings.SAGA_HOLD_SECONDS} must exceed the worst-case "
+                f"saga recovery delay of {worst_recovery_delay():g}s"
+            )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+recovery = SagaRecovery()
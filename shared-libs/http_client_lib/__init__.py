@@ -0,0 +1,3 @@
+from .breaker import BreakerRegistry, CircuitBreaker, CircuitBreakerOpen
+from .pool import HttpClientPool, UpstreamStats
+from .deadline import DEADLINE_HEADER, DeadlineExceeded, DeadlineMiddleware
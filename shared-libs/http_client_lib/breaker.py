@@ -0,0 +1,194 @@
+import time
+from collections import deque
+from typing import Dict, Tuple, Type
+
+
+class CircuitBreakerOpen(Exception):
+    """Raised when a circuit breaker is open and rejects calls."""
+
+
+class CircuitBreaker:
+    """
+    Asynchronous circuit breaker driven by failure and slow-call rates.
+
+    The outcomes of the last `window_size` calls are kept in a ring buffer
+    with running failure and slow-call counts. Once at least `min_calls` are
+    recorded and either rate reaches its threshold, the circuit opens and
+    rejects calls for `open_seconds`. It then turns half-open and admits up to
+    `half_open_probes` concurrent calls; when that many have finished, the
+    circuit closes if their rates are below the thresholds and opens again
+    otherwise. Outcomes of calls admitted before the last transition are
+    discarded.
+
+    All bookkeeping happens between awaits, so it is consistent without a
+    lock on the event loop, and the closed-state path costs one state check
+    and one ring-buffer append.
+
+    Arguments:
+     name (str): Upstream the breaker protects (used in errors and stats).
+     window_size (int): Number of recent calls the rates are computed over. Defaults to 20.
+     min_calls (int): Calls needed in the window before it can trip. Defaults to 10.
+     failure_rate (float): Share of failed calls that opens the circuit. Defaults to 0.5.
+     slow_call_rate (float): Share of slow calls that opens the circuit. Defaults to 1.0.
+     slow_call_seconds (float): Duration above which a call counts as slow. Defaults to 5.0.
+     open_seconds (float): How long the circuit stays open. Defaults to 30.0.
+     half_open_probes (int): Calls admitted while half-open. Defaults to 3.
+     ignore_exceptions (Tuple[Type[Exception], ...]): Exceptions that are
+      raised through but recorded as successful calls (e.g. rejections of a
+      healthy upstream). Defaults to none.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(
+            self,
+            name: str,
+            window_size: int = 20,
+            min_calls: int = 10,
+            failure_rate: float = 0.5,
+            slow_call_rate: float = 1.0,
+            slow_call_seconds: float = 5.0,
+            open_seconds: float = 30.0,
+            half_open_probes: int = 3,
+            ignore_exceptions: Tuple[Type[Exception], ...] = (),
+    ):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min(min_calls, window_size)
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.ignore_exceptions = ignore_exceptions
+
+        self.state = self.CLOSED
+        self._generation = 0
+        self._opened_at = 0.0
+        self._window: deque = deque()
+        self._failures = 0
+        self._slow = 0
+        self._probes_in_flight = 0
+
+        self.calls = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _transition(self, state: str):
+        self.state = state
+        self._generation += 1
+        self._window.clear()
+        self._failures = 0
+        self._slow = 0
+        self._probes_in_flight = 0
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def _admit(self) -> int:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                raise CircuitBreakerOpen(f"Circuit breaker for {self.name} is open")
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probes_in_flight + len(self._window) >= self.half_open_probes:
+                self.rejected += 1
+                raise CircuitBreakerOpen(f"Circuit breaker for {self.name} is half-open")
+            self._probes_in_flight += 1
+        self.calls += 1
+        return self._generation
+
+    def _tripped(self) -> bool:
+        calls = len(self._window)
+        return self._failures >= self.failure_rate * calls or self._slow >= self.slow_call_rate * calls
+
+    def _complete(self, generation: int, failed: bool | None, elapsed: float):
+        if generation != self._generation:
+            return
+        if self.state == self.HALF_OPEN:
+            self._probes_in_flight -= 1
+        slow = elapsed >= self.slow_call_seconds
+        if failed is None:
+            # Cancelled (e.g. by a deadline): only telling if it had been running slow already
+            if not slow:
+                return
+            failed = False
+        if len(self._window) == self.window_size:
+            old_failed, old_slow = self._window.popleft()
+            self._failures -= old_failed
+            self._slow -= old_slow
+        self._window.append((failed, slow))
+        self._failures += failed
+        self._slow += slow
+
+        if self.state == self.HALF_OPEN:
+            if len(self._window) >= self.half_open_probes:
+                self._transition(self.OPEN if self._tripped() else self.CLOSED)
+        elif len(self._window) >= self.min_calls and self._tripped():
+            self._transition(self.OPEN)
+
+    async def call(self, func, *args, **kwargs):
+        """
+        Execute a coroutine under circuit breaker protection.
+
+        Returns:
+         The awaited result of `func`.
+
+        Raises:
+         CircuitBreakerOpen: if the circuit is open, or half-open with all probes in use.
+         Exception: any exception raised by the wrapped coroutine.
+        """
+        generation = self._admit()
+        started = time.monotonic()
+        failed = None
+        try:
+            result = await func(*args, **kwargs)
+            failed = False
+            return result
+        except self.ignore_exceptions:
+            failed = False
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._complete(generation, failed, time.monotonic() - started)
+
+    def stats(self) -> dict:
+        calls = len(self._window)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "failure_rate": round(self._failures / calls, 4) if calls else 0.0,
+            "slow_call_rate": round(self._slow / calls, 4) if calls else 0.0,
+            "calls": self.calls,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+
+class BreakerRegistry:
+    """
+    Process-wide circuit breakers, one per upstream name.
+
+    Keyword arguments are the defaults of every breaker (see `CircuitBreaker`);
+    `get` can override them when the breaker is first created.
+    """
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str, **overrides) -> CircuitBreaker:
+        """Returns the breaker of `name`, creating it on first use."""
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, **{**self.defaults, **overrides})
+            self._breakers[name] = breaker
+        return breaker
+
+    def stats(self) -> dict:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import json
+import time
+from contextvars import ContextVar
+
+DEADLINE_HEADER = "X-Request-Deadline"
+
+# Absolute deadline (Unix time in seconds) of the work the current task belongs to
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when a step or request ran past its deadline."""
+
+
+def headers() -> dict:
+    """`X-Request-Deadline` header carrying the current deadline to the next service."""
+    deadline = _deadline.get()
+    return {} if deadline is None else {DEADLINE_HEADER: f"{deadline:.3f}"}
+
+
+def parse(value: str | None) -> float | None:
+    """Reads an `X-Request-Deadline` header value; malformed values are ignored."""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+@contextlib.asynccontextmanager
+async def budget(seconds: float | None, detached: bool = False):
+    """
+    Runs a block within `seconds`, and within the enclosing deadline.
+
+    The tighter of both becomes the current deadline inside the block (so
+    outbound calls propagate it) and the block is cancelled when it passes.
+    A `detached` budget ignores the enclosing deadline, for work that must
+    run even after the request gave up (e.g. compensations).
+
+    Raises:
+     DeadlineExceeded: If the block did not finish in time.
+    """
+    deadline = None if detached else _deadline.get()
+    if seconds is not None:
+        own = time.time() + seconds
+        deadline = own if deadline is None else min(deadline, own)
+
+    token = _deadline.set(deadline)
+    try:
+        if deadline is None:
+            yield
+            return
+        if deadline <= time.time():
+            raise DeadlineExceeded("Deadline already passed")
+        timeout = asyncio.timeout(deadline - time.time())
+        try:
+            async with timeout:
+                yield
+        except TimeoutError as ex:
+            if not timeout.expired() or isinstance(ex, DeadlineExceeded):
+                raise
+            raise DeadlineExceeded("Deadline exceeded") from ex
+    finally:
+        _deadline.reset(token)
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware honoring `X-Request-Deadline` on incoming HTTP requests.
+
+    A request whose deadline already passed is answered with 504 without
+    running. Otherwise the deadline becomes current for the handler (so
+    outbound calls forward it with `headers()` and `budget`s stay within it)
+    and the handler is cancelled `grace` seconds after it passes, answering
+    504 as well unless the response had already started.
+
+    Arguments:
+     app: The wrapped ASGI application.
+     default_timeout (float | None): Budget in seconds for requests at the edge;
+      a deadline sent by the client can only shorten it. None = only honor
+      incoming deadlines.
+     grace (float): Extra seconds before the handler is cancelled, leaving
+      handlers whose own budgets ran out at the deadline time to clean up
+      (e.g. compensate a saga). Defaults to 0.
+    """
+
+    def __init__(self, app, default_timeout: float | None = None, grace: float = 0.0):
+        self.app = app
+        self.default_timeout = default_timeout
+        self.grace = grace
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = DEADLINE_HEADER.lower().encode()
+        deadline = parse(next((v.decode() for k, v in scope["headers"] if k == header), None))
+        if self.default_timeout is not None:
+            own = time.time() + self.default_timeout
+            deadline = own if deadline is None else min(deadline, own)
+        if deadline is None:
+            await self.app(scope, receive, send)
+            return
+        if deadline <= time.time():
+            await self._exceeded(send)
+            return
+
+        started = False
+
+        async def send_tracked(message):
+            nonlocal started
+            started = True
+            await send(message)
+
+        token = _deadline.set(deadline)
+        timeout = asyncio.timeout(deadline + self.grace - time.time())
+        try:
+            async with timeout:
+                await self.app(scope, receive, send_tracked)
+        except TimeoutError as ex:
+            if started or not (timeout.expired() or isinstance(ex, DeadlineExceeded)):
+                raise
+            await self._exceeded(send)
+        finally:
+            _deadline.reset(token)
+
+    @staticmethod
+    async def _exceeded(send):
+        body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
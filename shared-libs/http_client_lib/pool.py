@@ -0,0 +1,174 @@
+import importlib.util
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UpstreamStats:
+    """Request and connection counters of one upstream (scheme://host:port)."""
+
+    requests: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    # Requests sent while every connection of the pool was busy (they had to wait)
+    saturated: int = 0
+    connections_opened: int = 0
+    errors: int = 0
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps a transport to count requests, busy connections and new connections.
+
+    New connections are detected through httpcore's `trace` request extension
+    (`connection.connect_tcp.complete`), so every request that did not open one
+    reused a kept-alive connection.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: UpstreamStats, max_connections: int):
+        self._transport = transport
+        self._stats = stats
+        self._max_connections = max_connections
+
+    async def _trace(self, event: str, info: dict):
+        if event == "connection.connect_tcp.complete":
+            self._stats.connections_opened += 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self._stats
+        stats.requests += 1
+        if stats.in_flight >= self._max_connections:
+            stats.saturated += 1
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        request.extensions.setdefault("trace", self._trace)
+        try:
+            return await self._transport.handle_async_request(request)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+    def connections(self) -> tuple[int, int]:
+        """Open and idle connections of the underlying pool (0, 0 if not pooled)."""
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        return len(connections), sum(1 for connection in connections if connection.is_idle())
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class HttpClientPool:
+    """
+    Process-wide factory of long-lived `httpx.AsyncClient`s, one per upstream.
+
+    Clients are created on first use for each origin (scheme, host and port)
+    and kept open until `aclose`, so calls to the same service share one
+    connection pool and reuse kept-alive connections instead of paying TCP
+    (and TLS) setup per request. Register `aclose` in the service's lifespan
+    shutdown. Callers must not close the returned clients themselves.
+
+    Arguments:
+     max_connections (int): Connection limit per upstream. Defaults to 100.
+     max_keepalive_connections (int): Idle connections kept per upstream. Defaults to 20.
+     keepalive_expiry (float): Seconds an idle connection is kept. Defaults to 30.0.
+     timeout (float): Default connect/read/write/pool timeout in seconds. Defaults to 10.0.
+     http2 (bool): Negotiate HTTP/2 where the upstream supports it; needs the
+      `h2` package (`httpx[http2]`), otherwise HTTP/1.1 is used. Defaults to False.
+     transport_factory (Callable | None): Builds the transport of each client
+      from its `httpx.Limits` (for tests); a pooled `httpx.AsyncHTTPTransport` if None.
+    """
+
+    def __init__(
+            self,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+            keepalive_expiry: float = 30.0,
+            timeout: float = 10.0,
+            http2: bool = False,
+            transport_factory: Callable[[httpx.Limits], httpx.AsyncBaseTransport] | None = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout)
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._transport_factory = transport_factory or self._pooled_transport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, _InstrumentedTransport] = {}
+        self._stats: Dict[str, UpstreamStats] = {}
+
+    def _pooled_transport(self, limits: httpx.Limits) -> httpx.AsyncBaseTransport:
+        return httpx.AsyncHTTPTransport(limits=limits, http2=self.http2)
+
+    @staticmethod
+    def origin(url: str) -> str:
+        """Normalized scheme://host:port of a URL, the key of its client."""
+        parsed = httpx.URL(url)
+        port = parsed.port or {"http": 80, "https": 443}.get(parsed.scheme)
+        return f"{parsed.scheme}://{parsed.host}:{port}"
+
+    def client(self, url: str) -> httpx.AsyncClient:
+        """
+        Returns the shared client for the upstream serving `url`.
+
+        Arguments:
+         url (str): Any URL of the upstream (usually the service's base URL).
+
+        Returns:
+         httpx.AsyncClient: A long-lived client; pass absolute URLs to it.
+        """
+        key = self.origin(url)
+        client = self._clients.get(key)
+        if client is None:
+            stats = self._stats.setdefault(key, UpstreamStats())
+            transport = _InstrumentedTransport(
+                self._transport_factory(self.limits), stats, self.limits.max_connections
+            )
+            client = httpx.AsyncClient(transport=transport, timeout=self.timeout)
+            self._clients[key] = client
+            self._transports[key] = transport
+        return client
+
+    def stats(self) -> dict:
+        """Per-upstream request, saturation and connection reuse counters."""
+        report = {}
+        for key, stats in self._stats.items():
+            transport = self._transports.get(key)
+            open_connections, idle_connections = transport.connections() if transport else (0, 0)
+            report[key] = {
+                "requests": stats.requests,
+                "in_flight": stats.in_flight,
+                "peak_in_flight": stats.peak_in_flight,
+                "max_connections": self.limits.max_connections,
+                "saturated": stats.saturated,
+                "errors": stats.errors,
+                "connections_opened": stats.connections_opened,
+                "connection_reuse_ratio": (
+                    round(1 - stats.connections_opened / stats.requests, 4) if stats.requests else 0.0
+                ),
+                "open_connections": open_connections,
+                "idle_connections": idle_connections,
+            }
+        return report
+
+    async def aclose(self):
+        """Closes every client and its connections; later `client` calls open new ones."""
+        clients, self._clients = self._clients, {}
+        self._transports = {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception as ex:
+                logger.error(f"Failed to close HTTP client: {ex}")
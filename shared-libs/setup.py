@@ -6,6 +6,7 @@ setup(
     packages=find_packages(),
     install_requires=[
         "python-jose[cryptography]",
-        "pydantic"
+        "pydantic",
+        "httpx",
     ],
 )
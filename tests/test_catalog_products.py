@@ -55,3 +55,24 @@ async def test_get_product_missing(monkeypatch):
     with pytest.raises(HTTPException) as exc:
         await products.get_product("p2")
     assert exc.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_lookup_prices_uses_one_mget(monkeypatch):
+    """Prices of a whole cart come from one mget; unknown ids are reported as missing."""
+    calls = []
+
+    class DummyMgetES:
+        async def mget(self, doc_ids):
+            calls.append(doc_ids)
+            return {"docs": [
+                {"_id": "p1", "found": True, "_source": {"title": "Shoes", "price": 10.5}},
+                {"_id": "p2", "found": False},
+            ]}
+
+    monkeypatch.setattr(products, "es_client", DummyMgetES())
+
+    response = await products.lookup_prices(products.PriceLookup(product_ids=["p1", "p2", "p1"]))
+    assert calls == [["p1", "p2"]]
+    assert response.prices == {"p1": 10.5}
+    assert response.missing == ["p2"]
@@ -0,0 +1,83 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared-libs"))
+
+from http_client_lib import BreakerRegistry, CircuitBreaker, CircuitBreakerOpen  # noqa: E402
+
+
+async def _ok():
+    return "ok"
+
+
+async def _fail():
+    raise RuntimeError("upstream down")
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_on_failure_rate_and_rejects():
+    """The circuit opens once the window's failure rate reaches the threshold."""
+    breaker = CircuitBreaker("inventory", window_size=4, min_calls=4, failure_rate=0.5)
+
+    await breaker.call(_ok)
+    await breaker.call(_ok)
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    with pytest.raises(RuntimeError):
+        await breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitBreakerOpen):
+        await breaker.call(_ok)
+    assert breaker.stats()["rejected"] == 1
+    assert breaker.stats()["times_opened"] == 1
+
+
+@pytest.mark.asyncio
+async def test_half_open_admits_limited_probes_then_closes():
+    """After the open period only `half_open_probes` calls pass; their success closes the circuit."""
+    breaker = CircuitBreaker("inventory", window_size=2, min_calls=2, open_seconds=0.01, half_open_probes=2)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.OPEN
+    await asyncio.sleep(0.02)
+
+    release = asyncio.Event()
+
+    async def slow_probe():
+        await release.wait()
+        return "ok"
+
+    probes = [asyncio.create_task(breaker.call(slow_probe)) for _ in range(2)]
+    await asyncio.sleep(0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitBreakerOpen):
+        await breaker.call(_ok)
+
+    release.set()
+    assert await asyncio.gather(*probes) == ["ok", "ok"]
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_ignored_exceptions_count_as_success_and_registry_shares_breakers():
+    """Rejections of a healthy upstream don't trip it; one breaker exists per name."""
+    registry = BreakerRegistry(window_size=2, min_calls=2)
+    breaker = registry.get("inventory", ignore_exceptions=(ValueError,))
+    assert registry.get("inventory") is breaker
+
+    async def rejected():
+        raise ValueError("insufficient stock")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            await breaker.call(rejected)
+    assert registry.stats()["inventory"]["state"] == CircuitBreaker.CLOSED
+    assert registry.stats()["inventory"]["failure_rate"] == 0.0
+
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared-libs"))
+
+from http_client_lib import HttpClientPool  # noqa: E402
+
+
+def _pool(**kwargs):
+    def transport_factory(limits):
+        return httpx.MockTransport(lambda request: httpx.Response(200, json={"path": request.url.path}))
+
+    return HttpClientPool(transport_factory=transport_factory, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_pool_shares_one_client_per_upstream():
+    """URLs of the same origin share a client; other upstreams get their own."""
+    pool = _pool()
+
+    inventory = pool.client("http://inventory:8000/inventory")
+    assert pool.client("http://inventory:8000/other") is inventory
+    assert pool.client("http://payment") is not inventory
+    assert HttpClientPool.origin("https://payment/mock") == "https://payment:443"
+
+    await pool.aclose()
+    assert inventory.is_closed
+
+
+@pytest.mark.asyncio
+async def test_pool_counts_requests_per_upstream():
+    """Requests are counted per origin and none stays in flight afterwards."""
+    pool = _pool(max_connections=5)
+
+    client = pool.client("http://inventory:8000")
+    for _ in range(3):
+        response = await client.post("http://inventory:8000/inventory/reserve", json={})
+        assert response.status_code == 200
+
+    stats = pool.stats()["http://inventory:8000"]
+    assert stats["requests"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["peak_in_flight"] == 1
+    assert stats["saturated"] == 0
+    assert stats["max_connections"] == 5
+    await pool.aclose()
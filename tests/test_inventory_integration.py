@@ -1,3 +1,4 @@
+import json
 import uuid
 
 import pytest
@@ -19,7 +20,7 @@ async def test_inventory_reserve_and_release(service_urls, http_client, redis_cl
     # Seed inventory item
     resp = await http_client.post(
         f"{service_urls.inventory}/inventory/",
-        json={"product_id": product_id, "stock": 3},
+        json={"product_id": product_id, "stock": 1},
     )
     resp.raise_for_status()
 
@@ -33,9 +34,15 @@ async def test_inventory_reserve_and_release(service_urls, http_client, redis_cl
     resp.raise_for_status()
     assert resp.json()["status"] == "reserved"
 
-    # Expect inventory update event (available should be True with remaining stock)
+    # Reserving the last unit flips availability, which is published
+    # (the seeding event may still arrive first)
     message = await wait_for_pubsub_message(pubsub, timeout=5)
     assert message["channel"] == "inventory_updates"
+    if json.loads(message["data"])["available"]:
+        message = await wait_for_pubsub_message(pubsub, timeout=5)
+    assert json.loads(message["data"]) == {
+        "product_id": product_id, "available": False, "low_stock": False, "stock": 0
+    }
 
     # Release stock
     resp = await http_client.post(
@@ -13,9 +13,19 @@ async def seed_inventory(service_urls, http_client, product_id: str):
     resp.raise_for_status()
 
 
+async def seed_catalog(service_urls, http_client, product_id: str, price: float):
+    # Orders are priced from the catalog, so the product must be indexed there too
+    await http_client.put(
+        f"{service_urls.elasticsearch}/products/_doc/{product_id}",
+        json={"title": f"Order Product {product_id}", "price": price, "available": True},
+    )
+    await http_client.post(f"{service_urls.elasticsearch}/products/_refresh")
+
+
 async def test_order_saga_success_and_failure(service_urls, http_client, tokens):
     product_id = f"ord-{uuid.uuid4().hex[:8]}"
     await seed_inventory(service_urls, http_client, product_id)
+    await seed_catalog(service_urls, http_client, product_id, 19.99)
 
     payload = {
         "items": [{"product_id": product_id, "quantity": 1}],
@@ -31,6 +41,8 @@ async def test_order_saga_success_and_failure(service_urls, http_client, tokens)
     resp.raise_for_status()
     order = resp.json()
     assert order["status"] == "PAID"
+    assert order["total_amount"] == 19.99
+    assert order["items"][0]["unit_price"] == 19.99
 
     # Failure path should cancel order
     payload["simulate_failure"] = True
@@ -46,6 +58,17 @@ async def test_order_saga_success_and_failure(service_urls, http_client, tokens)
     assert failed_order["status"] in ("CANCELED", "FAILED")
 
 
+async def test_order_with_unknown_product_is_rejected(service_urls, http_client, tokens):
+    resp = await http_client.post(
+        f"{service_urls.orders}/orders/",
+        json={"items": [{"product_id": f"missing-{uuid.uuid4().hex[:8]}", "quantity": 1}]},
+        headers={"Authorization": f"Bearer {tokens['user']}"},
+    )
+    if resp.status_code == 401:
+        pytest.skip("Orders service rejected provided user token (401).")
+    assert resp.status_code == 422
+
+
 async def test_order_admin_listing_and_update(service_urls, http_client, tokens):
     # List orders as admin
     resp = await http_client.get(
@@ -68,3 +91,35 @@ async def test_order_admin_listing_and_update(service_urls, http_client, tokens)
     resp.raise_for_status()
     updated = resp.json()
     assert updated["status"] == "SHIPPED"
+
+
+async def test_order_admin_product_lookup_and_sales(service_urls, http_client, tokens):
+    product_id = f"ord-{uuid.uuid4().hex[:8]}"
+    await seed_inventory(service_urls, http_client, product_id)
+    await seed_catalog(service_urls, http_client, product_id, 5.0)
+
+    resp = await http_client.post(
+        f"{service_urls.orders}/orders/",
+        json={"items": [{"product_id": product_id, "quantity": 2}]},
+        headers={"Authorization": f"Bearer {tokens['user']}"},
+    )
+    if resp.status_code == 401:
+        pytest.skip("Orders service rejected provided user token (401).")
+    resp.raise_for_status()
+    order_id = resp.json()["id"]
+
+    resp = await http_client.get(
+        f"{service_urls.orders}/orders/admin/products/{product_id}/orders",
+        headers={"Authorization": f"Bearer {tokens['admin']}"},
+    )
+    if resp.status_code == 401:
+        pytest.skip("Orders service rejected admin token (401).")
+    resp.raise_for_status()
+    assert [order["id"] for order in resp.json()] == [order_id]
+
+    resp = await http_client.get(
+        f"{service_urls.orders}/orders/admin/products/{product_id}/sales",
+        headers={"Authorization": f"Bearer {tokens['admin']}"},
+    )
+    resp.raise_for_status()
+    assert resp.json() == {"product_id": product_id, "orders": 1, "units": 2, "revenue": 10.0}
@@ -0,0 +1,71 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared-libs"))
+
+from http_client_lib import deadline  # noqa: E402
+
+
+@pytest.mark.asyncio
+async def test_budget_is_capped_by_the_enclosing_deadline():
+    """A step budget never outlives the request deadline, and is propagated as a header."""
+    assert deadline.headers() == {}
+    async with deadline.budget(1.0):
+        outer = float(deadline.headers()[deadline.DEADLINE_HEADER])
+        async with deadline.budget(60.0):
+            assert float(deadline.headers()[deadline.DEADLINE_HEADER]) == outer
+        async with deadline.budget(60.0, detached=True):
+            assert float(deadline.headers()[deadline.DEADLINE_HEADER]) > outer
+    assert deadline.headers() == {}
+
+
+@pytest.mark.asyncio
+async def test_budget_cancels_overrunning_step():
+    """Work running past its budget is cancelled with DeadlineExceeded."""
+    started = time.monotonic()
+    with pytest.raises(deadline.DeadlineExceeded):
+        async with deadline.budget(0.05):
+            await asyncio.sleep(5)
+    assert time.monotonic() - started < 1
+
+
+async def _call(middleware, headers):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]}
+    await middleware(scope, receive, send)
+    return sent[0]["status"]
+
+
+@pytest.mark.asyncio
+async def test_middleware_rejects_expired_and_cuts_off_slow_requests():
+    """Expired deadlines are answered with 504 right away; handlers are stopped when it passes."""
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(deadline.headers())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = deadline.DeadlineMiddleware(app)
+    assert await _call(middleware, {deadline.DEADLINE_HEADER: f"{time.time() - 1:.3f}"}) == 504
+    assert calls == []
+
+    assert await _call(middleware, {deadline.DEADLINE_HEADER: f"{time.time() + 5:.3f}"}) == 200
+    assert deadline.DEADLINE_HEADER in calls[0]
+
+    async def slow_app(scope, receive, send):
+        await asyncio.sleep(5)
+
+    middleware = deadline.DeadlineMiddleware(slow_app, default_timeout=0.05)
+    assert await _call(middleware, {}) == 504
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 from types import SimpleNamespace
@@ -22,6 +23,7 @@ os.environ.setdefault("SECRET_KEY", "secret")
 
 # Ensure service path is importable (add package root containing src/)
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "microservices/order"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "shared-libs"))
 _clear_src_modules()
 
 from src.services.saga import SagaOrchestrator, OrderStatus  # noqa: E402
@@ -32,20 +34,19 @@ class DummyResponse:
         self.status_code = status_code
         self.text = text
 
+    def json(self):
+        return {"detail": self.text}
+
 
 class DummyAsyncClient:
     def __init__(self, responses=None):
         self.responses = responses or []
         self.calls = []
+        self.headers = []
 
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        return False
-
-    async def post(self, url, json):
+    async def post(self, url, json, headers=None):
         self.calls.append((url, json))
+        self.headers.append(headers or {})
         if self.responses:
             return self.responses.pop(0)
         return DummyResponse()
@@ -54,6 +55,16 @@ class DummyAsyncClient:
 class DummySession:
     def __init__(self):
         self.commits = 0
+        self.steps = []
+        self.events = []
+
+    async def execute(self, stmt):
+        # Only saga log inserts go through execute
+        self.steps.append(stmt.compile().params["step"])
+
+    def add_all(self, rows):
+        # Only outbox events are added
+        self.events.extend(row.payload["type"] for row in rows)
 
     async def commit(self):
         self.commits += 1
@@ -62,37 +73,291 @@ class DummySession:
 @pytest.mark.asyncio
 async def test_saga_success(monkeypatch):
     """Payment step runs and order is marked paid on success."""
-    order = SimpleNamespace(id=1, items=[{"product_id": "p1", "quantity": 1}], status=None)
+    order = SimpleNamespace(id=1, user_id="u1", total_amount=10.0, items=[{"product_id": "p1", "quantity": 1}], status=None)
     session = DummySession()
 
     client = DummyAsyncClient()
     from src.services import saga
-    monkeypatch.setattr(saga.httpx, "AsyncClient", lambda: client)
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
 
     orchestrator = SagaOrchestrator(session, order)
     await orchestrator.execute()
 
     assert order.status == OrderStatus.PAID
-    assert session.commits == 1
+    # Reservation, payment and completion are committed as they happen
+    assert session.commits == 3
+    assert session.steps == ["reserved", "paid", "confirmed"]
     assert orchestrator.reserved_items == [{"product_id": "p1", "quantity": 1}]
+    # The outcome is recorded in the outbox with the final commit
+    assert session.events == ["order_update", "new_order"]
 
 
 @pytest.mark.asyncio
 async def test_saga_payment_failure_triggers_rollback(monkeypatch):
     """Simulated payment failure rolls back stock and cancels order."""
-    order = SimpleNamespace(id=2, items=[{"product_id": "p2", "quantity": 3}], status=None)
+    order = SimpleNamespace(id=2, user_id="u1", total_amount=10.0, items=[{"product_id": "p2", "quantity": 3}], status=None)
     session = DummySession()
 
     client = DummyAsyncClient()
     from src.services import saga
-    monkeypatch.setattr(saga.httpx, "AsyncClient", lambda: client)
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
 
     orchestrator = SagaOrchestrator(session, order)
     with pytest.raises(Exception):
         await orchestrator.execute(simulate_failure=True)
 
     assert order.status == OrderStatus.CANCELED
-    # One commit during rollback
-    assert session.commits == 1
+    # The reservation, then one commit during rollback
+    assert session.commits == 2
+    assert session.steps == ["reserved", "compensated"]
+    assert session.events == ["order_update"]
     # Two HTTP calls: reserve + release
     assert len(client.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_payment_declines_do_not_open_the_payment_breaker(monkeypatch):
+    """Declines are per order (and client-triggered), so they never open the shared circuit."""
+    from http_client_lib import BreakerRegistry
+    from src.services import saga
+
+    async def no_latency(seconds):
+        return None
+
+    monkeypatch.setattr(saga, "breakers", BreakerRegistry(window_size=20, min_calls=10, failure_rate=0.5))
+    monkeypatch.setattr(saga.asyncio, "sleep", no_latency)
+    order = SimpleNamespace(id=9, user_id="u1", total_amount=10.0, items=[], status=None)
+    orchestrator = SagaOrchestrator(DummySession(), order)
+
+    for _ in range(15):
+        with pytest.raises(saga.PaymentDeclined):
+            await orchestrator._process_payment(simulate_failure=True)
+
+    await orchestrator._process_payment(simulate_failure=False)
+    assert saga.breakers.get("payment").state == "CLOSED"
+
+
+@pytest.mark.asyncio
+async def test_saga_reserves_cart_with_single_batch_call(monkeypatch):
+    """All items of the order are reserved through one /reserve/batch request."""
+    items = [{"product_id": f"p{i}", "quantity": i} for i in range(1, 6)]
+    order = SimpleNamespace(id=3, user_id="u1", total_amount=10.0, items=items, status=None)
+    session = DummySession()
+
+    client = DummyAsyncClient()
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(SagaOrchestrator, "batch_supported", True)
+
+    orchestrator = SagaOrchestrator(session, order)
+    await orchestrator.execute()
+
+    # One batch reservation, then the hold is confirmed
+    assert len(client.calls) == 2
+    url, payload = client.calls[0]
+    assert url.endswith("/reserve/batch")
+    assert payload == {"items": items, "reservation_id": "order-3", "hold_seconds": 900}
+    assert client.headers[0]["Idempotency-Key"] == "order-3-reserve"
+    # The reservation step's deadline travels with the call
+    assert "X-Request-Deadline" in client.headers[0]
+    url, payload = client.calls[1]
+    assert url.endswith("/confirm")
+    assert payload == {"reservation_id": "order-3"}
+    assert orchestrator.reserved_items == items
+
+
+@pytest.mark.asyncio
+async def test_saga_falls_back_to_per_item_reserve(monkeypatch):
+    """An inventory service without the batch endpoint is called once per item."""
+    items = [{"product_id": "p1", "quantity": 1}, {"product_id": "p2", "quantity": 2}]
+    order = SimpleNamespace(id=4, user_id="u1", total_amount=10.0, items=items, status=None)
+    session = DummySession()
+
+    client = DummyAsyncClient(responses=[DummyResponse(404, "Not Found")])
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(SagaOrchestrator, "batch_supported", True)
+
+    orchestrator = SagaOrchestrator(session, order)
+    await orchestrator.execute()
+
+    assert [url.rsplit("/", 1)[-1] for url, _ in client.calls] == ["batch", "reserve", "reserve", "confirm"]
+    assert SagaOrchestrator.batch_supported is False
+    assert orchestrator.reserved_items == items
+
+
+@pytest.mark.asyncio
+async def test_saga_releases_only_items_reserved_before_a_failure(monkeypatch):
+    """Concurrent per-item reservations all settle; rollback releases the successful ones."""
+    items = [{"product_id": f"p{i}", "quantity": 1} for i in range(1, 4)]
+    order = SimpleNamespace(id=5, user_id="u1", total_amount=10.0, items=items, status=None)
+    session = DummySession()
+
+    client = DummyAsyncClient(responses=[DummyResponse(), DummyResponse(409, "Insufficient stock")])
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(SagaOrchestrator, "batch_supported", False)
+
+    orchestrator = SagaOrchestrator(session, order)
+    with pytest.raises(Exception):
+        await orchestrator.execute()
+
+    assert order.status == OrderStatus.CANCELED
+    assert orchestrator.reserved_items == [items[0], items[2]]
+    released = [payload["product_id"] for url, payload in client.calls if url.endswith("/release")]
+    assert released == ["p1", "p3"]
+
+
+class HangingReserveClient(DummyAsyncClient):
+    """Reserves every product but `hanging` at once; that one never answers."""
+
+    def __init__(self, hanging):
+        super().__init__()
+        self.hanging = hanging
+
+    async def post(self, url, json, headers=None):
+        if url.endswith("/reserve") and json["product_id"] == self.hanging:
+            await asyncio.Event().wait()
+        return await super().post(url, json, headers)
+
+
+@pytest.mark.parametrize("holds, released", [(True, ["p1", "p2"]), (False, ["p1"])])
+@pytest.mark.asyncio
+async def test_reserve_timeout_releases_unconfirmed_items_only_with_holds(monkeypatch, holds, released):
+    """A reserve cut off by its deadline releases the whole cart only if the inventory keeps holds."""
+    items = [{"product_id": "p1", "quantity": 1}, {"product_id": "p2", "quantity": 1}]
+    order = SimpleNamespace(id=10, user_id="u1", total_amount=10.0, items=items, status=None)
+    session = DummySession()
+
+    # p1 is reserved, p2 is still in flight when the deadline passes
+    client = HangingReserveClient("p2")
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(SagaOrchestrator, "batch_supported", False)
+    monkeypatch.setattr(saga.settings, "INVENTORY_HOLDS_ENABLED", holds)
+    monkeypatch.setattr(saga.settings, "SAGA_RESERVE_TIMEOUT_SECONDS", 0.05)
+
+    orchestrator = SagaOrchestrator(session, order)
+    with pytest.raises(saga.deadline.DeadlineExceeded):
+        await orchestrator.execute()
+
+    assert order.status == OrderStatus.CANCELED
+    assert [payload["product_id"] for url, payload in client.calls if url.endswith("/release")] == released
+
+
+@pytest.mark.asyncio
+async def test_recover_compensates_saga_interrupted_before_payment(monkeypatch):
+    """Without a recorded payment the order's holds are released and the order cancelled."""
+    items = [{"product_id": "p1", "quantity": 2}]
+    order = SimpleNamespace(id=6, user_id="u1", total_amount=10.0, items=items, status=OrderStatus.PENDING)
+    session = DummySession()
+
+    client = DummyAsyncClient()
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(SagaOrchestrator, "batch_supported", True)
+
+    orchestrator = SagaOrchestrator(session, order)
+    await orchestrator.recover({"created": {}, "recovery": {"attempts": 1}})
+
+    assert order.status == OrderStatus.CANCELED
+    url, payload = client.calls[0]
+    assert url.endswith("/release/batch")
+    assert payload == {"items": items, "reservation_id": "order-6"}
+    assert session.steps == ["compensated"]
+
+
+@pytest.mark.asyncio
+async def test_recover_without_holds_does_not_release_unrecorded_reservations(monkeypatch):
+    """Without holds a release adds back the full quantity, so an unknown reservation is left alone."""
+    items = [{"product_id": "p1", "quantity": 2}]
+    order = SimpleNamespace(id=8, user_id="u1", total_amount=10.0, items=items, status=OrderStatus.PENDING)
+    session = DummySession()
+
+    client = DummyAsyncClient()
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(saga.settings, "INVENTORY_HOLDS_ENABLED", False)
+
+    await SagaOrchestrator(session, order).recover({"created": {}, "recovery": {"attempts": 1}})
+
+    assert order.status == OrderStatus.CANCELED
+    assert client.calls == []
+    assert session.steps == ["compensated"]
+
+
+@pytest.mark.asyncio
+async def test_recover_completes_paid_saga(monkeypatch):
+    """A saga that crashed after payment only confirms its holds and is marked paid."""
+    items = [{"product_id": "p1", "quantity": 2}]
+    order = SimpleNamespace(id=7, user_id="u1", total_amount=10.0, items=items, status=OrderStatus.PENDING)
+    session = DummySession()
+
+    client = DummyAsyncClient()
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+
+    orchestrator = SagaOrchestrator(session, order)
+    await orchestrator.recover({"created": {}, "reserved": {"items": items}, "paid": {}})
+
+    assert order.status == OrderStatus.PAID
+    assert [url.rsplit("/", 1)[-1] for url, _ in client.calls] == ["confirm"]
+    assert session.steps == ["confirmed"]
+
+
+@pytest.mark.asyncio
+async def test_recover_reserves_again_for_paid_saga_whose_holds_expired(monkeypatch):
+    """A paid order is never compensated: expired holds are reserved again, under fresh keys, and confirmed."""
+    items = [{"product_id": "p1", "quantity": 2}]
+    order = SimpleNamespace(id=11, user_id="u1", total_amount=10.0, items=items, status=OrderStatus.PENDING)
+    session = DummySession()
+
+    client = DummyAsyncClient(responses=[DummyResponse(404, "Reservation not found or expired")])
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(SagaOrchestrator, "batch_supported", True)
+
+    steps = {"created": {}, "reserved": {"items": items}, "paid": {}, "recovery": {"attempts": 2}}
+    await SagaOrchestrator(session, order).recover(steps)
+
+    assert order.status == OrderStatus.PAID
+    assert [url.rsplit("/", 1)[-1] for url, _ in client.calls] == ["confirm", "batch", "confirm"]
+    assert [headers["Idempotency-Key"] for headers in client.headers] == [
+        "order-11-confirm", "order-11-reserve-again-2", "order-11-confirm-again-2",
+    ]
+    assert session.steps == ["confirmed"]
+
+
+@pytest.mark.asyncio
+async def test_recover_leaves_paid_saga_pending_when_stock_is_gone(monkeypatch):
+    """If the stock cannot be reserved again the order stays PENDING for the next attempt."""
+    items = [{"product_id": "p1", "quantity": 2}]
+    order = SimpleNamespace(id=12, user_id="u1", total_amount=10.0, items=items, status=OrderStatus.PENDING)
+    session = DummySession()
+
+    client = DummyAsyncClient(responses=[
+        DummyResponse(404, "Reservation not found or expired"), DummyResponse(409, "Insufficient stock"),
+    ])
+    from src.services import saga
+    monkeypatch.setattr(saga.http_clients, "client", lambda url: client)
+    monkeypatch.setattr(SagaOrchestrator, "batch_supported", True)
+
+    steps = {"created": {}, "reserved": {"items": items}, "paid": {}, "recovery": {"attempts": 1}}
+    with pytest.raises(saga.InventoryRejected):
+        await SagaOrchestrator(session, order).recover(steps)
+
+    assert order.status == OrderStatus.PENDING
+    assert [url.rsplit("/", 1)[-1] for url, _ in client.calls] == ["confirm", "batch"]
+    assert session.steps == []
+
+
+@pytest.mark.asyncio
+async def test_recovery_refuses_holds_shorter_than_the_recovery_delay(monkeypatch):
+    """Holds must outlive the time recovery may take to reach a paid saga."""
+    from src.services import saga_recovery
+    monkeypatch.setattr(saga_recovery.settings, "INVENTORY_HOLDS_ENABLED", True)
+    monkeypatch.setattr(saga_recovery.settings, "SAGA_HOLD_SECONDS", 300)
+
+    assert saga_recovery.worst_recovery_delay() == 340
+    with pytest.raises(RuntimeError, match="SAGA_HOLD_SECONDS"):
+        await saga_recovery.SagaRecovery().start()